@@ -16,6 +16,11 @@
 
 __version__ = "0.0.3"  # noqa: F401
 
-from .executor import Executor  # noqa: F401
+from .executor import (  # noqa: F401
+    Executor,
+    ShardedSyncError,
+    StreamedProcess,
+    TargetStat,
+)
 from .image import Image  # noqa: F401
 from .provider import Provider  # noqa: F401
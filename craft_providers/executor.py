@@ -13,30 +13,309 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """Executor module."""
+import concurrent.futures
 import logging
 import pathlib
+import queue
+import shlex
 import shutil
+import stat
 import subprocess
+import tarfile
+import threading
+import uuid
 from abc import ABC, abstractmethod
-from typing import List
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
+from .util import compression as sync_compression
+from .util import manifest as sync_manifest
 from .util import path
+from .util import shards as sync_shards
+from .util import tar_stream as sync_tar
+from .util.manifest_cache import ManifestCache
 
 logger = logging.getLogger(__name__)
 
+# Fields of TargetStat, NUL-terminated, for GNU stat's --printf.
+_STAT_FORMAT = "%n\\0%f\\0%s\\0%Y\\0%u\\0%g\\0"
+_STAT_FIELDS = 6
+
+
+class TargetStat(NamedTuple):
+    """Status of a path in the environment, following symlinks.
+
+    :param path: Path.
+    :param mode: File type and permission bits, as st_mode.
+    :param size: Size, in bytes.
+    :param mtime: Modification time, in seconds since the epoch.
+    :param uid: Owner's user ID.
+    :param gid: Owner's group ID.
+    """
+
+    path: pathlib.Path
+    mode: int
+    size: int
+    mtime: int
+    uid: int
+    gid: int
+
+    @property
+    def is_dir(self) -> bool:
+        """True if path is a directory."""
+        return stat.S_ISDIR(self.mode)
+
+    @property
+    def is_file(self) -> bool:
+        """True if path is a regular file."""
+        return stat.S_ISREG(self.mode)
+
+    @property
+    def permissions(self) -> int:
+        """Permission bits, e.g. 0o644."""
+        return stat.S_IMODE(self.mode)
+
+
+def _stat_command(paths: Sequence[pathlib.Path]) -> List[str]:
+    """Get command to stat paths with, following symlinks."""
+    return ["stat", "-L", f"--printf={_STAT_FORMAT}", "--"] + [
+        p.as_posix() for p in paths
+    ]
+
+
+def _parse_stat_output(
+    paths: Sequence[pathlib.Path], output: bytes
+) -> List[Optional[TargetStat]]:
+    """Parse output of stat command for paths, None for those missing."""
+    fields = output.split(b"\0")
+    stats: Dict[str, TargetStat] = {}
+    for offset in range(0, len(fields) - _STAT_FIELDS + 1, _STAT_FIELDS):
+        name, mode, size, mtime, uid, gid = fields[offset : offset + _STAT_FIELDS]
+        decoded = name.decode(errors="surrogateescape")
+        stats[decoded] = TargetStat(
+            path=pathlib.Path(decoded),
+            mode=int(mode, 16),
+            size=int(size),
+            mtime=int(mtime),
+            uid=int(uid),
+            gid=int(gid),
+        )
+
+    return [stats.get(p.as_posix()) for p in paths]
+
+
+def _batch_script(
+    commands: List[List[str]], *, marker: str, stop_on_error: bool
+) -> str:
+    """Generate shell script running commands, framing each one's output.
+
+    For each command, a line of the marker, exit code and sizes of stdout
+    and stderr is written, followed by its stdout and stderr.
+    """
+    lines = [
+        "d=$(mktemp -d) || exit 1",
+        "trap 'rm -rf \"$d\"' EXIT",
+        "run() {",
+        '    "$@" >"$d/out" 2>"$d/err" </dev/null',
+        "    rc=$?",
+        f"    printf '{marker} %d %d %d\\n' \"$rc\" "
+        '"$(wc -c <"$d/out")" "$(wc -c <"$d/err")"',
+        '    cat "$d/out" "$d/err"',
+        "    return $rc",
+        "}",
+    ]
+
+    for command in commands:
+        line = "run " + " ".join(shlex.quote(c) for c in command)
+        if stop_on_error:
+            line += " || exit 0"
+        lines.append(line)
+
+    lines.append("exit 0")
+    return "\n".join(lines) + "\n"
+
+
+def _parse_batch_output(
+    commands: List[List[str]], output: bytes, *, marker: str
+) -> List[subprocess.CompletedProcess]:
+    """Split output of batch script into a completed process per command run."""
+    results = []
+    offset = 0
+    for command in commands:
+        newline = output.find(b"\n", offset)
+        if newline == -1:
+            break
+
+        fields = output[offset:newline].split()
+        if len(fields) != 4 or fields[0] != marker.encode():
+            raise RuntimeError(f"Unexpected batch output: {output[offset:newline]!r}")
+
+        returncode, stdout_size, stderr_size = (int(f) for f in fields[1:])
+        stdout_start = newline + 1
+        stderr_start = stdout_start + stdout_size
+        offset = stderr_start + stderr_size
+
+        results.append(
+            subprocess.CompletedProcess(
+                command,
+                returncode,
+                output[stdout_start:stderr_start],
+                output[stderr_start:offset],
+            )
+        )
+
+    return results
+
+
+class StreamedProcess:
+    """Running command, iterated for its output lines as they arrive.
+
+    Iterating yields (stream, line) tuples, where stream is "stdout" or
+    "stderr" and line is the line's bytes, including its newline, if any.
+    stdout and stderr are read concurrently, so neither can fill up and
+    stall the command.  At most max_buffered_lines lines are held before
+    being consumed, after which the command is left to block on writing.
+    Lines longer than max_line_length are yielded in pieces of that size,
+    so memory held is bounded by their product.
+
+    Used as a context manager, the command is killed if iteration is not
+    complete on exit.
+
+    :param proc: Process with stdout and stderr pipes.
+    :param check: Raise exception on failure, once output is consumed.
+    :param max_buffered_lines: Number of lines to read ahead of iteration.
+    :param max_line_length: Maximum size of lines yielded, in bytes.
+    """
+
+    def __init__(
+        self,
+        proc: subprocess.Popen,
+        *,
+        check: bool = True,
+        max_buffered_lines: int = 1000,
+        max_line_length: int = 64 * 1024,
+    ) -> None:
+        self.proc = proc
+        self.check = check
+        self.max_line_length = max_line_length
+        self.returncode: Optional[int] = None
+
+        self._closed = threading.Event()
+        self._queue: "queue.Queue[Tuple[str, Optional[bytes]]]" = queue.Queue(
+            maxsize=max_buffered_lines
+        )
+        self._readers = [
+            threading.Thread(target=self._read, args=(name, stream), daemon=True)
+            for name, stream in [("stdout", proc.stdout), ("stderr", proc.stderr)]
+            if stream is not None
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def __enter__(self) -> "StreamedProcess":
+        """Start consuming output."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Kill command, if still running."""
+        self.close()
+
+    def _read(self, name: str, stream: IO[bytes]) -> None:
+        try:
+            while True:
+                line = stream.readline(self.max_line_length)
+                if not line or self._closed.is_set():
+                    break
+                self._queue.put((name, line))
+        finally:
+            stream.close()
+            self._queue.put((name, None))
+
+    def __iter__(self) -> Iterator[Tuple[str, bytes]]:
+        """Yield (stream, line) for each line of output, as it arrives.
+
+        :raises subprocess.CalledProcessError: if command fails and check is
+            True.
+        """
+        remaining = len(self._readers)
+        while remaining:
+            name, line = self._queue.get()
+            if line is None:
+                remaining -= 1
+            else:
+                yield name, line
+
+        self.returncode = self.proc.wait()
+        if self.check and self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.proc.args)
+
+    def close(self) -> None:
+        """Kill command if still running, discarding unconsumed output."""
+        if self.returncode is not None:
+            return
+
+        self._closed.set()
+        if self.proc.poll() is None:
+            self.proc.kill()
+
+        # Unblock readers waiting for space.
+        while any(r.is_alive() for r in self._readers):
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        self.returncode = self.proc.wait()
+
+
+class ShardedSyncError(Exception):
+    """Shards of a sharded directory transfer failed.
+
+    :param failures: Reason for failure of each failed shard, by index.
+    :param shards: Paths in each shard.
+    """
+
+    def __init__(self, failures: Dict[int, str], shards: List[List[str]]) -> None:
+        super().__init__()
+        self.failures = failures
+        self.shards = shards
+
+    def __repr__(self) -> str:
+        """Return representation."""
+        return f"ShardedSyncError(failures={self.failures!r})"
+
+    def __str__(self) -> str:
+        """Return string representation."""
+        reasons = ", ".join(
+            f"shard {index} ({reason})"
+            for index, reason in sorted(self.failures.items())
+        )
+        return f"{len(self.failures)} of {len(self.shards)} shards failed: {reasons}"
+
 
 class Executor(ABC):
     """Interfaces to execute commands and move data in/out of an environment.
 
-    :param tar_path: Path to tar command.
+    :param tar_path: Path to host tar command, found on first use if not
+        set.  Syncs archive in-process on the host (see tar_stream).
 
     """
 
-    def __init__(self, *, tar_path: pathlib.Path = None) -> None:
-        if tar_path is None:
-            self.tar_path = path.which_required("tar")
-        else:
-            self.tar_path = tar_path
+    def __init__(self, *, tar_path: Optional[pathlib.Path] = None) -> None:
+        self._tar_path = tar_path
+
+        # Compressors available both on host and in environment.
+        self._compressors: Optional[List[str]] = None
+
+    @property
+    def tar_path(self) -> pathlib.Path:
+        """Path to host tar command."""
+        if self._tar_path is None:
+            self._tar_path = path.which_required("tar")
+        return self._tar_path
+
+    @tar_path.setter
+    def tar_path(self, tar_path: pathlib.Path) -> None:
+        self._tar_path = tar_path
 
     @abstractmethod
     def create_file(
@@ -116,6 +395,115 @@ class Executor(ABC):
         """
         ...
 
+    def execute_batch(
+        self,
+        commands: List[List[str]],
+        *,
+        stop_on_error: bool = True,
+        check: bool = False,
+    ) -> List[subprocess.CompletedProcess]:
+        """Execute commands in sequence, with a single execute_run().
+
+        The commands are run by a generated shell script, so the cost of
+        starting a command in the environment is paid once for the batch.
+        Commands are run with stdin from /dev/null and their output captured.
+
+        :param commands: Commands to execute.
+        :param stop_on_error: Do not run commands following a failed one.
+        :param check: Raise exception if a command fails.
+
+        :returns: Completed process for each command run.
+
+        :raises subprocess.CalledProcessError: if a command fails and check is
+            True, or the batch itself fails.
+        """
+        if not commands:
+            return []
+
+        marker = "craft-batch-" + uuid.uuid4().hex
+        proc = self.execute_run(
+            ["sh", "-s"],
+            check=True,
+            input=_batch_script(
+                commands, marker=marker, stop_on_error=stop_on_error
+            ).encode(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        results = _parse_batch_output(commands, proc.stdout, marker=marker)
+
+        if check:
+            for result in results:
+                result.check_returncode()
+
+        return results
+
+    def execute_stream(
+        self,
+        command: List[str],
+        *,
+        check: bool = True,
+        max_buffered_lines: int = 1000,
+        max_line_length: int = 64 * 1024,
+        **kwargs,
+    ) -> StreamedProcess:
+        """Execute command, streaming its output line by line.
+
+        Output is not accumulated, so is suited to commands with a lot of
+        output, e.g. builds.  The exit status is available as returncode
+        once the output has been consumed.
+
+        :param command: Command to execute.
+        :param check: Raise exception on failure, once output is consumed.
+        :param max_buffered_lines: Number of lines to read ahead of
+            consumption, before applying backpressure to the command.
+        :param max_line_length: Size in bytes to split longer lines at.
+        :param kwargs: Additional keyword arguments for execute_popen().
+
+        :returns: Streamed process to iterate for (stream, line) tuples.
+        """
+        proc = self.execute_popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **kwargs,
+        )
+        return StreamedProcess(
+            proc,
+            check=check,
+            max_buffered_lines=max_buffered_lines,
+            max_line_length=max_line_length,
+        )
+
+    def stat(self, target: pathlib.Path) -> Optional[TargetStat]:
+        """Get status of path, following symlinks.
+
+        :param target: Path to check.
+
+        :returns: Status of path, or None if it does not exist.
+        """
+        return self.stat_many([target])[0]
+
+    def stat_many(self, targets: Sequence[pathlib.Path]) -> List[Optional[TargetStat]]:
+        """Get status of paths with a single command, following symlinks.
+
+        :param targets: Paths to check.
+
+        :returns: Status of each path, or None for those which do not exist.
+        """
+        if not targets:
+            return []
+
+        proc = self.execute_run(
+            _stat_command(targets),
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return _parse_stat_output(targets, proc.stdout)
+
     def is_target_directory(self, target: pathlib.Path) -> bool:
         """Check if path is directory.
 
@@ -123,8 +511,8 @@ class Executor(ABC):
 
         :returns: True if directory, False otherwise.
         """
-        proc = self.execute_run(command=["test", "-d", target.as_posix()])
-        return proc.returncode == 0
+        target_stat = self.stat(target)
+        return target_stat is not None and target_stat.is_dir
 
     def is_target_file(self, target: pathlib.Path) -> bool:
         """Check if path is file.
@@ -133,11 +521,107 @@ class Executor(ABC):
 
         :returns: True if file, False otherwise.
         """
-        proc = self.execute_run(command=["test", "-f", target.as_posix()])
-        return proc.returncode == 0
+        target_stat = self.stat(target)
+        return target_stat is not None and target_stat.is_file
+
+    def _is_remote(self) -> bool:
+        """Check if data moved to or from environment crosses the network."""
+        return False
+
+    def _available_compressors(self) -> List[str]:
+        """Get compressors available both on host and in environment."""
+        if self._compressors is None:
+            proc = self.execute_run(
+                [
+                    "sh",
+                    "-c",
+                    'for c in "$@"; do command -v "$c" >/dev/null && echo "$c"; done',
+                    "sh",
+                    *sync_compression.COMPRESSORS,
+                ],
+                check=False,
+                stdout=subprocess.PIPE,
+            )
+            remote = proc.stdout.decode().split()
+            # gzip is applied in-process on the host.
+            self._compressors = [
+                name
+                for name in sync_compression.COMPRESSORS
+                if name in remote and (name == "gzip" or shutil.which(name) is not None)
+            ]
+
+        return self._compressors
+
+    def _choose_compression(
+        self, compression: str, *, sample: Optional[pathlib.Path] = None
+    ) -> Optional[sync_compression.Compressor]:
+        """Choose compressor for a tar pipeline.
+
+        :param compression: Compression setting (see choose_compression()).
+        :param sample: Host directory to sample compressibility of.
+
+        :returns: Compressor, or None for no compression.
+        """
+        compressor = sync_compression.choose_compression(
+            compression,
+            available=self._available_compressors,
+            remote=self._is_remote(),
+            ratio=None
+            if sample is None
+            else lambda: sync_compression.sample_ratio(sample),
+        )
+        if compressor is not None:
+            logger.debug(
+                "Compressing with %s, level %d.", compressor.name, compressor.level
+            )
+        return compressor
+
+    def _stream_to(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        paths: Optional[List[str]] = None,
+        compressor: Optional[sync_compression.Compressor] = None,
+    ) -> int:
+        """Stream archive of source, written in-process, to tar in target.
+
+        :param source: Host directory to archive.
+        :param destination: Target directory to extract to.
+        :param paths: Paths under source to archive, non-recursively, parents
+            first, defaults to all of source.
+        :param compressor: Compressor to apply to stream.
+
+        :returns: Exit code of target tar.
+        """
+        tar_options = [] if compressor is None else compressor.tar_options()
+        target_proc = self.execute_popen(
+            ["tar", "xpf", "-", *tar_options, "-C", destination.as_posix()],
+            stdin=subprocess.PIPE,
+        )
+        assert target_proc.stdin is not None
+        try:
+            with sync_tar.compressed_writer(target_proc.stdin, compressor) as writer:
+                stats = sync_tar.write_archive(writer, source, paths)
+            logger.debug("Sent %d entries, %d bytes.", stats.entries, stats.size)
+        except BrokenPipeError:
+            # Target tar exited early, its exit code tells why.
+            pass
+        finally:
+            try:
+                target_proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            target_proc.wait()
+
+        return target_proc.returncode
 
     def naive_directory_sync_from(
-        self, *, source: pathlib.Path, destination: pathlib.Path
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        compression: str = "none",
     ) -> None:
         """Naive sync from remote using tarball.
 
@@ -145,60 +629,299 @@ class Executor(ABC):
 
         :param source: Target directory to copy from.
         :param destination: Host destination directory to copy to.
+        :param compression: "none", "auto", or compressor with optional
+            level, e.g. "gzip" or "zstd:19" (see choose_compression()).
+            Compressors missing on either side are not used.  With "auto",
+            only transfers over the network are compressed.
         """
-        destination_path = destination.as_posix()
+        compressor = self._choose_compression(compression)
+        tar_options = [] if compressor is None else compressor.tar_options()
 
         if destination.exists():
             shutil.rmtree(destination)
 
         destination.mkdir(parents=True)
 
-        archive_proc = self.execute_popen(
-            ["tar", "cpf", "-", "-C", source.as_posix(), "."],
-            stdout=subprocess.PIPE,
-        )
+        archive_command = [
+            "tar",
+            "cpf",
+            "-",
+            *tar_options,
+            "-C",
+            source.as_posix(),
+            ".",
+        ]
+        archive_proc = self.execute_popen(archive_command, stdout=subprocess.PIPE)
+        assert archive_proc.stdout is not None
+        try:
+            try:
+                with sync_tar.decompressed_reader(
+                    archive_proc.stdout, compressor
+                ) as reader:
+                    stats = sync_tar.read_archive(reader, destination)
+            finally:
+                archive_proc.stdout.close()
+                archive_proc.wait()
+        except tarfile.TarError as error:
+            # The archive is broken if target tar failed, report that instead.
+            if archive_proc.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    archive_proc.returncode, archive_command
+                ) from error
+            raise
+
+        logger.debug("Received %d entries, %d bytes.", stats.entries, stats.size)
+
+    def incremental_directory_sync_to(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        checksum: bool = False,
+        manifest_cache: Optional[ManifestCache] = None,
+        manifest_cache_key: str = "",
+    ) -> sync_manifest.SyncResult:
+        """Sync to remote, sending only added or changed paths.
+
+        Like naive_directory_sync_to(delete=True), destination ends up with
+        the contents of source.  A manifest of destination is generated with
+        a single command, compared with that of source, and then paths no
+        longer in source are deleted, and added or changed paths are sent
+        in a single tarball.
+
+        With a manifest cache, the manifest of the last sync to destination
+        is used in place of generating one, files are judged unchanged by
+        their inode, size and mtime, and known digests are kept, so content
+        is only hashed on the host, and only for files that were touched
+        without changing size.  Changes made
+        to destination other than by syncing are then not seen, so the cache
+        must be invalidated when they are made.
+
+        Requires GNU find in the environment, and sha256sum if checksum is
+        set.
 
-        target_proc = subprocess.Popen(
-            [str(self.tar_path), "xpvf", "-", "-C", destination_path],
-            stdin=archive_proc.stdout,
+        :param source: Host directory to copy.
+        :param destination: Target destination directory to copy to.
+        :param checksum: Compare content of files whose size matches but
+            mtime does not, rather than resending them.
+        :param manifest_cache: Cache of manifests of prior syncs.
+        :param manifest_cache_key: Identifier of this environment in cache.
+
+        :returns: Paths sent and deleted.
+        """
+        destination_path = destination.as_posix()
+        local = sync_manifest.scan_directory(source)
+
+        remote = None
+        if manifest_cache is not None:
+            remote = manifest_cache.load(
+                key=manifest_cache_key, destination=destination
+            )
+        cached = remote is not None
+
+        if remote is None:
+            proc = self.execute_run(
+                [
+                    "sh",
+                    "-c",
+                    sync_manifest.REMOTE_MANIFEST_SCRIPT,
+                    "sh",
+                    destination_path,
+                    "1" if checksum else "0",
+                ],
+                check=True,
+                stdout=subprocess.PIPE,
+            )
+            remote = sync_manifest.parse_remote_manifest(proc.stdout)
+
+        send, delete = sync_manifest.diff_manifests(local, remote, root=source)
+        logger.debug(
+            "Syncing %d of %d paths to %s, deleting %d.",
+            len(send),
+            len(local),
+            destination_path,
+            len(delete),
         )
 
-        # Allow archive_proc to receive a SIGPIPE if destination_proc exits.
-        if archive_proc.stdout:
-            archive_proc.stdout.close()
+        if manifest_cache is not None and (send or delete):
+            # Drop cached manifest until synced, in case sync is interrupted.
+            manifest_cache.invalidate(key=manifest_cache_key, destination=destination)
+
+            # Hash files to send, before sending, so a concurrent change is
+            # caught next time, as a scan of destination would.
+            if checksum:
+                for send_path in send:
+                    entry = local[send_path]
+                    if entry.type == "f" and entry.digest is None:
+                        local[send_path] = entry._replace(
+                            digest=sync_manifest.file_digest(source / send_path)
+                        )
+
+        if delete:
+            self.execute_run(
+                ["sh", "-c", 'cd "$1" && xargs -0 rm -rf --', "sh", destination_path],
+                check=True,
+                input=b"".join(
+                    f"./{p}".encode(errors="surrogateescape") + b"\0" for p in delete
+                ),
+            )
+
+        if send:
+            self._send_paths(source=source, destination=destination, paths=send)
+
+        # If unchanged since the cached manifest, it is left as is.
+        if manifest_cache is not None and (send or delete or not cached):
+            manifest_cache.save(
+                key=manifest_cache_key, destination=destination, manifest=local
+            )
+
+        return sync_manifest.SyncResult(sent=send, deleted=delete)
+
+    def _send_paths(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        paths: Optional[List[str]],
+        compressor: Optional[sync_compression.Compressor] = None,
+    ) -> None:
+        """Send paths under source, non-recursively, in a single tarball.
+
+        :param source: Host directory paths are relative to.
+        :param destination: Target directory to extract to.
+        :param paths: Paths to send, parents first, or None for all of source
+            recursively.
+        :param compressor: Compressor to apply to stream.
 
-        # Waot until done.
-        target_proc.communicate()
+        :raises subprocess.CalledProcessError: if target tar fails.
+        """
+        returncode = self._stream_to(
+            source=source, destination=destination, paths=paths, compressor=compressor
+        )
+        if returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, ["tar", "xpf", "-", "-C", destination.as_posix()]
+            )
 
     def naive_directory_sync_to(
-        self, *, source: pathlib.Path, destination: pathlib.Path, delete=True
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        delete=True,
+        compression: str = "none",
     ) -> None:
         """Naive sync to remote using tarball.
 
         :param source: Host directory to copy.
         :param destination: Target destination directory to copy to.
         :param delete: Flag to delete existing destination, if exists.
+        :param compression: "none", "auto", or compressor with optional
+            level, e.g. "gzip" or "zstd:19" (see choose_compression()).
+            Compressors missing on either side are not used.  With "auto",
+            only transfers over the network are compressed, if a sample of
+            source compresses well.
+
+        :raises subprocess.CalledProcessError: if target tar fails.
         """
         destination_path = destination.as_posix()
+        compressor = self._choose_compression(compression, sample=source)
 
         if delete is True:
             self.execute_run(["rm", "-rf", destination_path], check=True)
 
         self.execute_run(["mkdir", "-p", destination_path], check=True)
 
-        archive_proc = subprocess.Popen(
-            [self.tar_path, "cpf", "-", "-C", str(source), "."],
-            stdout=subprocess.PIPE,
+        self._send_paths(
+            source=source, destination=destination, paths=None, compressor=compressor
         )
 
-        target_proc = self.execute_popen(
-            ["tar", "xpvf", "-", "-C", destination_path],
-            stdin=archive_proc.stdout,
-        )
+    def sharded_directory_sync_to(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        parallelism: Optional[int] = None,
+        delete=True,
+        compression: str = "none",
+    ) -> None:
+        """Sync to remote using parallel tarballs.
+
+        Files are split into shards of about equal size, each sent by its
+        own tar pipeline, all at once, after the directories, symlinks and
+        other non-files are sent.  With a single shard, this is the same as
+        naive_directory_sync_to().
 
-        # Allow archive_proc to receive a SIGPIPE if destination_proc exits.
-        if archive_proc.stdout:
-            archive_proc.stdout.close()
+        :param source: Host directory to copy.
+        :param destination: Target destination directory to copy to.
+        :param parallelism: Number of shards, defaults to one chosen from the
+            number of CPUs and size of source (see choose_parallelism()).
+        :param delete: Flag to delete existing destination, if exists.
+        :param compression: Compression of each shard (see
+            naive_directory_sync_to()).
+
+        :raises ShardedSyncError: if any shard failed to transfer.
+        """
+        if parallelism is None:
+            parallelism = sync_shards.choose_parallelism(source)
+
+        if parallelism <= 1:
+            self.naive_directory_sync_to(
+                source=source,
+                destination=destination,
+                delete=delete,
+                compression=compression,
+            )
+            return
+
+        local = sync_manifest.scan_directory(source)
+        files = [(p, e.size) for p, e in local.items() if e.type == "f"]
+
+        destination_path = destination.as_posix()
+        compressor = self._choose_compression(compression, sample=source)
+
+        if delete is True:
+            self.execute_run(["rm", "-rf", destination_path], check=True)
+
+        self.execute_run(["mkdir", "-p", destination_path], check=True)
+
+        structure = sorted(p for p, e in local.items() if e.type != "f")
+        if structure:
+            self._send_paths(
+                source=source,
+                destination=destination,
+                paths=structure,
+                compressor=compressor,
+            )
+
+        shards = sync_shards.plan_shards(files, parallelism)
+        logger.debug(
+            "Syncing %d files to %s in %d shards.",
+            len(files),
+            destination_path,
+            parallelism,
+        )
 
-        # Waot until done.
-        target_proc.communicate()
+        failures: Dict[int, str] = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as pool:
+            futures = {
+                pool.submit(
+                    self._send_paths,
+                    source=source,
+                    destination=destination,
+                    paths=shard,
+                    compressor=compressor,
+                ): index
+                for index, shard in enumerate(shards)
+                if shard
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except subprocess.CalledProcessError as error:
+                    failures[futures[future]] = f"exit code {error.returncode}"
+                except OSError as error:
+                    failures[futures[future]] = str(error)
+
+        if failures:
+            raise ShardedSyncError(failures, shards)
@@ -13,14 +13,19 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """Host Executor."""
+import concurrent.futures
+import functools
 import logging
+import os
 import pathlib
 import shlex
 import shutil
 import subprocess
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 
-from .. import Executor
+from .. import Executor, ShardedSyncError
+from ..util import manifest as sync_manifest
+from ..util import shards as sync_shards
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +70,48 @@ class HostExecutor(Executor):
         command = self._prepare_execute_args(command=command)
         return subprocess.run(command, check=check, **kwargs)
 
+    def execute_batch(
+        self,
+        commands: List[List[str]],
+        *,
+        stop_on_error: bool = True,
+        check: bool = False,
+    ) -> List[subprocess.CompletedProcess]:
+        """Execute commands in sequence.
+
+        Starting a command on the host is cheap, so each is run directly
+        rather than through a generated script.
+
+        :param commands: Commands to execute.
+        :param stop_on_error: Do not run commands following a failed one.
+        :param check: Raise exception if a command fails.
+
+        :returns: Completed process for each command run.
+
+        :raises subprocess.CalledProcessError: if a command fails and check is
+            True.
+        """
+        results = []
+        for command in commands:
+            proc = self.execute_run(
+                command,
+                check=False,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            proc.args = command
+            results.append(proc)
+
+            if proc.returncode != 0 and stop_on_error:
+                break
+
+        if check:
+            for result in results:
+                result.check_returncode()
+
+        return results
+
     def execute_popen(self, command: List[str], **kwargs) -> subprocess.Popen:
         """Execute command using Popen().
 
@@ -122,7 +169,13 @@ class HostExecutor(Executor):
         else:
             raise FileNotFoundError(f"Source {source} not found.")
 
-    def sync_to(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+    def sync_to(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        parallelism: Optional[int] = None,
+    ) -> None:
         """Copy host source file/directory into environment at destination.
 
         Standard "cp -r" rules apply:
@@ -134,10 +187,72 @@ class HostExecutor(Executor):
 
         :param source: Host directory to copy.
         :param destination: Target destination directory to copy to.
+        :param parallelism: Number of threads to split directory copies
+            across, defaults to one chosen from the number of CPUs and size
+            of source (see choose_parallelism()).
+
+        :raises ShardedSyncError: if any thread failed to copy its files.
         """
         if source.is_file():
             shutil.copy2(source, destination)
         elif source.is_dir():
-            shutil.copytree(source, destination, dirs_exist_ok=True)
+            self._sharded_copytree(
+                source=source, destination=destination, parallelism=parallelism
+            )
         else:
             raise FileNotFoundError(f"Source {source} not found.")
+
+    @staticmethod
+    def _sharded_copytree(
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        parallelism: Optional[int],
+    ) -> None:
+        """Copy directory with shutil.copytree(), files split across threads.
+
+        Each thread copies the whole tree, ignoring files in other shards.
+        Paths not scanned up front, i.e. under symlinks to directories, are
+        copied by the thread owning the symlink.
+        """
+        if parallelism is None:
+            parallelism = sync_shards.choose_parallelism(source)
+
+        if parallelism <= 1:
+            shutil.copytree(source, destination, dirs_exist_ok=True)
+            return
+
+        local = sync_manifest.scan_directory(source)
+        files = [(p, e.size) for p, e in local.items() if e.type != "d"]
+
+        shards = sync_shards.plan_shards(files, parallelism)
+        owners = {p: index for index, shard in enumerate(shards) for p in shard}
+
+        def ignore_others(index: int, directory: str, names: List[str]) -> Set[str]:
+            ignored = set()
+            for name in names:
+                relative = os.path.relpath(os.path.join(directory, name), source)
+                if owners.get(relative, index) != index:
+                    ignored.add(name)
+            return ignored
+
+        failures: Dict[int, str] = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as pool:
+            futures = {
+                pool.submit(
+                    shutil.copytree,
+                    source,
+                    destination,
+                    ignore=functools.partial(ignore_others, index),
+                    dirs_exist_ok=True,
+                ): index
+                for index in range(parallelism)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except (OSError, shutil.Error) as error:
+                    failures[futures[future]] = str(error)
+
+        if failures:
+            raise ShardedSyncError(failures, shards)
@@ -18,7 +18,6 @@ import logging
 import pathlib
 import subprocess
 from textwrap import dedent
-from time import sleep
 from typing import Any, Dict, Final, Optional
 
 import yaml
@@ -29,6 +28,17 @@ from craft_providers.util.os_release import parse_os_release
 
 logger = logging.getLogger(__name__)
 
+# Retry check every 0.1s until it succeeds, up to attempts times.
+_WAIT_SCRIPT = """\
+i=0
+while [ "$i" -lt {attempts} ]; do
+    {check} && exit 0
+    i=$((i + 1))
+    sleep 0.1
+done
+exit 1
+"""
+
 
 class BuilddImageAlias(enum.Enum):
     """Mappings for supported buildd images."""
@@ -202,12 +212,12 @@ class BuilddImage(Image):
             file_mode="0644",
         )
 
-        executor.execute_run(
-            command=["systemctl", "enable", "systemd-networkd"], check=True
-        )
-
-        executor.execute_run(
-            command=["systemctl", "restart", "systemd-networkd"], check=True
+        executor.execute_batch(
+            [
+                ["systemctl", "enable", "systemd-networkd"],
+                ["systemctl", "restart", "systemd-networkd"],
+            ],
+            check=True,
         )
 
     def _setup_resolved(self, *, executor: Executor) -> None:
@@ -216,24 +226,15 @@ class BuilddImage(Image):
         :param executor: Executor for target container.
         :param timeout_secs: Timeout in seconds.
         """
-        executor.execute_run(
-            command=[
-                "ln",
-                "-sf",
-                "/run/systemd/resolve/resolv.conf",
-                "/etc/resolv.conf",
+        executor.execute_batch(
+            [
+                ["ln", "-sf", "/run/systemd/resolve/resolv.conf", "/etc/resolv.conf"],
+                ["systemctl", "enable", "systemd-resolved"],
+                ["systemctl", "restart", "systemd-resolved"],
             ],
             check=True,
         )
 
-        executor.execute_run(
-            command=["systemctl", "enable", "systemd-resolved"], check=True
-        )
-
-        executor.execute_run(
-            command=["systemctl", "restart", "systemd-resolved"], check=True
-        )
-
     def _setup_snapd(self, *, executor: Executor) -> None:
         """Install snapd and dependencies and wait until ready.
 
@@ -251,21 +252,23 @@ class BuilddImage(Image):
             check=True,
         )
 
-        executor.execute_run(
-            command=["systemctl", "enable", "systemd-udevd"], check=True
-        )
-        executor.execute_run(
-            command=["systemctl", "start", "systemd-udevd"], check=True
+        executor.execute_batch(
+            [
+                ["systemctl", "enable", "systemd-udevd"],
+                ["systemctl", "start", "systemd-udevd"],
+            ],
+            check=True,
         )
         executor.execute_run(
             command=["apt-get", "install", "snapd", "--yes"], check=True
         )
-        executor.execute_run(command=["systemctl", "start", "snapd.socket"], check=True)
-        executor.execute_run(
-            command=["systemctl", "start", "snapd.service"], check=True
-        )
-        executor.execute_run(
-            command=["snap", "wait", "system", "seed.loaded"], check=True
+        executor.execute_batch(
+            [
+                ["systemctl", "start", "snapd.socket"],
+                ["systemctl", "start", "snapd.service"],
+                ["snap", "wait", "system", "seed.loaded"],
+            ],
+            check=True,
         )
 
     def _setup_wait_for_network(
@@ -273,19 +276,25 @@ class BuilddImage(Image):
     ) -> None:
         """Wait until networking is ready.
 
+        Polls from within the instance, avoiding an exec per attempt.
+
         :param executor: Executor for target container.
         :param timeout_secs: Timeout in seconds.
         """
         logger.info("Waiting for networking to be ready...")
-        for _ in range(timeout_secs * 2):
-            proc = executor.execute_run(
-                command=["getent", "hosts", "snapcraft.io"], stdout=subprocess.DEVNULL
-            )
-            if proc.returncode == 0:
-                break
-
-            sleep(0.5)
-        else:
+        proc = executor.execute_run(
+            command=[
+                "sh",
+                "-c",
+                _WAIT_SCRIPT.format(
+                    attempts=timeout_secs * 10,
+                    check="getent hosts snapcraft.io >/dev/null",
+                ),
+            ],
+            check=False,
+            stdout=subprocess.DEVNULL,
+        )
+        if proc.returncode != 0:
             logger.warning("Failed to setup networking.")
 
     def _setup_wait_for_system_ready(
@@ -293,20 +302,29 @@ class BuilddImage(Image):
     ) -> None:
         """Wait until system is ready.
 
+        Polls from within the instance, avoiding an exec per attempt.
+
         :param executor: Executor for target container.
         :param timeout_secs: Timeout in seconds.
         """
         logger.info("Waiting for container to be ready...")
-        for _ in range(timeout_secs * 2):
-            proc = executor.execute_run(
-                command=["systemctl", "is-system-running"], stdout=subprocess.PIPE
-            )
-
-            running_state = proc.stdout.decode().strip()
-            if running_state in ["running", "degraded"]:
-                break
-
+        proc = executor.execute_run(
+            command=[
+                "sh",
+                "-c",
+                _WAIT_SCRIPT.format(
+                    attempts=timeout_secs * 10,
+                    check=(
+                        "state=$(systemctl is-system-running); "
+                        'echo "$state"; '
+                        'case "$state" in running|degraded) true;; *) false;; esac'
+                    ),
+                ),
+            ],
+            check=False,
+            stdout=subprocess.PIPE,
+        )
+        if proc.returncode != 0:
+            running_state = proc.stdout.decode().strip().rpartition("\n")[2]
             logger.debug("systemctl is-system-running: %s", running_state)
-            sleep(0.5)
-        else:
             logger.warning("Systemd failed to reach target before timeout.")
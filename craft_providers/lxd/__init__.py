@@ -14,7 +14,22 @@
 
 """LXD environment provider."""
 
-from .lxc import LXC, purge_project  # noqa: F401
+from .async_lxc import AsyncLXC  # noqa: F401
+from .async_lxd_instance import AsyncLXDInstance  # noqa: F401
+from .async_lxd_provider import AsyncLXDProvider  # noqa: F401
+from .errors import LXDAPIError  # noqa: F401
+from .instance_config import InstanceConfigTransaction  # noqa: F401
+from .lxc import LXC, PurgeReport, purge_project  # noqa: F401
+from .lxc_metrics import LXCCommandStats, LXCMetrics, get_lxc_metrics  # noqa: F401
+from .lxc_trace import LXCTraceRecorder, write_replay_stub  # noqa: F401
 from .lxd import LXD  # noqa: F401
+from .lxd_capabilities import LXDCapabilities, LXDCapabilityCache  # noqa: F401
+from .lxd_connection_pool import LXDConnectionPool, get_connection_pool  # noqa: F401
+from .lxd_event_monitor import LXDEventMonitor  # noqa: F401
+from .lxd_exec_agent import LXDExecAgent, LXDExecAgentError  # noqa: F401
 from .lxd_instance import LXDInstance  # noqa: F401
+from .lxd_operation import LXDOperation  # noqa: F401
+from .lxd_profile import LXDProfileManager  # noqa: F401
 from .lxd_provider import LXDProvider  # noqa: F401
+from .lxd_rest_client import LXDRestClient  # noqa: F401
+from .records import DiskDevice, ImageRecord, InstanceState  # noqa: F401
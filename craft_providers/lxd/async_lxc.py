@@ -0,0 +1,556 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Asynchronous LXC wrapper."""
+import asyncio
+import json
+import logging
+import pathlib
+import shlex
+import subprocess
+import time
+from typing import Any, Dict, List, Optional
+
+from .lxc_commands import LXCCommands
+from .records import DiskDevice, ImageRecord, InstanceState
+from .yaml_loader import _load_yaml
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLXC(LXCCommands):  # pylint: disable=too-many-public-methods
+    """Wrapper for lxc, using asyncio subprocesses.
+
+    Mirrors the LXC API, with coroutines in place of blocking calls.  Commands
+    are built and their output parsed as for LXC, only running them differs.
+
+    :param lxc_path: Path to lxc.
+    :param metrics: Metrics to record subcommand latency to, defaults to the
+        metrics shared by all clients in this process.
+    :param trace: Recorder to capture every completed invocation to, e.g. for
+        replay with write_replay_stub().
+    """
+
+    async def _run(  # pylint: disable=redefined-builtin
+        self,
+        *,
+        command: List[str],
+        project: str = "default",
+        check: bool = True,
+        input: Optional[bytes] = None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    ) -> subprocess.CompletedProcess:
+        """Execute command on host, without blocking the event loop."""
+        command = self._host_command(command=command, project=project)
+
+        start = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=stdout,
+            stderr=stderr,
+        )
+        out, err = await proc.communicate(input)
+        returncode = await proc.wait()
+
+        self._record(
+            command=command, start=start, returncode=returncode, stdout=out, stderr=err
+        )
+
+        if check and returncode != 0:
+            logger.warning("Failed to execute: %s", out)
+            raise subprocess.CalledProcessError(
+                returncode, command, output=out, stderr=err
+            )
+
+        return subprocess.CompletedProcess(command, returncode, out, err)
+
+    async def _is_missing(
+        self,
+        error: subprocess.CalledProcessError,
+        *,
+        kind: str,
+        project: str,
+        remote: str,
+    ) -> bool:
+        """Check if lxc query failed as the object queried does not exist.
+
+        If lxc does not say whether the object or its project is missing,
+        the project is queried.
+        """
+        missing = self._is_not_found(error, kind=kind)
+        if missing is not None:
+            return missing
+
+        proc = await self._run(
+            command=self._project_get_command(project=project, remote=remote),
+            check=False,
+            stderr=subprocess.DEVNULL,
+        )
+        return proc.returncode == 0
+
+    async def config_device_add_disk(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        device_name: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Mount host source directory to target mount point."""
+        await self._run(
+            command=self._config_device_add_disk_command(
+                instance=instance,
+                source=source,
+                destination=destination,
+                device_name=device_name,
+                remote=remote,
+            ),
+            project=project,
+        )
+
+    async def config_device_show(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        """Show device config."""
+        proc = await self._run(
+            command=self._config_device_show_command(instance=instance, remote=remote),
+            project=project,
+        )
+
+        return _load_yaml(proc.stdout)
+
+    async def config_device_disks(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> List[DiskDevice]:
+        """Get disk devices configured for instance."""
+        devices = await self.config_device_show(
+            instance=instance, project=project, remote=remote
+        )
+
+        return self._disk_devices(devices)
+
+    async def config_patch(
+        self,
+        *,
+        instance: str,
+        config: Optional[Dict[str, str]] = None,
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Apply config keys and devices to instance in a single request.
+
+        Keys and devices which are not given are left unchanged.  A device
+        with the name of an existing device replaces it.
+        """
+        command = self._config_patch_command(
+            instance=instance,
+            config=config,
+            devices=devices,
+            project=project,
+            remote=remote,
+        )
+        if command is None:
+            return
+
+        await self._run(command=command, project=project)
+
+    async def config_set(
+        self,
+        *,
+        instance: str,
+        key: str,
+        value: str,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Set instance configuration key."""
+        await self._run(
+            command=self._config_set_command(
+                instance=instance, key=key, value=value, remote=remote
+            ),
+            project=project,
+        )
+
+    async def delete(
+        self,
+        *,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        force=False,
+    ) -> None:
+        """Delete instance."""
+        await self._run(
+            command=self._delete_command(instance=instance, remote=remote, force=force),
+            project=project,
+        )
+
+    async def exec(
+        self,
+        *,
+        command: List[str],
+        instance: str,
+        cwd: str = "/root",
+        mode: str = "auto",
+        project: str = "default",
+        remote: str = "local",
+        **kwargs,
+    ) -> asyncio.subprocess.Process:  # pylint: disable=no-member
+        """Start command in instance.
+
+        :param kwargs: Keyword args to pass to asyncio.create_subprocess_exec().
+
+        :returns: Process, to be awaited by caller.
+        """
+        command = self._formulate_command(
+            command=command,
+            instance=instance,
+            cwd=cwd,
+            mode=mode,
+            project=project,
+            remote=remote,
+        )
+
+        quoted = " ".join([shlex.quote(c) for c in command])
+        logger.warning("Executing in container: %s", quoted)
+
+        return await asyncio.create_subprocess_exec(*command, **kwargs)
+
+    async def file_pull(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        recursive: bool = False,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Retrieve file from instance."""
+        await self._run(
+            command=self._file_pull_command(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                remote=remote,
+            ),
+            project=project,
+        )
+
+    async def file_push(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = False,
+        recursive: bool = False,
+        gid: str = "-1",
+        uid: str = "-1",
+        mode: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Create file with content and file mode."""
+        await self._run(
+            command=self._file_push_command(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                gid=gid,
+                uid=uid,
+                mode=mode,
+                remote=remote,
+            ),
+            project=project,
+        )
+
+    async def info(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        """Get server config that instance is running on."""
+        proc = await self._run(
+            command=self._info_command(remote=remote), project=project
+        )
+        return _load_yaml(proc.stdout)
+
+    async def instance_get(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get instance configuration and status.
+
+        :returns: Instance information if instance exists, else None.
+        """
+        try:
+            proc = await self._run(
+                command=self._instance_get_command(
+                    instance=instance, project=project, remote=remote
+                ),
+                project=project,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as error:
+            if await self._is_missing(
+                error, kind="instance", project=project, remote=remote
+            ):
+                return None
+            raise error
+
+        return json.loads(proc.stdout)
+
+    async def launch(
+        self,
+        *,
+        config_keys: Dict[str, str],
+        image: str,
+        image_remote: str,
+        instance: str,
+        ephemeral: bool = False,
+        project: str = "default",
+        remote: str = "local",
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        profiles: Optional[List[str]] = None,
+    ) -> None:
+        """Launch instance.
+
+        :param devices: Devices to create instance with, passed to lxc as
+            instance configuration on stdin.
+        :param profiles: Profiles to apply, in place of the default profile.
+        """
+        await self._run(
+            command=self._launch_command(
+                config_keys=config_keys,
+                image=image,
+                image_remote=image_remote,
+                instance=instance,
+                ephemeral=ephemeral,
+                remote=remote,
+                profiles=profiles,
+            ),
+            project=project,
+            input=self._launch_input(devices),
+        )
+
+    async def image_alias_get(
+        self, *, alias: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get image alias.
+
+        :returns: Alias information, including the image fingerprint as
+            "target", if alias exists, else None.
+        """
+        try:
+            proc = await self._run(
+                command=self._image_alias_get_command(
+                    alias=alias, project=project, remote=remote
+                ),
+                project=project,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as error:
+            if await self._is_missing(
+                error, kind="image alias", project=project, remote=remote
+            ):
+                return None
+            raise error
+
+        return json.loads(proc.stdout)
+
+    async def image_copy(
+        self,
+        *,
+        image: str,
+        image_remote: str,
+        alias: str,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Copy image."""
+        await self._run(
+            command=self._image_copy_command(
+                image=image, image_remote=image_remote, alias=alias, remote=remote
+            ),
+            project=project,
+        )
+
+    async def image_delete(
+        self, *, image: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Delete image."""
+        await self._run(
+            command=self._image_delete_command(image=image, remote=remote),
+            project=project,
+        )
+
+    async def image_list(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[Dict[str, Any]]:
+        """List images."""
+        proc = await self._run(
+            command=self._image_list_command(remote=remote), project=project
+        )
+
+        return json.loads(proc.stdout)
+
+    async def image_records(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[ImageRecord]:
+        """List images as typed records."""
+        images = await self.image_list(project=project, remote=remote)
+
+        return [ImageRecord(image) for image in images]
+
+    async def list(
+        self,
+        *,
+        instance: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> List[Dict[str, Any]]:
+        """List instances."""
+        proc = await self._run(
+            command=self._list_command(instance=instance, remote=remote),
+            project=project,
+        )
+
+        return json.loads(proc.stdout)
+
+    async def instance_states(
+        self,
+        *,
+        instance: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> List[InstanceState]:
+        """List instances as typed records."""
+        instances = await self.list(instance=instance, project=project, remote=remote)
+
+        return [InstanceState(i) for i in instances]
+
+    async def profile_edit(
+        self,
+        *,
+        profile: str,
+        config: Dict[str, Any],
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Edit profile."""
+        await self._run(
+            command=self._profile_edit_command(profile=profile, remote=remote),
+            project=project,
+            input=self._profile_input(config),
+        )
+
+    async def profile_show(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        """Get profile."""
+        proc = await self._run(
+            command=self._profile_show_command(profile=profile, remote=remote),
+            project=project,
+        )
+
+        return _load_yaml(proc.stdout)
+
+    async def project_create(self, *, project: str, remote: str = "local") -> None:
+        """Create project."""
+        await self._run(
+            command=self._project_create_command(project=project, remote=remote)
+        )
+
+    async def project_list(self, remote: str = "local") -> List[str]:
+        """Get list of projects.
+
+        :returns: Sorted list of project names.
+        """
+        proc = await self._run(command=self._project_list_command(remote=remote))
+
+        return self._project_names(proc.stdout)
+
+    async def project_delete(self, *, project: str, remote: str = "local") -> None:
+        """Delete project, if exists."""
+        await self._run(
+            command=self._project_delete_command(project=project, remote=remote)
+        )
+
+    async def publish(
+        self,
+        *,
+        alias: str,
+        instance: str,
+        project: str,
+        force: bool = True,
+        remote: str = "local",
+    ) -> None:
+        """Publish instance as image."""
+        await self._run(
+            command=self._publish_command(
+                alias=alias, instance=instance, force=force, remote=remote
+            ),
+            project=project,
+        )
+
+    async def remote_add(self, *, remote: str, addr: str, protocol: str) -> None:
+        """Add a public remote."""
+        await self._run(
+            command=self._remote_add_command(
+                remote=remote, addr=addr, protocol=protocol
+            )
+        )
+
+    async def remote_list(self) -> Dict[str, Any]:
+        """Get list of remotes.
+
+        :returns: dictionary with remote name mapping to config.
+        """
+        proc = await self._run(command=self._remote_list_command())
+
+        return json.loads(proc.stdout)
+
+    async def start(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Start container."""
+        await self._run(
+            command=self._start_command(instance=instance, remote=remote),
+            project=project,
+        )
+
+    async def stop(
+        self,
+        *,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        force=True,
+        timeout: int = -1,
+    ) -> None:
+        """Stop container."""
+        await self._run(
+            command=self._stop_command(
+                instance=instance, remote=remote, force=force, timeout=timeout
+            ),
+            project=project,
+        )
@@ -0,0 +1,493 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Asynchronous LXD Instance."""
+import asyncio
+import contextlib
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence
+
+from ..executor import TargetStat, _parse_stat_output, _stat_command
+from ..util import path
+from .async_lxc import AsyncLXC
+from .lxd_capabilities import LXDCapabilities
+
+logger = logging.getLogger(__name__)
+
+
+def _write_temp_file(content: bytes) -> pathlib.Path:
+    """Write content to a new temporary file, for pushing to an instance."""
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(content)
+
+    return pathlib.Path(temp_file.name)
+
+
+def _recreate_directory(directory: pathlib.Path) -> None:
+    """Replace directory, and anything in it, with an empty one."""
+    if directory.exists():
+        shutil.rmtree(directory)
+
+    directory.mkdir(parents=True)
+
+
+class AsyncLXDInstance:
+    """LXD Instance Lifecycle, using asyncio.
+
+    Mirrors the LXDInstance API, with coroutines in place of blocking calls.
+
+    :param tar_path: Path to tar command.
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        project: str = "default",
+        remote: str = "local",
+        lxc: Optional[AsyncLXC] = None,
+        tar_path: Optional[pathlib.Path] = None,
+    ):
+        self.name = name
+        self.project = project
+        self.remote = remote
+        if lxc is None:
+            self.lxc = AsyncLXC()
+        else:
+            self.lxc = lxc
+
+        if tar_path is None:
+            self.tar_path = path.which_required("tar")
+        else:
+            self.tar_path = tar_path
+
+    async def create_file(
+        self,
+        *,
+        destination: pathlib.Path,
+        content: bytes,
+        file_mode: str,
+        gid: int = 0,
+        uid: int = 0,
+    ) -> None:
+        """Create file with content and file mode.
+
+        :param destination: Path to file.
+        :param content: Contents of file.
+        :param file_mode: File mode string (e.g. '0644').
+        :param gid: File owner group ID.
+        :param uid: Filer owner user ID.
+        """
+        # Blocking file I/O is run in the default executor, off the loop.
+        loop = asyncio.get_running_loop()
+        temp_path = await loop.run_in_executor(None, _write_temp_file, content)
+
+        try:
+            await self.lxc.file_push(
+                instance=self.name,
+                source=temp_path,
+                destination=destination,
+                mode=file_mode,
+                gid=str(gid),
+                uid=str(uid),
+                project=self.project,
+                remote=self.remote,
+            )
+        finally:
+            await loop.run_in_executor(None, os.unlink, temp_path)
+
+    async def delete(self, force: bool = True) -> None:
+        """Delete instance.
+
+        :param force: Delete even if running.
+        """
+        await self.lxc.delete(
+            instance=self.name,
+            project=self.project,
+            remote=self.remote,
+            force=force,
+        )
+
+    async def execute_popen(
+        self, command: List[str], **kwargs
+    ) -> asyncio.subprocess.Process:  # pylint: disable=no-member
+        """Start process in instance using asyncio.create_subprocess_exec().
+
+        :param command: Command to execute.
+        :param kwargs: Additional keyword arguments for
+            asyncio.create_subprocess_exec().
+
+        :returns: Process instance.
+        """
+        return await self.lxc.exec(
+            instance=self.name,
+            command=command,
+            project=self.project,
+            remote=self.remote,
+            **kwargs,
+        )
+
+    async def execute_run(  # pylint: disable=redefined-builtin
+        self,
+        command: List[str],
+        check=True,
+        input: Optional[bytes] = None,
+        stdout=None,
+        stderr=None,
+        **kwargs,
+    ) -> subprocess.CompletedProcess:
+        """Execute command in instance, waiting for it to complete.
+
+        :param command: Command to execute.
+        :param check: Raise exception on failure.
+        :param input: Data to send to command's stdin.
+        :param stdout: Command stdout, as for subprocess.run().
+        :param stderr: Command stderr, as for subprocess.run().
+        :param kwargs: Keyword args to pass to asyncio.create_subprocess_exec().
+
+        :returns: Completed process.
+
+        :raises subprocess.CalledProcessError: if command fails and check is
+            True.
+        """
+        if input is not None:
+            kwargs["stdin"] = subprocess.PIPE
+
+        proc = await self.execute_popen(command, stdout=stdout, stderr=stderr, **kwargs)
+        out, err = await proc.communicate(input)
+        returncode = await proc.wait()
+
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, command, output=out, stderr=err
+            )
+
+        return subprocess.CompletedProcess(command, returncode, out, err)
+
+    async def exists(self) -> bool:
+        """Check if instance exists.
+
+        :returns: True if instance exists.
+        """
+        return await self.get_state() is not None
+
+    async def get_state(self) -> Optional[Dict[str, Any]]:
+        """Get state configuration for instance.
+
+        :returns: Instance configuration and status if instance exists,
+            else None.
+        """
+        return await self.lxc.instance_get(
+            instance=self.name, project=self.project, remote=self.remote
+        )
+
+    async def is_mounted(
+        self, *, source: pathlib.Path, destination: pathlib.Path
+    ) -> bool:
+        """Check if path is mounted at target.
+
+        :param source: Host path to check.
+        :param destination: Instance path to check.
+
+        :returns: True if source is mounted at destination.
+        """
+        disks = await self.lxc.config_device_disks(
+            instance=self.name, project=self.project, remote=self.remote
+        )
+
+        return any(
+            disk.is_mount_of(source=source, destination=destination) for disk in disks
+        )
+
+    async def is_running(self) -> bool:
+        """Check if instance is running.
+
+        :returns: True if instance is running.
+        """
+        state = await self.get_state()
+        if state is None:
+            return False
+
+        return state.get("status") == "Running"
+
+    async def stat(self, target: pathlib.Path) -> Optional[TargetStat]:
+        """Get status of path, following symlinks.
+
+        :param target: Path to check.
+
+        :returns: Status of path, or None if it does not exist.
+        """
+        return (await self.stat_many([target]))[0]
+
+    async def stat_many(
+        self, targets: Sequence[pathlib.Path]
+    ) -> List[Optional[TargetStat]]:
+        """Get status of paths with a single command, following symlinks.
+
+        :param targets: Paths to check.
+
+        :returns: Status of each path, or None for those which do not exist.
+        """
+        if not targets:
+            return []
+
+        proc = await self.execute_run(
+            _stat_command(targets),
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return _parse_stat_output(targets, proc.stdout)
+
+    async def is_target_directory(self, target: pathlib.Path) -> bool:
+        """Check if path is directory.
+
+        :param target: Path to check.
+
+        :returns: True if directory, False otherwise.
+        """
+        target_stat = await self.stat(target)
+        return target_stat is not None and target_stat.is_dir
+
+    async def is_target_file(self, target: pathlib.Path) -> bool:
+        """Check if path is file.
+
+        :param target: Path to check.
+
+        :returns: True if file, False otherwise.
+        """
+        target_stat = await self.stat(target)
+        return target_stat is not None and target_stat.is_file
+
+    async def launch(
+        self,
+        *,
+        image: str,
+        image_remote: str,
+        uid: str = str(os.getuid()),
+        ephemeral: bool = True,
+    ) -> None:
+        """Launch instance.
+
+        :param image: Image name to launch.
+        :param image_remote: Image remote name.
+        :param uid: Host user ID to map to instance root.
+        :param ephemeral: Flag to enable ephemeral instance.
+        """
+        config_keys = dict()
+        config_keys["raw.idmap"] = f"both {uid!s} 0"
+
+        if await self._host_supports_mknod():
+            config_keys["security.syscalls.intercept.mknod"] = "true"
+
+        await self.lxc.launch(
+            config_keys=config_keys,
+            ephemeral=ephemeral,
+            instance=self.name,
+            image=image,
+            image_remote=image_remote,
+            project=self.project,
+            remote=self.remote,
+        )
+
+    async def mount(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+        """Mount host source directory to target mount point.
+
+        Checks first to see if already mounted.
+
+        :param source: Host path to mount.
+        :param destination: Instance path to mount to.
+        """
+        if await self.is_mounted(source=source, destination=destination):
+            return
+
+        await self.lxc.config_device_add_disk(
+            instance=self.name,
+            source=source,
+            destination=destination,
+            project=self.project,
+            remote=self.remote,
+        )
+
+    async def _host_supports_mknod(self) -> bool:
+        """Check if host supports mknod in container.
+
+        See: https://linuxcontainers.org/lxd/docs/master/syscall-interception
+
+        :returns: True if mknod is supported.
+        """
+        info = await self.lxc.info(project=self.project, remote=self.remote)
+        return LXDCapabilities(info).supports_mknod
+
+    async def _pipe(
+        self, *, archive_command: List[str], target_command: List[str], to_instance
+    ) -> None:
+        """Pipe output of archive command into target command.
+
+        :param to_instance: True if archive runs on host and target runs in
+            instance, False for the reverse.
+
+        :raises subprocess.CalledProcessError: if either command fails.
+        """
+        read_fd, write_fd = os.pipe()
+        try:
+            if to_instance:
+                archive_proc = await asyncio.create_subprocess_exec(
+                    *archive_command, stdout=write_fd
+                )
+            else:
+                archive_proc = await self.execute_popen(
+                    archive_command, stdout=write_fd
+                )
+            os.close(write_fd)
+            write_fd = -1
+
+            try:
+                if to_instance:
+                    target_proc = await self.execute_popen(
+                        target_command, stdin=read_fd
+                    )
+                else:
+                    target_proc = await asyncio.create_subprocess_exec(
+                        *target_command, stdin=read_fd
+                    )
+            except BaseException:
+                # Nothing will read the archive, so it would block on the pipe.
+                with contextlib.suppress(ProcessLookupError):
+                    archive_proc.kill()
+                await archive_proc.wait()
+                raise
+        finally:
+            os.close(read_fd)
+            if write_fd != -1:
+                os.close(write_fd)
+
+        archive_returncode, target_returncode = await asyncio.gather(
+            archive_proc.wait(), target_proc.wait()
+        )
+
+        # A failed archive may still have been extracted, in part, report it.
+        if archive_returncode != 0:
+            raise subprocess.CalledProcessError(archive_returncode, archive_command)
+
+        if target_returncode != 0:
+            raise subprocess.CalledProcessError(target_returncode, target_command)
+
+    async def start(self) -> None:
+        """Start instance."""
+        await self.lxc.start(
+            instance=self.name, project=self.project, remote=self.remote
+        )
+
+    async def stop(self) -> None:
+        """Stop instance."""
+        await self.lxc.stop(
+            instance=self.name, project=self.project, remote=self.remote
+        )
+
+    def supports_mount(self) -> bool:
+        """Check if instance supports mounting from host.
+
+        :returns: True if mount is supported.
+        """
+        return self.remote == "local"
+
+    async def sync_from(
+        self, *, source: pathlib.Path, destination: pathlib.Path
+    ) -> None:
+        """Copy source file/directory from environment to host destination.
+
+        Standard "cp -r" rules apply:
+
+            - if source is directory, copy happens recursively.
+
+            - if destination exists, source will be copied into destination.
+
+        :param source: Target directory to copy from.
+        :param destination: Host destination directory to copy to.
+        """
+        logger.info("Syncing env:%s -> host:%s...", source, destination)
+        source_stat = await self.stat(source)
+        if source_stat is not None and source_stat.is_file:
+            await self.lxc.file_pull(
+                instance=self.name,
+                source=source,
+                destination=destination,
+                project=self.project,
+                remote=self.remote,
+                create_dirs=True,
+            )
+        elif source_stat is not None and source_stat.is_dir:
+            # Removing a large tree would stall the loop, run it off the loop.
+            await asyncio.get_running_loop().run_in_executor(
+                None, _recreate_directory, destination
+            )
+
+            await self._pipe(
+                archive_command=["tar", "cpf", "-", "-C", source.as_posix(), "."],
+                target_command=[
+                    str(self.tar_path),
+                    "xpf",
+                    "-",
+                    "-C",
+                    destination.as_posix(),
+                ],
+                to_instance=False,
+            )
+        else:
+            raise FileNotFoundError(f"Source {source} not found.")
+
+    async def sync_to(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+        """Copy host source file/directory into environment at destination.
+
+        Standard "cp -r" rules apply:
+        - if source is directory, copy happens recursively.
+        - if destination exists, source will be copied into destination.
+
+        :param source: Host directory to copy.
+        :param destination: Target destination directory to copy to.
+        """
+        logger.info("Syncing host:%s -> env:%s...", source, destination)
+        if source.is_file():
+            await self.lxc.file_push(
+                instance=self.name,
+                source=source,
+                destination=destination,
+                project=self.project,
+                remote=self.remote,
+            )
+        elif source.is_dir():
+            destination_path = destination.as_posix()
+            await self.execute_run(["rm", "-rf", destination_path], check=True)
+            await self.execute_run(["mkdir", "-p", destination_path], check=True)
+
+            await self._pipe(
+                archive_command=[
+                    str(self.tar_path),
+                    "cpf",
+                    "-",
+                    "-C",
+                    str(source),
+                    ".",
+                ],
+                target_command=["tar", "xpf", "-", "-C", destination_path],
+                to_instance=True,
+            )
+        else:
+            raise FileNotFoundError(f"Source {source} not found.")
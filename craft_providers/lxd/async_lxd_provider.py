@@ -0,0 +1,329 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Asynchronous LXD Provider."""
+import asyncio
+import logging
+import subprocess
+from typing import Dict, Optional, Tuple
+
+from .. import images
+from .async_lxc import AsyncLXC
+from .async_lxd_instance import AsyncLXDInstance
+from .errors import LXDAPIError
+from .lxc import LXC
+from .lxd import LXD
+from .lxd_instance import LXDInstance
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLXDProvider:
+    """LXD Provider, using asyncio.
+
+    Mirrors the LXDProvider API, with coroutines in place of blocking calls.
+
+    Images are configured through the (synchronous) Executor interface, so
+    the image setup step is run in the event loop's default executor.  All
+    other lifecycle steps run on the event loop.
+
+    :param image: Image configuration.
+    :param instance_name: Name of instance to use/create.
+    :param auto_clean: Automatically clean LXD instances if required (e.g.
+        incompatible).
+    :param image_remote_addr: Remote address for LXD image to use.
+    :param image_remote_name: Remote name for LXD image to use.
+    :param image_remote_protocol: Remote protoocl for LXD image to use.
+    :param instance: Specific AsyncLXDInstance to use, rather than create.
+    :param lxc: Asynchronous LXC client API.
+    :param lxd: LXD server API.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote for instance to run on.
+    :param use_ephemeral_instances: Set instances to be ephemeral (clean on
+        shutdown).
+    :param use_intermediate_instances: Create intermediate instances to speedup
+        setup of future instances.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        *,
+        image: images.Image,
+        instance_name: str,
+        auto_clean: bool = True,
+        image_remote_addr: str = "https://cloud-images.ubuntu.com/buildd/releases",
+        image_remote_name: str = "ubuntu-buildd",
+        image_remote_protocol: str = "simplestreams",
+        instance: Optional[AsyncLXDInstance] = None,
+        lxc: Optional[AsyncLXC] = None,
+        lxd: Optional[LXD] = None,
+        project: str = "default",
+        remote: str = "local",
+        use_ephemeral_instances: bool = True,
+        use_intermediate_image: bool = True,
+    ):
+        self.image = image
+        self.instance_name = instance_name
+
+        self.image_remote_addr = image_remote_addr
+        self.image_remote_name = image_remote_name
+        self.image_remote_protocol = image_remote_protocol
+        self.instance = instance
+        self.auto_clean = auto_clean
+
+        if lxc is None:
+            self.lxc = AsyncLXC()
+        else:
+            self.lxc = lxc
+
+        if lxd is None:
+            self.lxd = LXD()
+        else:
+            self.lxd = lxd
+
+        self.project = project
+        self.remote = remote
+        self.use_ephemeral_instances = use_ephemeral_instances
+        self.use_intermediate_image = use_intermediate_image
+
+        # Cleared if image aliases cannot be resolved directly on the remote.
+        self._image_alias_get_supported = True
+
+    async def __aenter__(self) -> "AsyncLXDProvider":
+        """Launch environment, performing any required setup."""
+        await self.setup()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Non-destructive tear-down of environment."""
+        await self.teardown()
+
+    async def setup(self) -> AsyncLXDInstance:
+        """Create, start, and configure instance as necessary.
+
+        :returns: Asynchronous LXD instance.
+
+        :raises IncompatibleInstanceError: If incompatible and clean is disabled.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.lxd.setup)
+        self.lxc.setup()
+
+        await self._setup_image_remote()
+
+        if self.use_intermediate_image:
+            intermediate_image, cleanup = await self._setup_intermediate_image()
+            try:
+                self.instance = await self._setup_instance(
+                    instance=self.instance_name,
+                    image=intermediate_image,
+                    image_remote=self.remote,
+                    ephemeral=self.use_ephemeral_instances,
+                )
+            finally:
+                if cleanup is not None:
+                    await self._wait_cleanup(cleanup)
+        else:
+            self.instance = await self._setup_instance(
+                instance=self.instance_name,
+                image=self.image.name,
+                image_remote=self.image_remote_name,
+                ephemeral=self.use_ephemeral_instances,
+            )
+
+        return self.instance
+
+    async def _setup_image_remote(self) -> None:
+        """Add a public remote."""
+        remotes = await self.lxc.remote_list()
+        remote = remotes.get(self.image_remote_name)
+
+        # Ensure remote configuration matches.
+        if remote is not None:
+            if (
+                remote.get("addr") != self.image_remote_addr
+                and remote.get("protocol") != self.image_remote_protocol
+            ):
+                raise RuntimeError(
+                    f"Remote configuration does not match for {self.remote!r}."
+                )
+            return
+
+        await self.lxc.remote_add(
+            remote=self.image_remote_name,
+            addr=self.image_remote_addr,
+            protocol=self.image_remote_protocol,
+        )
+
+    async def _setup_image(self, *, lxd_instance: AsyncLXDInstance) -> None:
+        """Run image setup against a synchronous executor for the instance."""
+        executor = LXDInstance(
+            name=lxd_instance.name,
+            project=lxd_instance.project,
+            remote=lxd_instance.remote,
+            lxc=LXC(lxc_path=self.lxc.lxc_path),
+        )
+
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.image.setup(executor=executor)
+        )
+
+    async def _setup_existing_instance(self, *, lxd_instance: AsyncLXDInstance) -> None:
+        try:
+            await self._setup_image(lxd_instance=lxd_instance)
+        except images.CompatibilityError as error:
+            if self.auto_clean:
+                logger.warning(
+                    "Cleaning incompatible instance '%s' (%s).",
+                    lxd_instance.name,
+                    error.reason,
+                )
+                await lxd_instance.delete(force=True)
+            else:
+                raise error
+
+    async def _setup_instance(
+        self,
+        *,
+        instance: str,
+        image: str,
+        image_remote: str,
+        ephemeral: bool,
+    ) -> AsyncLXDInstance:
+        lxd_instance = AsyncLXDInstance(
+            name=instance,
+            project=self.project,
+            remote=self.remote,
+            lxc=self.lxc,
+        )
+
+        # If instance already exists, special case it
+        # to ensure the instance is cleaned if incompatible.
+        if await lxd_instance.exists():
+            await self._setup_existing_instance(lxd_instance=lxd_instance)
+
+        if not await lxd_instance.exists():
+            await lxd_instance.launch(
+                image=image,
+                image_remote=image_remote,
+                ephemeral=ephemeral,
+            )
+
+        return lxd_instance
+
+    async def _find_image(self, alias: str) -> Optional[str]:
+        """Find image with alias on the instance's remote.
+
+        Each alias is resolved directly, on every call, so an image deleted
+        since the last call is not found.  Only if that is unsupported are
+        all images listed, to index their aliases.
+
+        :param alias: Image alias.
+
+        :returns: Image fingerprint, if found, else None.
+        """
+        if self._image_alias_get_supported:
+            try:
+                record = await self.lxc.image_alias_get(
+                    alias=alias, project=self.project, remote=self.remote
+                )
+            except (subprocess.CalledProcessError, LXDAPIError) as error:
+                logger.debug("Failed to get image alias %r: %s", alias, error)
+                self._image_alias_get_supported = False
+            else:
+                return None if record is None else record["target"]
+
+        image_aliases = await self._index_image_aliases()
+        return image_aliases.get(alias)
+
+    async def _index_image_aliases(self) -> Dict[str, str]:
+        """Index aliases of all images on the instance's remote.
+
+        :returns: Dictionary of alias to image fingerprint.
+        """
+        images = await self.lxc.image_records(project=self.project, remote=self.remote)
+        return {
+            image_alias: image.fingerprint
+            for image in images
+            for image_alias in image.aliases
+        }
+
+    async def _setup_intermediate_image(
+        self,
+    ) -> Tuple[str, Optional["asyncio.Task[None]"]]:
+        """Ensure intermediate image exists.
+
+        :returns: Tuple of intermediate image name and the task deleting the
+            intermediate instance, if any, which runs in the background.
+        """
+        intermediate_name = "-".join(
+            [
+                self.image_remote_name,
+                f"r{self.image.compatibility_tag}",
+            ]
+        )
+
+        if await self._find_image(intermediate_name) is not None:
+            logger.info("Using intermediate image.")
+            return intermediate_name, None
+
+        # Intermediate instances cannot be ephemeral. Publishing may fail.
+        intermediate_instance = await self._setup_instance(
+            instance=intermediate_name,
+            image=self.image.name,
+            image_remote=self.image_remote_name,
+            ephemeral=False,
+        )
+
+        # Publish intermediate image.
+        await self.lxc.publish(
+            alias=intermediate_name,
+            instance=intermediate_name,
+            project=self.project,
+            remote=self.remote,
+            force=True,
+        )
+
+        # Nuke it, while the caller gets on with launching from the image.
+        cleanup = asyncio.ensure_future(intermediate_instance.delete(force=True))
+        return intermediate_name, cleanup
+
+    @staticmethod
+    async def _wait_cleanup(cleanup: "asyncio.Task[None]") -> None:
+        """Wait for intermediate instance to be deleted.
+
+        Failure is logged rather than raised, as the image it was published
+        to is usable, and to not replace any error raised during setup.
+        """
+        try:
+            await cleanup
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning("Failed to delete intermediate instance: %s", error)
+
+    async def teardown(self, *, clean: bool = False) -> None:
+        """Tear down environment.
+
+        :param clean: Purge environment if True.
+        """
+        if self.instance is None:
+            return
+
+        if not await self.instance.exists():
+            return
+
+        if await self.instance.is_running():
+            await self.instance.stop()
+
+        if clean:
+            await self.instance.delete(force=True)
@@ -0,0 +1,36 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""LXD errors."""
+
+
+class LXDAPIError(Exception):
+    """Error reported by the LXD API.
+
+    :param error: Error message returned by LXD.
+    :param error_code: HTTP-style error code returned by LXD.
+    """
+
+    def __init__(self, error: str, error_code: int) -> None:
+        super().__init__()
+        self.error = error
+        self.error_code = error_code
+
+    def __repr__(self) -> str:
+        """Return representation."""
+        return f"LXDAPIError(error={self.error!r}, error_code={self.error_code!r})"
+
+    def __str__(self) -> str:
+        """Return string representation."""
+        return f"{self.error} (code {self.error_code})"
@@ -0,0 +1,130 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Coalesced instance configuration."""
+import logging
+import pathlib
+from typing import Callable, Dict, Optional
+
+from .lxc import LXC
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceConfigTransaction:
+    """Collect config keys and disk devices to apply in a single request.
+
+    Committed with one PATCH of the instance, or folded into the instance's
+    launch (see LXDInstance.launch()).  Used as a context manager, changes
+    are committed on exit unless an exception was raised.
+
+    :param lxc: LXC client API.
+    :param instance: Name of instance.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote.
+    :param on_commit: Callable to call before changes are applied, e.g. to
+        invalidate cached instance state.
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc: LXC,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        on_commit: Optional[Callable[[], None]] = None,
+    ):
+        self.lxc = lxc
+        self.instance = instance
+        self.project = project
+        self.remote = remote
+        self.on_commit = on_commit
+
+        self.config: Dict[str, str] = {}
+        self.devices: Dict[str, Dict[str, str]] = {}
+
+    def __enter__(self) -> "InstanceConfigTransaction":
+        """Start collecting changes."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Commit changes, unless an exception was raised."""
+        if exc_type is None:
+            self.commit()
+
+    def add_disk(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        device_name: Optional[str] = None,
+    ) -> "InstanceConfigTransaction":
+        """Add disk device mounting host source at instance destination.
+
+        :param source: Host path to mount.
+        :param destination: Instance path to mount to.
+        :param device_name: Name of device, defaults to one derived from
+            destination, as for LXC.config_device_add_disk().
+
+        :returns: This transaction.
+        """
+        if device_name is None:
+            device_name = destination.as_posix().replace("/", "_")
+
+        self.devices[device_name] = {
+            "type": "disk",
+            "source": source.as_posix(),
+            "path": destination.as_posix(),
+        }
+        return self
+
+    def set_config(self, key: str, value: str) -> "InstanceConfigTransaction":
+        """Set instance configuration key.
+
+        :param key: Configuration key.
+        :param value: Configuration value.
+
+        :returns: This transaction.
+        """
+        self.config[key] = value
+        return self
+
+    def clear(self) -> None:
+        """Discard collected changes."""
+        self.config = {}
+        self.devices = {}
+
+    def commit(self) -> None:
+        """Apply collected changes to existing instance, in a single request."""
+        if not self.config and not self.devices:
+            return
+
+        logger.debug(
+            "Applying %d config keys and %d devices to %r.",
+            len(self.config),
+            len(self.devices),
+            self.instance,
+        )
+        if self.on_commit is not None:
+            self.on_commit()
+
+        self.lxc.config_patch(
+            instance=self.instance,
+            config=self.config,
+            devices=self.devices,
+            project=self.project,
+            remote=self.remote,
+        )
+        self.clear()
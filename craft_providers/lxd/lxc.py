@@ -13,32 +13,116 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """LXC wrapper."""
+import concurrent.futures
+import json
 import logging
 import pathlib
+import re
 import shlex
-import shutil
 import subprocess
-from typing import Any, Dict, List, Optional
-
-import yaml
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
 
+from .errors import LXDAPIError
+from .lxc_commands import LXCCommands
+from .lxd_operation import LXDOperation
+from .records import DiskDevice, ImageRecord, InstanceState
 from .yaml_loader import _load_yaml
 
 logger = logging.getLogger(__name__)
 
 
-class LXC:  # pylint: disable=too-many-public-methods
-    """Wrapper for lxc."""
+class PurgeReport(NamedTuple):
+    """Outcome of deleting a set of instances or images.
 
-    def __init__(
-        self,
-        *,
-        lxc_path: pathlib.Path = pathlib.Path("/snap/bin/lxc"),
-    ):
-        if lxc_path is None:
-            self.lxc_path: pathlib.Path = pathlib.Path("lxc")
-        else:
-            self.lxc_path = lxc_path
+    :param deleted: Names of deleted objects.
+    :param failed: Names of objects which could not be deleted, mapped to
+        the last error.
+    :param elapsed: Wall time, in seconds.
+    """
+
+    deleted: List[str]
+    failed: Dict[str, str]
+    elapsed: float
+
+    def merge(self, other: "PurgeReport") -> "PurgeReport":
+        """Combine with another report, e.g. of a following step.
+
+        :returns: Combined report.
+        """
+        return PurgeReport(
+            deleted=self.deleted + other.deleted,
+            failed={**self.failed, **other.failed},
+            elapsed=self.elapsed + other.elapsed,
+        )
+
+
+def _delete_all(
+    delete: Callable[[str], None],
+    names: Iterable[str],
+    *,
+    workers: int,
+    retries: int,
+    retry_delay: float = 1.0,
+) -> PurgeReport:
+    """Delete objects using a bounded pool of workers.
+
+    :param delete: Callable deleting a single object by name.
+    :param names: Names of objects to delete.
+    :param workers: Maximum number of concurrent deletions.
+    :param retries: Number of times to retry a failed deletion.
+    :param retry_delay: Seconds to wait before the first retry, doubled for
+        each following retry.
+
+    :returns: Report of deleted and failed objects.
+    """
+    start = time.monotonic()
+
+    def delete_with_retries(name: str) -> Optional[str]:
+        delay = retry_delay
+        last_error = ""
+        for attempt in range(retries + 1):
+            try:
+                delete(name)
+                return None
+            except (subprocess.CalledProcessError, LXDAPIError) as error:
+                logger.debug(
+                    "Failed to delete %r (attempt %d): %s", name, attempt, error
+                )
+                last_error = str(error)
+
+            if attempt < retries:
+                time.sleep(delay)
+                delay *= 2
+
+        return last_error
+
+    deleted: List[str] = []
+    failed: Dict[str, str] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(delete_with_retries, name): name for name in names}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            error = future.result()
+            if error is None:
+                deleted.append(name)
+            else:
+                failed[name] = error
+
+    return PurgeReport(
+        deleted=sorted(deleted), failed=failed, elapsed=time.monotonic() - start
+    )
+
+
+class LXC(LXCCommands):  # pylint: disable=too-many-public-methods
+    """Wrapper for lxc.
+
+    :param lxc_path: Path to lxc.
+    :param metrics: Metrics to record subcommand latency to, defaults to the
+        metrics shared by all clients in this process.
+    :param trace: Recorder to capture every completed invocation to, e.g. for
+        replay with write_replay_stub().
+    """
 
     def _run(  # pylint: disable=redefined-builtin
         self,
@@ -51,11 +135,9 @@ class LXC:  # pylint: disable=too-many-public-methods
         stderr=subprocess.STDOUT,
     ) -> subprocess.CompletedProcess:
         """Execute command in instance, allowing output to console."""
-        command = [str(self.lxc_path), "--project", project, *command]
-        quoted = " ".join([shlex.quote(c) for c in command])
-
-        logger.warning("Executing on host: %s", quoted)
+        command = self._host_command(command=command, project=project)
 
+        start = time.monotonic()
         try:
             if input is not None:
                 proc = subprocess.run(
@@ -66,11 +148,87 @@ class LXC:  # pylint: disable=too-many-public-methods
                     command, check=check, stderr=stderr, stdout=stdout
                 )
         except subprocess.CalledProcessError as error:
+            self._record(
+                command=command,
+                start=start,
+                returncode=error.returncode,
+                stdout=error.output,
+                stderr=error.stderr,
+            )
             logger.warning("Failed to execute: %s", error.output)
             raise error
 
+        self._record(
+            command=command,
+            start=start,
+            returncode=proc.returncode,
+            stdout=proc.stdout,
+            stderr=proc.stderr,
+        )
         return proc
 
+    def _is_missing(
+        self,
+        error: subprocess.CalledProcessError,
+        *,
+        kind: str,
+        project: str,
+        remote: str,
+    ) -> bool:
+        """Check if lxc query failed as the object queried does not exist.
+
+        If lxc does not say whether the object or its project is missing,
+        the project is queried.
+        """
+        missing = self._is_not_found(error, kind=kind)
+        if missing is not None:
+            return missing
+
+        proc = self._run(
+            command=self._project_get_command(project=project, remote=remote),
+            check=False,
+            stderr=subprocess.DEVNULL,
+        )
+        return proc.returncode == 0
+
+    def _start(self, *, command: List[str], project: str = "default") -> LXDOperation:
+        """Start command in background, reporting its output as progress."""
+        command = self._host_command(command=command, project=project)
+        quoted = " ".join([shlex.quote(c) for c in command])
+
+        def run(operation: LXDOperation) -> None:
+            start = time.monotonic()
+            proc = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+            operation.set_cancel_hook(proc.terminate)
+
+            assert proc.stdout is not None
+            output = []
+            for chunk in iter(lambda: proc.stdout.read1(4096), b""):  # type: ignore
+                output.append(chunk)
+                lines = [line for line in re.split(rb"[\r\n]", chunk) if line.strip()]
+                if lines:
+                    operation.set_progress(lines[-1].decode(errors="replace").strip())
+
+            returncode = proc.wait()
+            operation.set_cancel_hook(None)
+            self._record(
+                command=command,
+                start=start,
+                returncode=returncode,
+                stdout=b"".join(output),
+            )
+
+            if returncode != 0:
+                error = subprocess.CalledProcessError(
+                    returncode, command, output=b"".join(output)
+                )
+                logger.warning("Failed to execute: %s", error.output)
+                raise error
+
+        return LXDOperation(description=quoted).start(run)
+
     def config_device_add_disk(
         self,
         *,
@@ -82,20 +240,14 @@ class LXC:  # pylint: disable=too-many-public-methods
         remote: str = "local",
     ) -> None:
         """Mount host source directory to target mount point."""
-        if device_name is None:
-            device_name = destination.as_posix().replace("/", "_")
-
         self._run(
-            command=[
-                "config",
-                "device",
-                "add",
-                f"{remote}:{instance}",
-                device_name,
-                "disk",
-                f"source={source.as_posix()}",
-                f"path={destination.as_posix()}",
-            ],
+            command=self._config_device_add_disk_command(
+                instance=instance,
+                source=source,
+                destination=destination,
+                device_name=device_name,
+                remote=remote,
+            ),
             project=project,
         )
 
@@ -104,12 +256,48 @@ class LXC:  # pylint: disable=too-many-public-methods
     ) -> Dict[str, Any]:
         """Show device config."""
         proc = self._run(
-            command=["config", "device", "show", f"{remote}:{instance}"],
+            command=self._config_device_show_command(instance=instance, remote=remote),
             project=project,
         )
 
         return _load_yaml(proc.stdout)
 
+    def config_device_disks(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> List[DiskDevice]:
+        """Get disk devices configured for instance."""
+        devices = self.config_device_show(
+            instance=instance, project=project, remote=remote
+        )
+
+        return self._disk_devices(devices)
+
+    def config_patch(
+        self,
+        *,
+        instance: str,
+        config: Optional[Dict[str, str]] = None,
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Apply config keys and devices to instance in a single request.
+
+        Keys and devices which are not given are left unchanged.  A device
+        with the name of an existing device replaces it.
+        """
+        command = self._config_patch_command(
+            instance=instance,
+            config=config,
+            devices=devices,
+            project=project,
+            remote=remote,
+        )
+        if command is None:
+            return
+
+        self._run(command=command, project=project)
+
     def config_set(
         self,
         *,
@@ -121,7 +309,9 @@ class LXC:  # pylint: disable=too-many-public-methods
     ) -> None:
         """Set instance configuration key."""
         self._run(
-            command=["config", "set", f"{remote}:{instance}", key, value],
+            command=self._config_set_command(
+                instance=instance, key=key, value=value, remote=remote
+            ),
             project=project,
         )
 
@@ -134,41 +324,59 @@ class LXC:  # pylint: disable=too-many-public-methods
         force=False,
     ) -> None:
         """Delete instance."""
-        command = ["delete", f"{remote}:{instance}"]
-
-        if force:
-            command.append("--force")
-
-        self._run(command=command, project=project)
+        self._run(
+            command=self._delete_command(instance=instance, remote=remote, force=force),
+            project=project,
+        )
 
-    def _formulate_command(
+    def begin_delete(
         self,
         *,
-        command: List[str],
         instance: str,
-        cwd: str = "/root",
-        mode: str = "auto",
         project: str = "default",
         remote: str = "local",
-    ) -> List[str]:
-        """Formulate command to run."""
-        final_cmd = [
-            str(self.lxc_path),
-            "--project",
-            project,
-            "exec",
-            f"{remote}:{instance}",
-        ]
-
-        if cwd != "/root":
-            final_cmd.extend(["--cwd", cwd])
-
-        if mode != "auto":
-            final_cmd.extend(["--mode", mode])
+        force=False,
+    ) -> LXDOperation:
+        """Start deleting instance.
 
-        final_cmd.extend(["--", *command])
+        :returns: Operation handle.
+        """
+        return self._start(
+            command=self._delete_command(instance=instance, remote=remote, force=force),
+            project=project,
+        )
 
-        return final_cmd
+    def delete_many(
+        self,
+        *,
+        instances: Iterable[str],
+        project: str = "default",
+        remote: str = "local",
+        force: bool = False,
+        workers: int = 8,
+        retries: int = 2,
+    ) -> PurgeReport:
+        """Delete instances concurrently, retrying failed deletions.
+
+        Unlike delete(), failures are reported rather than raised.
+
+        :param instances: Names of instances to delete.
+        :param project: Name of LXD project.
+        :param remote: Name of LXD remote.
+        :param force: Delete running instances.
+        :param workers: Maximum number of concurrent deletions.
+        :param retries: Number of times to retry each failed deletion.
+
+        :returns: Report of deleted and failed instances.
+        """
+        return _delete_all(
+            lambda instance: self.delete(
+                instance=instance, project=project, remote=remote, force=force
+            ),
+            instances,
+            workers=workers,
+            retries=retries,
+        )
 
     def exec(
         self,
@@ -182,7 +390,11 @@ class LXC:  # pylint: disable=too-many-public-methods
         runner=subprocess.run,
         **kwargs,
     ):
-        """Execute command in instance with specified runner."""
+        """Execute command in instance with specified runner.
+
+        Metrics are recorded for runners which wait for the command to
+        complete (i.e. return a CompletedProcess).
+        """
         command = self._formulate_command(
             command=command,
             instance=instance,
@@ -195,7 +407,29 @@ class LXC:  # pylint: disable=too-many-public-methods
         quoted = " ".join([shlex.quote(c) for c in command])
         logger.warning("Executing in container: %s", quoted)
 
-        return runner(command, **kwargs)  # pylint: disable=subprocess-run-check
+        start = time.monotonic()
+        try:
+            proc = runner(command, **kwargs)  # pylint: disable=subprocess-run-check
+        except subprocess.CalledProcessError as error:
+            self._record(
+                command=command,
+                start=start,
+                returncode=error.returncode,
+                stdout=error.output,
+                stderr=error.stderr,
+            )
+            raise
+
+        if isinstance(proc, subprocess.CompletedProcess):
+            self._record(
+                command=command,
+                start=start,
+                returncode=proc.returncode,
+                stdout=proc.stdout,
+                stderr=proc.stderr,
+            )
+
+        return proc
 
     def file_pull(
         self,
@@ -209,21 +443,15 @@ class LXC:  # pylint: disable=too-many-public-methods
         remote: str = "local",
     ) -> None:
         """Retrieve file from instance."""
-        command = [
-            "file",
-            "pull",
-            f"{remote}:{instance}{source.as_posix()}",
-            destination.as_posix(),
-        ]
-
-        if create_dirs:
-            command.append("--create-dirs")
-
-        if recursive:
-            command.append("--recursive")
-
         self._run(
-            command=command,
+            command=self._file_pull_command(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                remote=remote,
+            ),
             project=project,
         )
 
@@ -242,30 +470,18 @@ class LXC:  # pylint: disable=too-many-public-methods
         remote: str = "local",
     ) -> None:
         """Create file with content and file mode."""
-        command = [
-            "file",
-            "push",
-            source.as_posix(),
-            f"{remote}:{instance}{destination.as_posix()}",
-        ]
-
-        if create_dirs:
-            command.append("--create-dirs")
-
-        if recursive:
-            command.append("--recursive")
-
-        if mode:
-            command.append(f"--mode={mode}")
-
-        if gid != "-1":
-            command.append(f"--gid={gid}")
-
-        if uid != "-1":
-            command.append(f"--uid={gid}")
-
         self._run(
-            command=command,
+            command=self._file_push_command(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                gid=gid,
+                uid=uid,
+                mode=mode,
+                remote=remote,
+            ),
             project=project,
         )
 
@@ -273,12 +489,34 @@ class LXC:  # pylint: disable=too-many-public-methods
         self, *, project: str = "default", remote: str = "local"
     ) -> Dict[str, Any]:
         """Get server config that instance is running on."""
-        proc = self._run(
-            command=["info", remote + ":"],
-            project=project,
-        )
+        proc = self._run(command=self._info_command(remote=remote), project=project)
         return _load_yaml(proc.stdout)
 
+    def instance_get(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get instance configuration and status.
+
+        Unlike list(), which filters all instances by name prefix, only the
+        named instance is queried.
+
+        :returns: Instance information if instance exists, else None.
+        """
+        try:
+            proc = self._run(
+                command=self._instance_get_command(
+                    instance=instance, project=project, remote=remote
+                ),
+                project=project,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as error:
+            if self._is_missing(error, kind="instance", project=project, remote=remote):
+                return None
+            raise error
+
+        return json.loads(proc.stdout)
+
     def launch(
         self,
         *,
@@ -289,21 +527,87 @@ class LXC:  # pylint: disable=too-many-public-methods
         ephemeral: bool = False,
         project: str = "default",
         remote: str = "local",
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        profiles: Optional[List[str]] = None,
     ) -> None:
-        """Launch instance."""
-        command = [
-            "launch",
-            f"{image_remote}:{image}",
-            f"{remote}:{instance}",
-        ]
+        """Launch instance.
 
-        if ephemeral:
-            command.append("--ephemeral")
+        :param devices: Devices to create instance with, passed to lxc as
+            instance configuration on stdin.
+        :param profiles: Profiles to apply, in place of the default profile.
+        """
+        self._run(
+            command=self._launch_command(
+                config_keys=config_keys,
+                image=image,
+                image_remote=image_remote,
+                instance=instance,
+                ephemeral=ephemeral,
+                remote=remote,
+                profiles=profiles,
+            ),
+            project=project,
+            input=self._launch_input(devices),
+        )
 
-        for config_key in [f"{k}={v}" for k, v in config_keys.items()]:
-            command.extend(["--config", config_key])
+    def begin_launch(
+        self,
+        *,
+        config_keys: Dict[str, str],
+        image: str,
+        image_remote: str,
+        instance: str,
+        ephemeral: bool = False,
+        project: str = "default",
+        remote: str = "local",
+        profiles: Optional[List[str]] = None,
+    ) -> LXDOperation:
+        """Start launching instance.
 
-        self._run(command=command, project=project)
+        :param profiles: Profiles to apply, in place of the default profile.
+
+        :returns: Operation handle.
+        """
+        return self._start(
+            command=self._launch_command(
+                config_keys=config_keys,
+                image=image,
+                image_remote=image_remote,
+                instance=instance,
+                ephemeral=ephemeral,
+                remote=remote,
+                profiles=profiles,
+            ),
+            project=project,
+        )
+
+    def image_alias_get(
+        self, *, alias: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get image alias.
+
+        Unlike image_list(), which lists all images, only the named alias is
+        queried.
+
+        :returns: Alias information, including the image fingerprint as
+            "target", if alias exists, else None.
+        """
+        try:
+            proc = self._run(
+                command=self._image_alias_get_command(
+                    alias=alias, project=project, remote=remote
+                ),
+                project=project,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as error:
+            if self._is_missing(
+                error, kind="image alias", project=project, remote=remote
+            ):
+                return None
+            raise error
+
+        return json.loads(proc.stdout)
 
     def image_copy(
         self,
@@ -316,13 +620,29 @@ class LXC:  # pylint: disable=too-many-public-methods
     ) -> None:
         """Copy image."""
         self._run(
-            command=[
-                "image",
-                "copy",
-                f"{image_remote}:{image}",
-                f"{remote}:",
-                f"--alias={alias}",
-            ],
+            command=self._image_copy_command(
+                image=image, image_remote=image_remote, alias=alias, remote=remote
+            ),
+            project=project,
+        )
+
+    def begin_image_copy(
+        self,
+        *,
+        image: str,
+        image_remote: str,
+        alias: str,
+        project: str = "default",
+        remote: str = "local",
+    ) -> LXDOperation:
+        """Start copying image.
+
+        :returns: Operation handle.
+        """
+        return self._start(
+            command=self._image_copy_command(
+                image=image, image_remote=image_remote, alias=alias, remote=remote
+            ),
             project=project,
         )
 
@@ -331,24 +651,57 @@ class LXC:  # pylint: disable=too-many-public-methods
     ) -> None:
         """Delete image."""
         self._run(
-            command=[
-                "image",
-                "delete",
-                f"{remote}:{image}",
-            ],
+            command=self._image_delete_command(image=image, remote=remote),
             project=project,
         )
 
+    def image_delete_many(
+        self,
+        *,
+        images: Iterable[str],
+        project: str = "default",
+        remote: str = "local",
+        workers: int = 8,
+        retries: int = 2,
+    ) -> PurgeReport:
+        """Delete images concurrently, retrying failed deletions.
+
+        Unlike image_delete(), failures are reported rather than raised.
+
+        :param images: Aliases or fingerprints of images to delete.
+        :param project: Name of LXD project.
+        :param remote: Name of LXD remote.
+        :param workers: Maximum number of concurrent deletions.
+        :param retries: Number of times to retry each failed deletion.
+
+        :returns: Report of deleted and failed images.
+        """
+        return _delete_all(
+            lambda image: self.image_delete(
+                image=image, project=project, remote=remote
+            ),
+            images,
+            workers=workers,
+            retries=retries,
+        )
+
     def image_list(
         self, *, project: str = "default", remote: str = "local"
     ) -> List[Dict[str, Any]]:
         """List instances."""
         proc = self._run(
-            command=["image", "list", f"{remote}:", "--format=yaml"],
-            project=project,
+            command=self._image_list_command(remote=remote), project=project
         )
 
-        return _load_yaml(proc.stdout)
+        return json.loads(proc.stdout)
+
+    def image_records(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[ImageRecord]:
+        """List images as typed records."""
+        images = self.image_list(project=project, remote=remote)
+
+        return [ImageRecord(image) for image in images]
 
     def list(
         self,
@@ -358,18 +711,63 @@ class LXC:  # pylint: disable=too-many-public-methods
         remote: str = "local",
     ) -> List[Dict[str, Any]]:
         """List instances."""
-        command = ["list", "--format=yaml"]
-        if instance is None:
-            instance = ""
+        proc = self._run(
+            command=self._list_command(instance=instance, remote=remote),
+            project=project,
+        )
 
-        command.append(f"{remote}:{instance}")
+        return json.loads(proc.stdout)
 
-        proc = self._run(
-            command=command,
+    def instance_states(
+        self,
+        *,
+        instance: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> List[InstanceState]:
+        """List instances as typed records."""
+        instances = self.list(instance=instance, project=project, remote=remote)
+
+        return [InstanceState(i) for i in instances]
+
+    def monitor(
+        self,
+        *,
+        types: Iterable[str] = ("lifecycle", "operation"),
+        project: str = "default",
+        remote: str = "local",
+        **kwargs,
+    ) -> subprocess.Popen:
+        """Start monitoring events, with one JSON-encoded event per line.
+
+        :param types: Event types to monitor.
+        :param kwargs: Additional keyword arguments for subprocess.Popen().
+
+        :returns: Monitor process.
+        """
+        command = self._host_command(
+            command=[
+                "monitor",
+                f"{remote}:",
+                *[f"--type={t}" for t in types],
+                "--format=json",
+            ],
             project=project,
         )
 
-        return _load_yaml(proc.stdout)
+        return subprocess.Popen(command, **kwargs)
+
+    def profile_create(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Create profile."""
+        self._run(command=["profile", "create", f"{remote}:{profile}"], project=project)
+
+    def profile_delete(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Delete profile."""
+        self._run(command=["profile", "delete", f"{remote}:{profile}"], project=project)
 
     def profile_edit(
         self,
@@ -380,40 +778,74 @@ class LXC:  # pylint: disable=too-many-public-methods
         remote: str = "local",
     ) -> None:
         """Edit profile."""
-        encoded_config = yaml.dump(config).encode()
         self._run(
-            command=["profile", "edit", f"{remote}:{profile}"],
+            command=self._profile_edit_command(profile=profile, remote=remote),
             project=project,
-            input=encoded_config,
+            input=self._profile_input(config),
         )
 
+    def profile_get(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get profile.
+
+        Unlike profile_show(), a missing profile is not an error.
+
+        :returns: Profile configuration if profile exists, else None.
+        """
+        try:
+            proc = self._run(
+                command=self._profile_get_command(
+                    profile=profile, project=project, remote=remote
+                ),
+                project=project,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as error:
+            if self._is_missing(error, kind="profile", project=project, remote=remote):
+                return None
+            raise error
+
+        return json.loads(proc.stdout)
+
     def profile_show(
         self, *, profile: str, project: str = "default", remote: str = "local"
     ) -> Dict[str, Any]:
         """Get profile."""
         proc = self._run(
-            command=["profile", "show", f"{remote}:{profile}"], project=project
+            command=self._profile_show_command(profile=profile, remote=remote),
+            project=project,
         )
 
         return _load_yaml(proc.stdout)
 
+    def profile_list(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[Dict[str, Any]]:
+        """List profiles."""
+        proc = self._run(
+            command=["profile", "list", f"{remote}:", "--format=json"],
+            project=project,
+        )
+
+        return json.loads(proc.stdout)
+
     def project_create(self, *, project: str, remote: str = "local") -> None:
         """Create project."""
-        self._run(command=["project", "create", f"{remote}:{project}"])
+        self._run(command=self._project_create_command(project=project, remote=remote))
 
     def project_list(self, remote: str = "local") -> List[str]:
         """Get list of projects.
 
-        :returns: dictionary with remote name mapping to config.
+        :returns: Sorted list of project names.
         """
-        proc = self._run(command=["project", "list", remote, "--format=yaml"])
+        proc = self._run(command=self._project_list_command(remote=remote))
 
-        projects = _load_yaml(proc.stdout)
-        return sorted([p["name"] for p in projects])
+        return self._project_names(proc.stdout)
 
     def project_delete(self, *, project: str, remote: str = "local") -> None:
         """Delete project, if exists."""
-        self._run(command=["project", "delete", f"{remote}:{project}"])
+        self._run(command=self._project_delete_command(project=project, remote=remote))
 
     def publish(
         self,
@@ -425,46 +857,58 @@ class LXC:  # pylint: disable=too-many-public-methods
         remote: str = "local",
     ) -> None:
         """Create project."""
-        command = ["publish", "--alias", alias, f"{remote}:{instance}"]
-        if force:
-            command.append("--force")
-
         self._run(
-            command=command,
+            command=self._publish_command(
+                alias=alias, instance=instance, force=force, remote=remote
+            ),
+            project=project,
+        )
+
+    def begin_publish(
+        self,
+        *,
+        alias: str,
+        instance: str,
+        project: str,
+        force: bool = True,
+        remote: str = "local",
+    ) -> LXDOperation:
+        """Start publishing instance as image.
+
+        :returns: Operation handle.
+        """
+        return self._start(
+            command=self._publish_command(
+                alias=alias, instance=instance, force=force, remote=remote
+            ),
             project=project,
         )
 
     def remote_add(self, *, remote: str, addr: str, protocol: str) -> None:
         """Add a public remote."""
-        self._run(command=["remote", "add", remote, addr, f"--protocol={protocol}"])
+        self._run(
+            command=self._remote_add_command(
+                remote=remote, addr=addr, protocol=protocol
+            )
+        )
 
     def remote_list(self) -> Dict[str, Any]:
         """Get list of remotes.
 
         :returns: dictionary with remote name mapping to config.
         """
-        proc = self._run(command=["remote", "list", "--format=yaml"])
-
-        return _load_yaml(proc.stdout)
-
-    def setup(self) -> None:
-        """(Re)Setup lxc wrapper."""
-        if self.lxc_path.exists():
-            return
+        proc = self._run(command=self._remote_list_command())
 
-        lxc_path = shutil.which("lxc")
-        if lxc_path is None:
-            lxc_path = "/snap/bin/lxc"
-
-        self.lxc_path = pathlib.Path(lxc_path)
-        if not self.lxc_path.exists():
-            raise RuntimeError("lxc not found in PATH.")
+        return json.loads(proc.stdout)
 
     def start(
         self, *, instance: str, project: str = "default", remote: str = "local"
     ) -> None:
         """Start container."""
-        self._run(command=["start", f"{remote}:{instance}"], project=project)
+        self._run(
+            command=self._start_command(instance=instance, remote=remote),
+            project=project,
+        )
 
     def stop(
         self,
@@ -476,37 +920,79 @@ class LXC:  # pylint: disable=too-many-public-methods
         timeout: int = -1,
     ) -> None:
         """Stop container."""
-        command = ["stop", f"{remote}:{instance}"]
+        self._run(
+            command=self._stop_command(
+                instance=instance, remote=remote, force=force, timeout=timeout
+            ),
+            project=project,
+        )
 
-        if force:
-            command.append("--force")
 
-        if timeout != -1:
-            command.append(f"--timeout={timeout}")
+def purge_project(
+    *,
+    lxc: LXC,
+    project: str = "default",
+    remote: str = "local",
+    workers: int = 8,
+    retries: int = 2,
+) -> PurgeReport:
+    """Remove project and any associated bits.
 
-        self._run(command=command, project=project)
+    Instances, then images, are deleted concurrently.  The project is only
+    deleted if all of them were.
 
+    :param lxc: LXC client API.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote.
+    :param workers: Maximum number of concurrent deletions.
+    :param retries: Number of times to retry each failed deletion.
 
-def purge_project(*, lxc: LXC, project: str = "default", remote: str = "local") -> None:
-    """Remove project and any associated bits."""
+    :returns: Report of deleted and failed instances and images.
+    """
     # with contextlib.suppress(subprocess.CalledProcessError):
     projects = lxc.project_list(remote=remote)
     if project not in projects:
         logger.warning("Attempted to purge non-existent project '%s'.", project)
-        return
+        return PurgeReport(deleted=[], failed={}, elapsed=0.0)
 
     # Cleanup any outstanding instances.
-    for instance in lxc.list(project=project):
-        logger.warning("Deleting instance '%s'.", instance)
-        lxc.delete(
-            instance=instance["name"], project=project, remote=remote, force=True
-        )
+    instances = [i.name for i in lxc.instance_states(project=project, remote=remote)]
+    logger.warning("Deleting %d instances.", len(instances))
+    report = lxc.delete_many(
+        instances=instances,
+        project=project,
+        remote=remote,
+        force=True,
+        workers=workers,
+        retries=retries,
+    )
 
     # Cleanup any outstanding images.
-    for image in lxc.image_list(project=project):
-        logger.warning("Deleting image '%s'.", image)
-        lxc.image_delete(image=image["fingerprint"], project=project, remote=remote)
+    images = [i.fingerprint for i in lxc.image_records(project=project, remote=remote)]
+    logger.warning("Deleting %d images.", len(images))
+    report = report.merge(
+        lxc.image_delete_many(
+            images=images,
+            project=project,
+            remote=remote,
+            workers=workers,
+            retries=retries,
+        )
+    )
+
+    if report.failed:
+        for name, error in sorted(report.failed.items()):
+            logger.warning("Failed to delete '%s': %s", name, error)
+        logger.warning("Not deleting project '%s'.", project)
+        return report
 
     # Cleanup project.
     logger.warning("Deleting project '%s'.", project)
     lxc.project_delete(project=project, remote=remote)
+
+    logger.info(
+        "Purged %d instances and images in %.1fs.",
+        len(report.deleted),
+        report.elapsed,
+    )
+    return report
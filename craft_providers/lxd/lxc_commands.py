@@ -0,0 +1,509 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""lxc commands and output parsing, shared by the LXC wrappers."""
+import json
+import logging
+import pathlib
+import shlex
+import shutil
+import subprocess
+import time
+import urllib.parse
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from .lxc_metrics import LXCMetrics, get_lxc_metrics, subcommand_name
+from .lxc_trace import LXCTraceRecorder
+from .records import DiskDevice
+
+logger = logging.getLogger(__name__)
+
+
+class LXCCommands:
+    """Base of the lxc wrappers, building commands and parsing their output.
+
+    Subclasses run the commands, i.e. LXC blocks and AsyncLXC awaits them.
+
+    :param lxc_path: Path to lxc.
+    :param metrics: Metrics to record subcommand latency to, defaults to the
+        metrics shared by all clients in this process.
+    :param trace: Recorder to capture every completed invocation to, e.g. for
+        replay with write_replay_stub().
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc_path: pathlib.Path = pathlib.Path("/snap/bin/lxc"),
+        metrics: Optional[LXCMetrics] = None,
+        trace: Optional[LXCTraceRecorder] = None,
+    ):
+        if lxc_path is None:
+            self.lxc_path: pathlib.Path = pathlib.Path("lxc")
+        else:
+            self.lxc_path = lxc_path
+
+        if metrics is None:
+            self.metrics = get_lxc_metrics()
+        else:
+            self.metrics = metrics
+
+        self.trace = trace
+
+    def setup(self) -> None:
+        """(Re)Setup lxc wrapper."""
+        if self.lxc_path.exists():
+            return
+
+        lxc_path = shutil.which("lxc")
+        if lxc_path is None:
+            lxc_path = "/snap/bin/lxc"
+
+        self.lxc_path = pathlib.Path(lxc_path)
+        if not self.lxc_path.exists():
+            raise RuntimeError("lxc not found in PATH.")
+
+    def _host_command(self, *, command: List[str], project: str) -> List[str]:
+        """Prefix lxc subcommand with lxc and its global flags, logging it."""
+        command = [str(self.lxc_path), "--project", project, *command]
+        quoted = " ".join([shlex.quote(c) for c in command])
+
+        logger.warning("Executing on host: %s", quoted)
+        return command
+
+    def _record(
+        self,
+        *,
+        command: List[str],
+        start: float,
+        returncode: int,
+        stdout: Any,
+        stderr: Any = None,
+    ) -> None:
+        """Record metrics (and trace, if enabled) for completed lxc command.
+
+        :param command: Command, including lxc path and global flags.
+        :param start: Start time, from time.monotonic().
+        :param returncode: Exit code.
+        :param stdout: Captured stdout, if any.
+        :param stderr: Captured stderr, if any.
+        """
+        duration = time.monotonic() - start
+        name = subcommand_name(command[3:])
+        output_bytes = len(stdout) if isinstance(stdout, bytes) else 0
+
+        logger.debug("lxc %s completed in %.3fs (%d).", name, duration, returncode)
+        self.metrics.record(
+            name, duration=duration, returncode=returncode, output_bytes=output_bytes
+        )
+
+        if self.trace is not None:
+            self.trace.record(
+                args=command[1:],
+                returncode=returncode,
+                stdout=stdout,
+                stderr=stderr,
+                duration=duration,
+            )
+
+    def _formulate_command(
+        self,
+        *,
+        command: List[str],
+        instance: str,
+        cwd: str = "/root",
+        mode: str = "auto",
+        project: str = "default",
+        remote: str = "local",
+    ) -> List[str]:
+        """Formulate command to run."""
+        final_cmd = [
+            str(self.lxc_path),
+            "--project",
+            project,
+            "exec",
+            f"{remote}:{instance}",
+        ]
+
+        if cwd != "/root":
+            final_cmd.extend(["--cwd", cwd])
+
+        if mode != "auto":
+            final_cmd.extend(["--mode", mode])
+
+        final_cmd.extend(["--", *command])
+
+        return final_cmd
+
+    @staticmethod
+    def _query_command(
+        *,
+        endpoint: str,
+        project: str,
+        remote: str,
+        request: str = "GET",
+        data: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        command = ["query"]
+        if request != "GET":
+            command.append(f"--request={request}")
+        if data is not None:
+            command.append(f"--data={json.dumps(data)}")
+
+        query = urllib.parse.urlencode({"project": project})
+        command.append(f"{remote}:{endpoint}?{query}")
+        return command
+
+    @staticmethod
+    def _is_not_found(
+        error: subprocess.CalledProcessError, *, kind: str
+    ) -> Optional[bool]:
+        """Check if lxc query failed as the object queried does not exist.
+
+        lxc reports the API's error, e.g. "Error: Instance not found".  A
+        missing project is also reported as not found, so only an error
+        naming the kind of object queried is conclusive, not the bare "not
+        found" of older LXD.
+
+        :param error: Error of lxc query.
+        :param kind: Kind of object queried, as named by LXD, e.g. "instance".
+
+        :returns: True if object does not exist, False if query failed for
+            another reason, or None if the object or its project may not
+            exist.
+        """
+        lines = (error.stderr or b"").decode(errors="replace").strip().splitlines()
+        message = lines[-1].lower() if lines else ""
+        if message.startswith("error:"):
+            message = message[len("error:") :].strip()
+
+        if message.endswith(f"{kind} not found"):
+            return True
+
+        if message == "not found":
+            return None
+
+        return False
+
+    @classmethod
+    def _project_get_command(cls, *, project: str, remote: str) -> List[str]:
+        return cls._query_command(
+            endpoint="/1.0/projects/" + urllib.parse.quote(project, safe=""),
+            project="default",
+            remote=remote,
+        )
+
+    @staticmethod
+    def _config_device_add_disk_command(
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        device_name: Optional[str],
+        remote: str,
+    ) -> List[str]:
+        if device_name is None:
+            device_name = destination.as_posix().replace("/", "_")
+
+        return [
+            "config",
+            "device",
+            "add",
+            f"{remote}:{instance}",
+            device_name,
+            "disk",
+            f"source={source.as_posix()}",
+            f"path={destination.as_posix()}",
+        ]
+
+    @staticmethod
+    def _config_device_show_command(*, instance: str, remote: str) -> List[str]:
+        return ["config", "device", "show", f"{remote}:{instance}"]
+
+    @staticmethod
+    def _config_set_command(
+        *, instance: str, key: str, value: str, remote: str
+    ) -> List[str]:
+        return ["config", "set", f"{remote}:{instance}", key, value]
+
+    @staticmethod
+    def _disk_devices(devices: Dict[str, Any]) -> List[DiskDevice]:
+        return [
+            DiskDevice(name, device)
+            for name, device in devices.items()
+            if device.get("type") == "disk"
+        ]
+
+    @classmethod
+    def _config_patch_command(
+        cls,
+        *,
+        instance: str,
+        config: Optional[Dict[str, str]],
+        devices: Optional[Dict[str, Dict[str, str]]],
+        project: str,
+        remote: str,
+    ) -> Optional[List[str]]:
+        """Get command to patch instance, or None if there is nothing to do."""
+        data: Dict[str, Any] = {}
+        if config:
+            data["config"] = config
+        if devices:
+            data["devices"] = devices
+        if not data:
+            return None
+
+        return cls._query_command(
+            endpoint="/1.0/instances/" + urllib.parse.quote(instance, safe=""),
+            project=project,
+            remote=remote,
+            request="PATCH",
+            data=data,
+        )
+
+    @staticmethod
+    def _delete_command(*, instance: str, remote: str, force: bool) -> List[str]:
+        command = ["delete", f"{remote}:{instance}"]
+
+        if force:
+            command.append("--force")
+
+        return command
+
+    @staticmethod
+    def _file_pull_command(
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool,
+        recursive: bool,
+        remote: str,
+    ) -> List[str]:
+        command = [
+            "file",
+            "pull",
+            f"{remote}:{instance}{source.as_posix()}",
+            destination.as_posix(),
+        ]
+
+        if create_dirs:
+            command.append("--create-dirs")
+
+        if recursive:
+            command.append("--recursive")
+
+        return command
+
+    @staticmethod
+    def _file_push_command(
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool,
+        recursive: bool,
+        gid: str,
+        uid: str,
+        mode: Optional[str],
+        remote: str,
+    ) -> List[str]:
+        command = [
+            "file",
+            "push",
+            source.as_posix(),
+            f"{remote}:{instance}{destination.as_posix()}",
+        ]
+
+        if create_dirs:
+            command.append("--create-dirs")
+
+        if recursive:
+            command.append("--recursive")
+
+        if mode:
+            command.append(f"--mode={mode}")
+
+        if gid != "-1":
+            command.append(f"--gid={gid}")
+
+        if uid != "-1":
+            command.append(f"--uid={uid}")
+
+        return command
+
+    @staticmethod
+    def _info_command(*, remote: str) -> List[str]:
+        return ["info", remote + ":"]
+
+    @classmethod
+    def _instance_get_command(
+        cls, *, instance: str, project: str, remote: str
+    ) -> List[str]:
+        return cls._query_command(
+            endpoint="/1.0/instances/" + urllib.parse.quote(instance, safe=""),
+            project=project,
+            remote=remote,
+        )
+
+    @staticmethod
+    def _launch_command(
+        *,
+        config_keys: Dict[str, str],
+        image: str,
+        image_remote: str,
+        instance: str,
+        ephemeral: bool,
+        remote: str,
+        profiles: Optional[List[str]] = None,
+    ) -> List[str]:
+        command = [
+            "launch",
+            f"{image_remote}:{image}",
+            f"{remote}:{instance}",
+        ]
+
+        if ephemeral:
+            command.append("--ephemeral")
+
+        for profile in profiles or []:
+            command.extend(["--profile", profile])
+
+        for config_key in [f"{k}={v}" for k, v in config_keys.items()]:
+            command.extend(["--config", config_key])
+
+        return command
+
+    @staticmethod
+    def _launch_input(devices: Optional[Dict[str, Dict[str, str]]]) -> Optional[bytes]:
+        """Get instance configuration for lxc launch to read from stdin."""
+        if not devices:
+            return None
+
+        return yaml.dump({"devices": devices}).encode()
+
+    @classmethod
+    def _image_alias_get_command(
+        cls, *, alias: str, project: str, remote: str
+    ) -> List[str]:
+        return cls._query_command(
+            endpoint="/1.0/images/aliases/" + urllib.parse.quote(alias, safe=""),
+            project=project,
+            remote=remote,
+        )
+
+    @staticmethod
+    def _image_copy_command(
+        *, image: str, image_remote: str, alias: str, remote: str
+    ) -> List[str]:
+        return [
+            "image",
+            "copy",
+            f"{image_remote}:{image}",
+            f"{remote}:",
+            f"--alias={alias}",
+        ]
+
+    @staticmethod
+    def _image_delete_command(*, image: str, remote: str) -> List[str]:
+        return ["image", "delete", f"{remote}:{image}"]
+
+    @staticmethod
+    def _image_list_command(*, remote: str) -> List[str]:
+        return ["image", "list", f"{remote}:", "--format=json"]
+
+    @staticmethod
+    def _list_command(*, instance: Optional[str], remote: str) -> List[str]:
+        if instance is None:
+            instance = ""
+
+        return ["list", "--format=json", f"{remote}:{instance}"]
+
+    @staticmethod
+    def _profile_edit_command(*, profile: str, remote: str) -> List[str]:
+        return ["profile", "edit", f"{remote}:{profile}"]
+
+    @classmethod
+    def _profile_get_command(
+        cls, *, profile: str, project: str, remote: str
+    ) -> List[str]:
+        return cls._query_command(
+            endpoint="/1.0/profiles/" + urllib.parse.quote(profile, safe=""),
+            project=project,
+            remote=remote,
+        )
+
+    @staticmethod
+    def _profile_input(config: Dict[str, Any]) -> bytes:
+        """Get profile configuration for lxc profile edit to read from stdin."""
+        return yaml.dump(config).encode()
+
+    @staticmethod
+    def _profile_show_command(*, profile: str, remote: str) -> List[str]:
+        return ["profile", "show", f"{remote}:{profile}"]
+
+    @staticmethod
+    def _project_create_command(*, project: str, remote: str) -> List[str]:
+        return ["project", "create", f"{remote}:{project}"]
+
+    @staticmethod
+    def _project_delete_command(*, project: str, remote: str) -> List[str]:
+        return ["project", "delete", f"{remote}:{project}"]
+
+    @staticmethod
+    def _project_list_command(*, remote: str) -> List[str]:
+        return ["project", "list", f"{remote}:", "--format=json"]
+
+    @staticmethod
+    def _project_names(output: bytes) -> List[str]:
+        projects = json.loads(output)
+        return sorted([p["name"] for p in projects])
+
+    @staticmethod
+    def _publish_command(
+        *, alias: str, instance: str, force: bool, remote: str
+    ) -> List[str]:
+        command = ["publish", "--alias", alias, f"{remote}:{instance}"]
+        if force:
+            command.append("--force")
+
+        return command
+
+    @staticmethod
+    def _remote_add_command(*, remote: str, addr: str, protocol: str) -> List[str]:
+        return ["remote", "add", remote, addr, f"--protocol={protocol}"]
+
+    @staticmethod
+    def _remote_list_command() -> List[str]:
+        return ["remote", "list", "--format=json"]
+
+    @staticmethod
+    def _start_command(*, instance: str, remote: str) -> List[str]:
+        return ["start", f"{remote}:{instance}"]
+
+    @staticmethod
+    def _stop_command(
+        *, instance: str, remote: str, force: bool, timeout: int
+    ) -> List[str]:
+        command = ["stop", f"{remote}:{instance}"]
+
+        if force:
+            command.append("--force")
+
+        if timeout != -1:
+            command.append(f"--timeout={timeout}")
+
+        return command
@@ -0,0 +1,225 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Latency metrics for lxc subcommands."""
+import atexit
+import collections
+import math
+import random
+import sys
+import threading
+from typing import IO, Dict, List, NamedTuple, Optional
+
+# Durations kept per subcommand for percentiles, for memory to be bounded
+# in long-running processes.
+_MAX_SAMPLES = 1024
+
+# Subcommands which take a further subcommand, e.g. "image copy".
+_COMMAND_GROUPS = {
+    "alias",
+    "cluster",
+    "config",
+    "config device",
+    "file",
+    "image",
+    "image alias",
+    "network",
+    "profile",
+    "project",
+    "remote",
+    "storage",
+}
+
+
+def subcommand_name(command: List[str]) -> str:
+    """Get name of lxc subcommand, e.g. "config device show".
+
+    :param command: Arguments to lxc, excluding lxc and global flags.
+
+    :returns: Subcommand name.
+    """
+    name = command[0] if command else ""
+    for arg in command[1:]:
+        if name not in _COMMAND_GROUPS:
+            break
+        name = f"{name} {arg}"
+
+    return name
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    """Get nearest-rank percentile of ordered values."""
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class _Durations:
+    """Count, total and maximum of durations, with a uniform sample of them.
+
+    Samples are kept by reservoir sampling, so percentiles are exact up to
+    max_samples durations, and estimates beyond.
+
+    :param max_samples: Maximum number of durations kept.
+    """
+
+    def __init__(self, max_samples: int = _MAX_SAMPLES) -> None:
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+        self._random = random.Random(0)
+
+    def add(self, duration: float) -> None:
+        """Add a duration."""
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(duration)
+            return
+
+        index = self._random.randrange(self.count)
+        if index < self.max_samples:
+            self.samples[index] = duration
+
+
+class LXCCommandStats(NamedTuple):
+    """Aggregated metrics for an lxc subcommand.
+
+    :param calls: Number of times run.
+    :param failures: Number of times exiting non-zero.
+    :param total: Total wall time, in seconds.
+    :param p50: Median wall time, in seconds, estimated if more than 1024 calls.
+    :param p95: 95th percentile wall time, in seconds, estimated as for p50.
+    :param max: Maximum wall time, in seconds.
+    :param output_bytes: Total size of captured output.
+    """
+
+    calls: int
+    failures: int
+    total: float
+    p50: float
+    p95: float
+    max: float
+    output_bytes: int
+
+
+class LXCMetrics:
+    """Thread-safe recorder of lxc subcommand wall time, exit code and output."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._durations: Dict[str, _Durations] = collections.defaultdict(_Durations)
+        self._failures: Dict[str, int] = collections.defaultdict(int)
+        self._output_bytes: Dict[str, int] = collections.defaultdict(int)
+        self._dump_registered = False
+
+    def record(
+        self, subcommand: str, *, duration: float, returncode: int, output_bytes: int
+    ) -> None:
+        """Record a completed subcommand.
+
+        :param subcommand: Subcommand name, see subcommand_name().
+        :param duration: Wall time, in seconds.
+        :param returncode: Exit code.
+        :param output_bytes: Size of captured output.
+        """
+        with self._lock:
+            self._durations[subcommand].add(duration)
+            self._output_bytes[subcommand] += output_bytes
+            if returncode != 0:
+                self._failures[subcommand] += 1
+
+    def reset(self) -> None:
+        """Discard recorded metrics."""
+        with self._lock:
+            self._durations.clear()
+            self._failures.clear()
+            self._output_bytes.clear()
+
+    def summary(self) -> Dict[str, LXCCommandStats]:
+        """Get aggregated metrics.
+
+        :returns: Dictionary of subcommand name to its statistics.
+        """
+        with self._lock:
+            durations = {
+                k: (v.count, v.total, v.max, sorted(v.samples))
+                for k, v in self._durations.items()
+            }
+            failures = dict(self._failures)
+            output_bytes = dict(self._output_bytes)
+
+        return {
+            name: LXCCommandStats(
+                calls=count,
+                failures=failures.get(name, 0),
+                total=total,
+                p50=_percentile(ordered, 50),
+                p95=_percentile(ordered, 95),
+                max=maximum,
+                output_bytes=output_bytes.get(name, 0),
+            )
+            for name, (count, total, maximum, ordered) in durations.items()
+        }
+
+    def report(self) -> str:
+        """Format aggregated metrics as a table, slowest total first.
+
+        :returns: Report text.
+        """
+        summary = self.summary()
+        grand_total = sum(s.total for s in summary.values()) or 1.0
+
+        lines = [
+            f"{'subcommand':<24} {'calls':>6} {'fail':>5} {'total':>9} {'%':>5} "
+            f"{'p50':>8} {'p95':>8} {'max':>8} {'output':>10}"
+        ]
+        for name, stats in sorted(summary.items(), key=lambda i: -i[1].total):
+            lines.append(
+                f"{name:<24} {stats.calls:>6} {stats.failures:>5} "
+                f"{stats.total:>8.3f}s {100 * stats.total / grand_total:>5.1f} "
+                f"{stats.p50:>7.3f}s {stats.p95:>7.3f}s {stats.max:>7.3f}s "
+                f"{stats.output_bytes:>10}"
+            )
+
+        return "\n".join(lines)
+
+    def dump_at_exit(self, stream: Optional[IO[str]] = None) -> None:
+        """Write report to stream (default stderr) when the process exits.
+
+        :param stream: Stream to write report to.
+        """
+        with self._lock:
+            if self._dump_registered:
+                return
+            self._dump_registered = True
+
+        def dump() -> None:
+            if self._durations:
+                print(self.report(), file=stream or sys.stderr)
+
+        atexit.register(dump)
+
+
+_metrics = LXCMetrics()
+
+
+def get_lxc_metrics() -> LXCMetrics:
+    """Get the metrics shared by LXC clients which are not given their own.
+
+    :returns: Process-wide metrics.
+    """
+    return _metrics
@@ -0,0 +1,231 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Record and replay lxc invocations.
+
+Traces are JSON lines, one completed lxc invocation per line.  A trace
+recorded with LXC(trace=LXCTraceRecorder(...)) can be replayed by pointing
+LXC(lxc_path=...) at a stub created with write_replay_stub(), which answers
+each invocation with the recorded output, exit code and (scaled) latency.
+
+Repeated invocations with the same arguments are answered in recorded
+order, e.g. `list` before and after `launch`.  Arguments referring to
+temporary files are normalized, as their names differ between runs.
+"""
+import argparse
+import base64
+import fcntl
+import json
+import pathlib
+import shlex
+import sys
+import tempfile
+import threading
+import time
+from typing import IO, Any, Dict, List, Optional
+
+_TEMP_DIR = tempfile.gettempdir().rstrip("/") + "/"
+
+
+def _encode(data: Any) -> Optional[str]:
+    if not isinstance(data, bytes):
+        return None
+    return base64.b64encode(data).decode()
+
+
+def _decode(data: Optional[str]) -> bytes:
+    if data is None:
+        return b""
+    return base64.b64decode(data)
+
+
+def trace_key(args: List[str]) -> str:
+    """Get key to match invocation on, normalizing temporary file names.
+
+    :param args: Arguments to lxc.
+
+    :returns: Key for invocation.
+    """
+    normalized = ["<tmp>" if a.startswith(_TEMP_DIR) else a for a in args]
+    return json.dumps(normalized)
+
+
+class LXCTraceRecorder:
+    """Thread-safe recorder of lxc invocations to a trace file.
+
+    :param path: Path to trace file, appended to.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        *,
+        args: List[str],
+        returncode: int,
+        stdout: Any,
+        stderr: Any,
+        duration: float,
+    ) -> None:
+        """Record a completed invocation.
+
+        :param args: Arguments to lxc.
+        :param returncode: Exit code.
+        :param stdout: Captured stdout, if any.
+        :param stderr: Captured stderr, if any.
+        :param duration: Wall time, in seconds.
+        """
+        entry = {
+            "args": args,
+            "returncode": returncode,
+            "stdout": _encode(stdout),
+            "stderr": _encode(stderr),
+            "duration": duration,
+        }
+
+        with self._lock, self.path.open("a") as trace_file:
+            trace_file.write(json.dumps(entry) + "\n")
+
+
+def load_trace(path: pathlib.Path) -> Dict[str, List[Dict[str, Any]]]:
+    """Load trace, grouping invocations by key in recorded order.
+
+    :param path: Path to trace file.
+
+    :returns: Dictionary of invocation key to recorded invocations.
+    """
+    entries: Dict[str, List[Dict[str, Any]]] = {}
+    with path.open() as trace_file:
+        for line in trace_file:
+            if line.strip():
+                entry = json.loads(line)
+                entries.setdefault(trace_key(entry["args"]), []).append(entry)
+
+    return entries
+
+
+def replay(
+    args: List[str],
+    *,
+    trace_path: pathlib.Path,
+    state_path: pathlib.Path,
+    scale: float = 1.0,
+    stdout: Optional[IO[bytes]] = None,
+    stderr: Optional[IO[bytes]] = None,
+) -> int:
+    """Answer invocation from trace.
+
+    :param args: Arguments to lxc.
+    :param trace_path: Path to trace file.
+    :param state_path: Path to file tracking replayed invocations, shared by
+        the stub's invocations.
+    :param scale: Factor to scale recorded latency by, 0 to not sleep.
+    :param stdout: Stream to write recorded stdout to.
+    :param stderr: Stream to write recorded stderr to.
+
+    :returns: Recorded exit code, or 127 if invocation was not recorded.
+    """
+    if stdout is None:
+        stdout = sys.stdout.buffer
+    if stderr is None:
+        stderr = sys.stderr.buffer
+
+    key = trace_key(args)
+    entries = load_trace(trace_path).get(key)
+    if not entries:
+        stderr.write(f"lxc-replay: not recorded: {shlex.join(args)}\n".encode())
+        return 127
+
+    # Answer repeated invocations in recorded order, repeating the last.
+    with state_path.open("a+") as state_file:
+        fcntl.flock(state_file, fcntl.LOCK_EX)
+        state_file.seek(0)
+        state = json.loads(state_file.read() or "{}")
+        index = state.get(key, 0)
+        state[key] = index + 1
+        state_file.seek(0)
+        state_file.truncate()
+        state_file.write(json.dumps(state))
+
+    entry = entries[min(index, len(entries) - 1)]
+    if scale > 0:
+        time.sleep(entry["duration"] * scale)
+
+    stdout.write(_decode(entry["stdout"]))
+    stderr.write(_decode(entry["stderr"]))
+    return entry["returncode"]
+
+
+def write_replay_stub(
+    *,
+    trace_path: pathlib.Path,
+    stub_path: pathlib.Path,
+    scale: float = 1.0,
+    state_path: Optional[pathlib.Path] = None,
+) -> pathlib.Path:
+    """Write executable stub which replays trace, for use as lxc_path.
+
+    :param trace_path: Path to trace file.
+    :param stub_path: Path to write stub to.
+    :param scale: Factor to scale recorded latency by, 0 to not sleep.
+    :param state_path: Path to file tracking replayed invocations, defaults
+        to the stub path with a ".state" suffix.  Removed, to start replay
+        from the beginning of the trace.
+
+    :returns: Path to stub.
+    """
+    if state_path is None:
+        state_path = stub_path.with_suffix(".state")
+
+    if state_path.exists():
+        state_path.unlink()
+
+    package_root = pathlib.Path(__file__).resolve().parents[2]
+    command = [
+        sys.executable,
+        "-c",
+        f"import sys; from {__name__} import main; sys.exit(main())",
+        f"--trace={trace_path.resolve()}",
+        f"--state={state_path.resolve()}",
+        f"--scale={scale}",
+        "--",
+    ]
+    stub_path.write_text(
+        "#!/bin/sh\n"
+        f"PYTHONPATH={shlex.quote(str(package_root))}${{PYTHONPATH:+:$PYTHONPATH}} "
+        f'exec {" ".join(shlex.quote(c) for c in command)} "$@"\n'
+    )
+    stub_path.chmod(0o755)
+
+    return stub_path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Replay stub entry point."""
+    parser = argparse.ArgumentParser(description="Replay lxc invocations.")
+    parser.add_argument("--trace", type=pathlib.Path, required=True)
+    parser.add_argument("--state", type=pathlib.Path, required=True)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    parsed = parser.parse_args(argv)
+
+    args = parsed.args
+    if args and args[0] == "--":
+        args = args[1:]
+
+    return replay(
+        args, trace_path=parsed.trace, state_path=parsed.state, scale=parsed.scale
+    )
@@ -20,27 +20,60 @@ import shutil
 import subprocess
 from typing import Optional
 
+from .errors import LXDAPIError
+from .lxd_capabilities import LXDCapabilityCache
+
 logger = logging.getLogger(__name__)
 
 
 class LXD:
-    """LXD Interface."""
+    """LXD Interface.
+
+    :param lxd_path: Path to lxd executable.
+    :param capabilities: Cache of server capabilities to get the version of
+        a running server from, rather than running `lxd version`.
+    """
 
     def __init__(
         self,
         *,
         lxd_path: Optional[pathlib.Path] = None,
+        capabilities: Optional[LXDCapabilityCache] = None,
     ):
         if lxd_path is None:
             self.lxd_path = self._find_lxd()
         else:
             self.lxd_path = lxd_path
 
+        self.capabilities = capabilities
+
     def ensure_supported_version(self) -> None:
         """Ensure LXD meets minimum requirements.
 
         :raises RuntimeError: if unsupported.
         """
+        version = self._get_version()
+        version_components = version.split(".")
+        major_minor = ".".join([version_components[0], version_components[1]])
+        if float(major_minor) < 4.0:
+            raise RuntimeError(
+                "LXD version {version!r} is unsupported. Must be >= 4.0."
+            )
+
+    def _get_version(self) -> str:
+        """Get LXD version, from cached server capabilities if possible.
+
+        :returns: LXD version, e.g. "4.0.4".
+        """
+        if self.capabilities is not None and self.capabilities.identity():
+            try:
+                server_version = self.capabilities.get().server_version
+            except (subprocess.CalledProcessError, LXDAPIError) as error:
+                logger.debug("Failed to get LXD server version: %s", error)
+            else:
+                if server_version:
+                    return server_version
+
         proc = subprocess.run(
             [self.lxd_path, "version"],
             check=True,
@@ -48,13 +81,7 @@ class LXD:
             stderr=subprocess.PIPE,
         )
 
-        version = proc.stdout.decode().strip()
-        version_components = version.split(".")
-        major_minor = ".".join([version_components[0], version_components[1]])
-        if float(major_minor) < 4.0:
-            raise RuntimeError(
-                "LXD version {version!r} is unsupported. Must be >= 4.0."
-            )
+        return proc.stdout.decode().strip()
 
     def _find_lxd(self) -> pathlib.Path:
         """Find lxd executable.
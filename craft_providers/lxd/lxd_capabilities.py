@@ -0,0 +1,243 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk cache of LXD server capabilities."""
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..util import path
+from .lxc import LXC
+from .records import _Record
+
+logger = logging.getLogger(__name__)
+
+_CACHE_FORMAT = 1
+
+
+def _default_socket_path() -> pathlib.Path:
+    lxd_dir = os.environ.get("LXD_DIR")
+    if lxd_dir:
+        return pathlib.Path(lxd_dir, "unix.socket")
+
+    return pathlib.Path("/var/snap/lxd/common/lxd/unix.socket")
+
+
+class LXDCapabilities(_Record):
+    """Server capabilities, from the server's info (see LXC.info())."""
+
+    __slots__ = ()
+
+    @property
+    def _environment(self) -> Dict[str, Any]:
+        return self._data.get("environment") or {}
+
+    @property
+    def server_version(self) -> str:
+        """LXD version, e.g. "4.0.4"."""
+        return self._environment.get("server_version", "")
+
+    @property
+    def storage_driver(self) -> str:
+        """Storage driver of default pool, e.g. "zfs"."""
+        return self._environment.get("storage", "")
+
+    @property
+    def api_extensions(self) -> List[str]:
+        """API extensions supported by server."""
+        return list(self._data.get("api_extensions") or [])
+
+    @property
+    def kernel_features(self) -> Dict[str, str]:
+        """Kernel features detected by server."""
+        return self._environment.get("kernel_features") or {}
+
+    @property
+    def supports_mknod(self) -> bool:
+        """True if server can intercept mknod in containers.
+
+        See: https://linuxcontainers.org/lxd/docs/master/syscall-interception
+        """
+        return self.kernel_features.get("seccomp_listener", "false") == "true"
+
+
+def host_supports_mknod(
+    lxc: LXC,
+    *,
+    project: str = "default",
+    remote: str = "local",
+    capabilities: Optional["LXDCapabilityCache"] = None,
+) -> bool:
+    """Check if host supports mknod in containers.
+
+    :param lxc: LXC client API, to query the server with if capabilities
+        are not given.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote.
+    :param capabilities: Cache of server capabilities to check.
+
+    :returns: True if mknod is supported.
+    """
+    if capabilities is not None:
+        return capabilities.get().supports_mknod
+
+    return LXDCapabilities(lxc.info(project=project, remote=remote)).supports_mknod
+
+
+class LXDCapabilityCache:
+    """Server capabilities, cached on disk across processes.
+
+    The server is only probed (with LXC.info()) when the daemon's identity
+    changes.  For the local remote, the identity is the inode and mtime of
+    LXD's unix socket, which is recreated when the daemon restarts, and the
+    LXD snap's revision.  Checking it costs two stat() calls.  The identity
+    of other remotes cannot be checked cheaply, so they are only cached in
+    memory, for the lifetime of this object.
+
+    :param lxc: LXC client API.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote.
+    :param cache_path: Path to cache file, defaults to
+        $XDG_CACHE_HOME/craft-providers/lxd-capabilities.json.
+    :param socket_path: Path to LXD's unix socket, defaults to the client's
+        socket (for LXDRestClient), or the LXD snap's socket.
+    :param snap_path: Path to LXD snap's current revision symlink.
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc: Optional[LXC] = None,
+        project: str = "default",
+        remote: str = "local",
+        cache_path: Optional[pathlib.Path] = None,
+        socket_path: Optional[pathlib.Path] = None,
+        snap_path: pathlib.Path = pathlib.Path("/snap/lxd/current"),
+    ):
+        if lxc is None:
+            self.lxc = LXC()
+        else:
+            self.lxc = lxc
+
+        if cache_path is None:
+            self.cache_path = path.cache_path("lxd-capabilities.json")
+        else:
+            self.cache_path = cache_path
+
+        if socket_path is None:
+            self.socket_path = getattr(self.lxc, "socket_path", _default_socket_path())
+        else:
+            self.socket_path = socket_path
+
+        self.project = project
+        self.remote = remote
+        self.snap_path = snap_path
+
+        self._lock = threading.Lock()
+        self._cached: Optional[Tuple[Optional[List[Any]], LXDCapabilities]] = None
+
+    def identity(self) -> Optional[List[Any]]:
+        """Get identity of running daemon.
+
+        :returns: Identity, or None if it cannot be determined.
+        """
+        if self.remote != "local":
+            return None
+
+        try:
+            stat = self.socket_path.stat()
+        except OSError:
+            return None
+
+        try:
+            snap_revision: Optional[str] = os.readlink(self.snap_path)
+        except OSError:
+            snap_revision = None
+
+        return [str(self.socket_path), stat.st_ino, stat.st_mtime_ns, snap_revision]
+
+    def get(self, *, refresh: bool = False) -> LXDCapabilities:
+        """Get server capabilities, probing server if not cached.
+
+        :param refresh: Probe server, even if cached.
+
+        :returns: Server capabilities.
+        """
+        with self._lock:
+            identity = self.identity()
+
+            if not refresh and self._cached is not None:
+                cached_identity, capabilities = self._cached
+                if identity is None or cached_identity == identity:
+                    return capabilities
+
+            info = None
+            if not refresh and identity is not None:
+                info = self._load(identity)
+
+            if info is None:
+                logger.debug("Probing LXD server capabilities.")
+                info = self.lxc.info(project=self.project, remote=self.remote)
+                if identity is not None:
+                    self._save(identity, info)
+
+            capabilities = LXDCapabilities(info)
+            self._cached = (identity, capabilities)
+            return capabilities
+
+    def invalidate(self) -> None:
+        """Drop cached capabilities, forcing the next get() to probe server."""
+        with self._lock:
+            self._cached = None
+            try:
+                self.cache_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _load(self, identity: List[Any]) -> Optional[Dict[str, Any]]:
+        try:
+            entry = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+        if (
+            not isinstance(entry, dict)
+            or entry.get("format") != _CACHE_FORMAT
+            or entry.get("identity") != identity
+        ):
+            return None
+
+        return entry.get("info")
+
+    def _save(self, identity: List[Any], info: Dict[str, Any]) -> None:
+        entry = {"format": _CACHE_FORMAT, "identity": identity, "info": info}
+
+        # Write atomically, other processes may be reading.
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self.cache_path.parent, suffix=".tmp", delete=False
+            ) as cache_file:
+                json.dump(entry, cache_file)
+            try:
+                os.replace(cache_file.name, self.cache_path)
+            except OSError:
+                os.unlink(cache_file.name)
+                raise
+        except OSError as error:
+            logger.debug("Failed to write LXD capability cache: %s", error)
@@ -0,0 +1,199 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Persistent connection pool for the LXD API."""
+import collections
+import http.client
+import logging
+import pathlib
+import socket
+import threading
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Errors indicating a kept-alive connection was closed by the other end,
+# e.g. because the LXD daemon restarted.
+_STALE_CONNECTION_ERRORS = (
+    BrokenPipeError,
+    ConnectionResetError,
+    http.client.RemoteDisconnected,
+)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket."""
+
+    def __init__(self, socket_path: pathlib.Path, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        """Connect to unix socket."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(str(self.socket_path))
+        self.sock = sock
+
+
+class LXDConnectionPoolStats(NamedTuple):
+    """Connection pool counters.
+
+    :param hits: Requests served by an idle, reused connection.
+    :param misses: Requests which required a new connection.
+    :param reconnects: Reused connections found closed and re-established.
+    :param idle: Connections currently idle in the pool.
+    :param in_use: Connections currently checked out.
+    """
+
+    hits: int
+    misses: int
+    reconnects: int
+    idle: int
+    in_use: int
+
+
+class LXDConnectionPool:
+    """Thread-safe, bounded pool of keep-alive connections to LXD's socket.
+
+    :param socket_path: Path to LXD's unix socket.
+    :param max_connections: Maximum number of connections, callers block
+        until a connection is available when exceeded.
+    """
+
+    def __init__(self, *, socket_path: pathlib.Path, max_connections: int = 8):
+        self.socket_path = socket_path
+        self.max_connections = max_connections
+
+        self._idle: Deque[_UnixHTTPConnection] = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._hits = 0
+        self._misses = 0
+        self._reconnects = 0
+        self._in_use = 0
+
+    def _acquire(self) -> Tuple[_UnixHTTPConnection, bool]:
+        """Check out a connection, preferring the most recently used.
+
+        :returns: Tuple of connection and whether it was reused.
+        """
+        self._slots.acquire()
+        with self._lock:
+            self._in_use += 1
+            if self._idle:
+                self._hits += 1
+                return self._idle.pop(), True
+
+            self._misses += 1
+
+        return _UnixHTTPConnection(self.socket_path), False
+
+    def _release(self, conn: _UnixHTTPConnection, *, reuse: bool) -> None:
+        with self._lock:
+            self._in_use -= 1
+            if reuse:
+                self._idle.append(conn)
+            else:
+                conn.close()
+        self._slots.release()
+
+    def request(  # pylint: disable=too-many-arguments
+        self,
+        method: str,
+        url: str,
+        *,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Make request using a pooled connection.
+
+        A reused connection which turns out to be closed is re-established
+        and the request retried once.
+
+        :param method: HTTP method.
+        :param url: Request URL, including query.
+        :param body: Request body.
+        :param headers: Request headers.
+        :param timeout: Socket timeout in seconds, None to block.
+
+        :returns: Tuple of status, headers and response body.
+        """
+        conn, reused = self._acquire()
+        reuse = False
+        try:
+            while True:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+
+                try:
+                    conn.request(method, url, body=body, headers=headers or {})
+                    response = conn.getresponse()
+                    data = response.read()
+                except _STALE_CONNECTION_ERRORS:
+                    if not reused:
+                        raise
+
+                    logger.debug("Reconnecting to LXD socket %s.", self.socket_path)
+                    conn.close()
+                    reused = False
+                    with self._lock:
+                        self._reconnects += 1
+                    continue
+
+                reuse = not response.will_close
+                return response.status, dict(response.getheaders()), data
+        finally:
+            self._release(conn, reuse=reuse)
+
+    def stats(self) -> LXDConnectionPoolStats:
+        """Get pool counters."""
+        with self._lock:
+            return LXDConnectionPoolStats(
+                hits=self._hits,
+                misses=self._misses,
+                reconnects=self._reconnects,
+                idle=len(self._idle),
+                in_use=self._in_use,
+            )
+
+    def close(self) -> None:
+        """Close idle connections."""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+_pools: Dict[pathlib.Path, LXDConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(
+    socket_path: pathlib.Path = pathlib.Path("/var/snap/lxd/common/lxd/unix.socket"),
+) -> LXDConnectionPool:
+    """Get the connection pool shared across the process for an LXD socket.
+
+    :param socket_path: Path to LXD's unix socket.
+
+    :returns: Shared connection pool.
+    """
+    with _pools_lock:
+        pool = _pools.get(socket_path)
+        if pool is None:
+            pool = LXDConnectionPool(socket_path=socket_path)
+            _pools[socket_path] = pool
+
+        return pool
@@ -0,0 +1,281 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""LXD event monitor."""
+import collections
+import json
+import logging
+import subprocess
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from .errors import LXDAPIError
+from .lxc import LXC
+
+logger = logging.getLogger(__name__)
+
+# Operation status codes for completed operations (success, failure, cancelled).
+_OPERATION_DONE_STATUS_CODES = (200, 400, 401)
+
+
+def _instance_from_url(url: str) -> Optional[str]:
+    """Get instance name from API URL, e.g. /1.0/instances/foo?project=bar."""
+    path = urllib.parse.urlsplit(url).path
+    for prefix in ("/1.0/instances/", "/1.0/containers/", "/1.0/virtual-machines/"):
+        if path.startswith(prefix):
+            return urllib.parse.unquote(path[len(prefix) :].split("/")[0])
+
+    return None
+
+
+class LXDEventMonitor:
+    """Monitor LXD events, allowing callers to wait for state transitions.
+
+    Events are read from `lxc monitor` by a background thread and retained
+    (up to max_events) so that transitions which occur between starting an
+    action and waiting on it are not missed.  Use mark() before starting the
+    action and pass the result as `since` to the wait methods.
+
+    :param lxc: LXC client API.
+    :param project: Name of LXD project to monitor.
+    :param remote: Name of LXD remote to monitor.
+    :param types: Event types to monitor.
+    :param max_events: Maximum number of events to retain.
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc: Optional[LXC] = None,
+        project: str = "default",
+        remote: str = "local",
+        types: Iterable[str] = ("lifecycle", "operation"),
+        max_events: int = 1000,
+    ):
+        if lxc is None:
+            self.lxc = LXC()
+        else:
+            self.lxc = lxc
+
+        self.project = project
+        self.remote = remote
+        self.types = tuple(types)
+
+        self._events: Deque[Tuple[int, Dict[str, Any]]] = collections.deque(
+            maxlen=max_events
+        )
+        self._next_seq = 0
+        self._cond = threading.Condition()
+        self._proc: Optional[subprocess.Popen] = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def __enter__(self) -> "LXDEventMonitor":
+        """Start monitoring."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Stop monitoring."""
+        self.stop()
+
+    def start(self) -> None:
+        """Start monitor process and reader thread."""
+        if self._proc is not None:
+            return
+
+        self._stopped = False
+        self._proc = self.lxc.monitor(
+            types=self.types,
+            project=self.project,
+            remote=self.remote,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(
+            target=self._read_events,
+            args=(self._proc,),
+            name="lxd-event-monitor",
+            daemon=True,
+        )
+        self._reader.start()
+
+    def stop(self) -> None:
+        """Stop monitor process and reader thread."""
+        proc = self._proc
+        if proc is None:
+            return
+
+        proc.terminate()
+        proc.wait()
+        if self._reader is not None:
+            self._reader.join()
+
+        if proc.stdout is not None:
+            proc.stdout.close()
+
+        self._proc = None
+        self._reader = None
+
+    def _read_events(self, proc: subprocess.Popen) -> None:
+        assert proc.stdout is not None
+
+        for line in proc.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.debug("Ignoring unparsable event: %r", line)
+                continue
+
+            with self._cond:
+                self._events.append((self._next_seq, event))
+                self._next_seq += 1
+                self._cond.notify_all()
+
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def mark(self) -> int:
+        """Get position of next event, for use with `since`.
+
+        :returns: Sequence number of next event to be received.
+        """
+        with self._cond:
+            return self._next_seq
+
+    def wait_for(
+        self,
+        predicate: Callable[[Dict[str, Any]], bool],
+        *,
+        since: int = 0,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Wait for an event matching predicate.
+
+        :param predicate: Callable returning True for a matching event.
+        :param since: Only consider events from this position, see mark().
+        :param timeout: Timeout in seconds, None to wait forever.
+
+        :returns: Matching event.
+
+        :raises TimeoutError: If no matching event was received in time.
+        :raises RuntimeError: If monitor stopped before a matching event was
+            received.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for seq, event in self._events:
+                    if seq >= since and predicate(event):
+                        return event
+
+                # Retained events have been checked, skip them next time.
+                since = max(since, self._next_seq)
+
+                if self._stopped:
+                    raise RuntimeError("LXD event monitor stopped.")
+
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise TimeoutError("Timed out waiting for LXD event.")
+
+    def wait_for_lifecycle(
+        self,
+        *,
+        instance: str,
+        action: str,
+        since: int = 0,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Wait for lifecycle event for instance.
+
+        :param instance: Name of instance.
+        :param action: Lifecycle action, e.g. "instance-started".
+        :param since: Only consider events from this position, see mark().
+        :param timeout: Timeout in seconds, None to wait forever.
+
+        :returns: Lifecycle event.
+        """
+
+        def predicate(event: Dict[str, Any]) -> bool:
+            if event.get("type") != "lifecycle":
+                return False
+
+            metadata = event.get("metadata") or {}
+            return (
+                metadata.get("action") == action
+                and _instance_from_url(metadata.get("source", "")) == instance
+            )
+
+        return self.wait_for(predicate, since=since, timeout=timeout)
+
+    def wait_for_operation(
+        self,
+        *,
+        instance: Optional[str] = None,
+        operation_id: Optional[str] = None,
+        since: int = 0,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Wait for operation to complete.
+
+        :param instance: Name of instance the operation applies to.
+        :param operation_id: ID of operation.
+        :param since: Only consider events from this position, see mark().
+        :param timeout: Timeout in seconds, None to wait forever.
+
+        :returns: Completed operation metadata.
+
+        :raises LXDAPIError: If operation failed or was cancelled.
+        """
+
+        def predicate(event: Dict[str, Any]) -> bool:
+            if event.get("type") != "operation":
+                return False
+
+            metadata = event.get("metadata") or {}
+            if metadata.get("status_code") not in _OPERATION_DONE_STATUS_CODES:
+                return False
+
+            if operation_id is not None and metadata.get("id") != operation_id:
+                return False
+
+            if instance is not None:
+                resources = metadata.get("resources") or {}
+                urls = [
+                    url
+                    for key in ("instances", "containers", "virtual-machines")
+                    for url in resources.get(key) or []
+                ]
+                return any(_instance_from_url(url) == instance for url in urls)
+
+            return True
+
+        event = self.wait_for(predicate, since=since, timeout=timeout)
+        metadata = event["metadata"]
+        if metadata["status_code"] != 200:
+            raise LXDAPIError(
+                error=metadata.get("err") or metadata.get("status", ""),
+                error_code=metadata["status_code"],
+            )
+
+        return metadata
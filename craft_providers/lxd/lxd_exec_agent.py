@@ -0,0 +1,545 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Long-lived agent running commands in an instance over one lxc exec.
+
+The agent is a Python script run with the instance's python3, over the
+stdin/stdout of a single `lxc exec`.  The script itself is sent first on
+stdin, preceded by its length on a line of its own.  Then both directions
+carry frames of a one byte kind, a request ID and a payload length (network
+byte order), followed by the payload.
+
+Host to agent:
+    R: request, JSON {"argv", "env", "cwd", "stdin", "stdout", "stderr"}
+    I: stdin data for request
+    E: end of stdin for request
+    K: kill request's process
+
+Agent to host:
+    H: agent ready (request ID 0)
+    O: stdout data for request
+    e: stderr data for request
+    X: request's process exited, JSON {"returncode"}
+"""
+import json
+import locale
+import logging
+import os
+import struct
+import subprocess
+import threading
+from typing import IO, Any, Dict, List, Optional, Union
+
+from .lxc import LXC
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!cII")
+
+# Seconds to wait for a killed command to be reported as exited.
+_KILL_TIMEOUT = 10.0
+
+# Reads the agent script from stdin, keeping the logged command short.
+_AGENT_LOADER = (
+    "import sys; "
+    "exec(sys.stdin.buffer.read(int(sys.stdin.buffer.readline())).decode())"
+)
+
+# Runs on the instance's python3, which may be as old as 3.5.
+_AGENT_SCRIPT = r"""
+import json, os, queue, struct, subprocess, sys, threading
+
+HEADER = struct.Struct("!cII")
+OUT = sys.stdout.buffer
+OUT_LOCK = threading.Lock()
+PROCS = {}
+STDIN_QUEUES = {}
+
+
+def send(kind, request_id, payload=b""):
+    with OUT_LOCK:
+        OUT.write(HEADER.pack(kind, request_id, len(payload)) + payload)
+        OUT.flush()
+
+
+def read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def pump(request_id, kind, stream):
+    while True:
+        chunk = os.read(stream.fileno(), 65536)
+        if not chunk:
+            break
+        send(kind, request_id, chunk)
+    stream.close()
+
+
+def feed(stdin_queue, stream):
+    while True:
+        chunk = stdin_queue.get()
+        if chunk is None:
+            break
+        try:
+            stream.write(chunk)
+            stream.flush()
+        except OSError:
+            break
+    try:
+        stream.close()
+    except OSError:
+        pass
+
+
+def wait(request_id, proc, pumps):
+    for thread in pumps:
+        thread.join()
+    returncode = proc.wait()
+    PROCS.pop(request_id, None)
+    STDIN_QUEUES.pop(request_id, None)
+    send(b"X", request_id, json.dumps({"returncode": returncode}).encode())
+
+
+def spawn(request_id, request):
+    env = os.environ.copy()
+    env.update(request.get("env") or {})
+    redirects = {"pipe": subprocess.PIPE, "null": subprocess.DEVNULL}
+    redirects["stdout"] = subprocess.STDOUT
+    try:
+        proc = subprocess.Popen(
+            request["argv"],
+            cwd=request.get("cwd"),
+            env=env,
+            stdin=subprocess.PIPE if request.get("stdin") else subprocess.DEVNULL,
+            stdout=redirects[request.get("stdout", "pipe")],
+            stderr=redirects[request.get("stderr", "pipe")],
+        )
+    except OSError as error:
+        message = "agent: {}: {}\n".format(request["argv"][0], error.strerror)
+        send(b"e", request_id, message.encode())
+        returncode = 126 if isinstance(error, PermissionError) else 127
+        send(b"X", request_id, json.dumps({"returncode": returncode}).encode())
+        return
+
+    PROCS[request_id] = proc
+    if proc.stdin is not None:
+        stdin_queue = queue.Queue()
+        STDIN_QUEUES[request_id] = stdin_queue
+        threading.Thread(target=feed, args=(stdin_queue, proc.stdin)).start()
+
+    pumps = []
+    for kind, stream in [(b"O", proc.stdout), (b"e", proc.stderr)]:
+        if stream is not None:
+            thread = threading.Thread(target=pump, args=(request_id, kind, stream))
+            thread.start()
+            pumps.append(thread)
+
+    threading.Thread(target=wait, args=(request_id, proc, pumps)).start()
+
+
+def main():
+    stdin = sys.stdin.buffer
+    send(b"H", 0)
+    while True:
+        header = read_exact(stdin, HEADER.size)
+        if header is None:
+            break
+        kind, request_id, length = HEADER.unpack(header)
+        payload = read_exact(stdin, length) if length else b""
+        if payload is None:
+            break
+
+        if kind == b"R":
+            spawn(request_id, json.loads(payload.decode()))
+        elif kind in (b"I", b"E"):
+            stdin_queue = STDIN_QUEUES.get(request_id)
+            if stdin_queue is not None:
+                stdin_queue.put(payload if kind == b"I" else None)
+        elif kind == b"K":
+            proc = PROCS.get(request_id)
+            if proc is not None:
+                proc.kill()
+
+    for proc in list(PROCS.values()):
+        proc.kill()
+    for stdin_queue in list(STDIN_QUEUES.values()):
+        stdin_queue.put(None)
+
+
+main()
+"""
+
+# Keyword arguments of subprocess.run() which run() supports.
+_SUPPORTED_KWARGS = {
+    "capture_output",
+    "cwd",
+    "env",
+    "input",
+    "stderr",
+    "stdout",
+    "text",
+    "timeout",
+    "universal_newlines",
+}
+
+
+class LXDExecAgentError(Exception):
+    """Agent could not be started, or was lost before running a command."""
+
+
+class _Request:
+    """Command running through the agent."""
+
+    def __init__(self, *, stdout: Optional[int], stderr: Optional[int]) -> None:
+        self.stdout_sink = stdout
+        self.stderr_sink = stderr
+        self.stdout: List[bytes] = []
+        self.stderr: List[bytes] = []
+        self.returncode: Optional[int] = None
+        self.done = threading.Event()
+
+    def output(self, kind: bytes, data: bytes) -> None:
+        sink = self.stdout_sink if kind == b"O" else self.stderr_sink
+        if sink is None:
+            # Inherited, as it would be by lxc exec.
+            fd = 1 if kind == b"O" else 2
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+        elif kind == b"O":
+            self.stdout.append(data)
+        else:
+            self.stderr.append(data)
+
+
+def _decode(data: bytes) -> str:
+    text = data.decode(locale.getpreferredencoding(False))
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class LXDExecAgent:
+    """Run commands in an instance through a single, long-lived lxc exec.
+
+    Saves spawning lxc, and LXD setting up an exec session, for each
+    command.  Commands may run concurrently.
+
+    :param lxc: LXC client API.
+    :param instance: Name of instance.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote.
+    :param python: Python interpreter in instance to run agent with.
+    :param start_timeout: Seconds to wait for agent to report ready.
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc: LXC,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        python: str = "python3",
+        start_timeout: float = 10.0,
+    ):
+        self.lxc = lxc
+        self.instance = instance
+        self.project = project
+        self.remote = remote
+        self.python = python
+        self.start_timeout = start_timeout
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._reader: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._requests_lock = threading.Lock()
+        self._requests: Dict[int, _Request] = {}
+        self._reading = False
+        self._next_id = 1
+
+    @staticmethod
+    def supports(**kwargs) -> bool:
+        """Check if run() supports subprocess.run() keyword arguments.
+
+        :returns: True if supported.
+        """
+        if not set(kwargs) <= _SUPPORTED_KWARGS:
+            return False
+
+        if kwargs.get("stdout") not in (None, subprocess.PIPE, subprocess.DEVNULL):
+            return False
+
+        return kwargs.get("stderr") in (
+            None,
+            subprocess.PIPE,
+            subprocess.DEVNULL,
+            subprocess.STDOUT,
+        )
+
+    def is_alive(self) -> bool:
+        """Check if agent is running.
+
+        :returns: True if running.
+        """
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self) -> None:
+        """Start agent, if not running.
+
+        :raises LXDExecAgentError: If agent fails to report ready.
+        """
+        with self._lock:
+            if self.is_alive():
+                return
+
+            self._ready.clear()
+            self._reading = True
+            self._proc = self.lxc.exec(
+                instance=self.instance,
+                command=[self.python, "-u", "-c", _AGENT_LOADER],
+                project=self.project,
+                remote=self.remote,
+                runner=subprocess.Popen,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            self._reader = threading.Thread(
+                target=self._read, args=(self._proc,), daemon=True
+            )
+            self._reader.start()
+
+            script = _AGENT_SCRIPT.encode()
+            try:
+                with self._write_lock:
+                    self._proc.stdin.write(b"%d\n" % len(script) + script)  # type: ignore
+                    self._proc.stdin.flush()  # type: ignore
+            except BrokenPipeError:
+                pass
+
+            # Set once ready, or once the agent exits.
+            self._ready.wait(self.start_timeout)
+            if not self._reading or not self.is_alive():
+                self._terminate()
+                raise LXDExecAgentError(
+                    f"Exec agent failed to start in {self.instance!r}."
+                )
+
+            logger.debug("Started exec agent in %r.", self.instance)
+
+    def stop(self) -> None:
+        """Stop agent, if running."""
+        with self._lock:
+            self._terminate()
+
+    def _terminate(self) -> None:
+        if self._proc is None:
+            return
+
+        proc = self._proc
+        if proc.stdin is not None:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+        if self._reader is not None:
+            self._reader.join()
+
+        self._proc = None
+        self._reader = None
+
+    def _send(self, kind: bytes, request_id: int, payload: bytes = b"") -> None:
+        proc = self._proc
+        if proc is None or proc.stdin is None:
+            raise LXDExecAgentError("Exec agent is not running.")
+
+        try:
+            with self._write_lock:
+                proc.stdin.write(_HEADER.pack(kind, request_id, len(payload)))
+                proc.stdin.write(payload)
+                proc.stdin.flush()
+        except (BrokenPipeError, ValueError) as error:
+            raise LXDExecAgentError("Exec agent was lost.") from error
+
+    def _read(self, proc: subprocess.Popen) -> None:
+        stream: IO[bytes] = proc.stdout  # type: ignore
+        try:
+            while True:
+                header = stream.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+
+                kind, request_id, length = _HEADER.unpack(header)
+                payload = stream.read(length) if length else b""
+
+                if kind == b"H":
+                    self._ready.set()
+                    continue
+
+                request = self._requests.get(request_id)
+                if request is None:
+                    continue
+
+                if kind == b"X":
+                    request.returncode = json.loads(payload)["returncode"]
+                    with self._requests_lock:
+                        del self._requests[request_id]
+                    request.done.set()
+                else:
+                    request.output(kind, payload)
+        finally:
+            self._ready.set()
+
+            # Agent lost, fail outstanding requests as lxc exec would.
+            with self._requests_lock:
+                self._reading = False
+                lost = list(self._requests.values())
+                self._requests.clear()
+
+            for request in lost:
+                request.stderr.append(b"Exec agent was lost.\n")
+                request.returncode = 255
+                request.done.set()
+
+    def run(
+        self,
+        command: List[str],
+        *,
+        check: bool = False,
+        capture_output: bool = False,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        input: Optional[Union[bytes, str]] = None,  # pylint: disable=redefined-builtin
+        stderr: Optional[int] = None,
+        stdout: Optional[int] = None,
+        text: bool = False,
+        timeout: Optional[float] = None,
+        universal_newlines: bool = False,
+    ) -> subprocess.CompletedProcess:
+        """Run command in instance and wait for it to complete.
+
+        Arguments and result are as for subprocess.run().
+
+        :param command: Command to execute.
+        :param check: Raise exception on failure.
+        :param capture_output: Capture stdout and stderr.
+        :param cwd: Working directory in instance.
+        :param env: Environment variables to add, in instance.
+        :param input: Data to pass to command's stdin.
+        :param stderr: None (inherit), subprocess.PIPE, DEVNULL or STDOUT.
+        :param stdout: None (inherit), subprocess.PIPE or DEVNULL.
+        :param text: Decode output, and encode input, as text.
+        :param timeout: Seconds to wait for command, before killing it.
+        :param universal_newlines: Alias of text.
+
+        :returns: Completed process.
+
+        :raises subprocess.CalledProcessError: if command fails and check is
+            True.
+        :raises subprocess.TimeoutExpired: if command times out.
+        :raises LXDExecAgentError: if agent is not running, or was lost before
+            the command was sent, so it may be retried with lxc exec.
+        """
+        if capture_output:
+            stdout = stderr = subprocess.PIPE
+        text = text or universal_newlines
+
+        # Inherited output is piped to the host, which writes it to its own
+        # stdout and stderr, see _Request.output().
+        redirects = {subprocess.PIPE: "pipe", subprocess.DEVNULL: "null", None: "pipe"}
+        redirects[subprocess.STDOUT] = "stdout"
+        request = _Request(stdout=stdout, stderr=stderr)
+
+        with self._requests_lock:
+            if not self._reading:
+                raise LXDExecAgentError("Exec agent is not running.")
+            request_id = self._next_id
+            self._next_id += 1
+            self._requests[request_id] = request
+
+        payload = {
+            "argv": command,
+            "cwd": cwd,
+            "env": env,
+            "stdin": input is not None,
+            "stdout": redirects[stdout],
+            "stderr": redirects[stderr],
+        }
+        try:
+            self._send(b"R", request_id, json.dumps(payload).encode())
+        except LXDExecAgentError:
+            with self._requests_lock:
+                self._requests.pop(request_id, None)
+            raise
+
+        # The command may now be running, so it must not be retried by the
+        # caller.  If the agent is lost, the request fails as lxc exec would.
+        try:
+            if input is not None:
+                data = input.encode() if isinstance(input, str) else input
+                for offset in range(0, len(data), 65536):
+                    self._send(b"I", request_id, data[offset : offset + 65536])
+                self._send(b"E", request_id)
+        except LXDExecAgentError as error:
+            logger.debug("Failed to send input to exec agent: %s", error)
+
+        if not request.done.wait(timeout):
+            try:
+                self._send(b"K", request_id)
+            except LXDExecAgentError as error:
+                logger.debug("Failed to kill command through exec agent: %s", error)
+            if not request.done.wait(_KILL_TIMEOUT):
+                logger.warning("Exec agent did not report killed command exiting.")
+                with self._requests_lock:
+                    self._requests.pop(request_id, None)
+            raise subprocess.TimeoutExpired(
+                command,
+                timeout,  # type: ignore
+                output=self._output(request.stdout, stdout, text),
+                stderr=self._output(request.stderr, stderr, text),
+            )
+
+        returncode: int = request.returncode  # type: ignore
+        output = self._output(request.stdout, stdout, text)
+        error_output = self._output(request.stderr, stderr, text)
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, command, output=output, stderr=error_output
+            )
+
+        return subprocess.CompletedProcess(command, returncode, output, error_output)
+
+    @staticmethod
+    def _output(chunks: List[bytes], sink: Optional[int], text: bool) -> Optional[Any]:
+        if sink != subprocess.PIPE:
+            return None
+
+        data = b"".join(chunks)
+        if text:
+            return _decode(data)
+        return data
@@ -16,18 +16,49 @@
 import logging
 import os
 import pathlib
+import sqlite3
 import subprocess
 import tempfile
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from .. import Executor
+from ..util.manifest_cache import ManifestCache
+from .instance_config import InstanceConfigTransaction
 from .lxc import LXC
+from .lxd_capabilities import LXDCapabilityCache, host_supports_mknod
+from .lxd_event_monitor import LXDEventMonitor
+from .lxd_exec_agent import LXDExecAgent, LXDExecAgentError
+from .lxd_operation import LXDOperation
+from .lxd_profile import LXDProfileManager
 
 logger = logging.getLogger(__name__)
 
+# Seconds between checks of whether a stopped ephemeral instance is deleted,
+# in case the deletion event was missed.
+_DELETE_POLL_INTERVAL = 1.0
+
 
 class LXDInstance(Executor):
-    """LXD Instance Lifecycle."""
+    """LXD Instance Lifecycle.
+
+    :param name: Name of instance.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote instance runs on.
+    :param lxc: LXC client API.
+    :param state_cache_ttl: Seconds to reuse queried instance state for.  The
+        cache is invalidated by any lifecycle change made through this object.
+        Set to zero to always query LXD.
+    :param capabilities: Cache of server capabilities to check host support
+        with, rather than querying the server on each launch.
+    :param use_exec_agent: Run commands for execute_run() through a single,
+        long-lived agent in the instance (see LXDExecAgent), rather than an
+        lxc exec each.  Falls back to lxc exec if the agent cannot run.
+    :param manifest_cache: Cache of manifests of incremental syncs to the
+        instance, keyed by the instance's UUID so an instance recreated with
+        the same name does not reuse them, and invalidated when the instance
+        is deleted or launched.
+    """
 
     def __init__(
         self,
@@ -36,6 +67,10 @@ class LXDInstance(Executor):
         project: str = "default",
         remote: str = "local",
         lxc: Optional[LXC] = None,
+        state_cache_ttl: float = 1.0,
+        capabilities: Optional[LXDCapabilityCache] = None,
+        use_exec_agent: bool = False,
+        manifest_cache: Optional[ManifestCache] = None,
     ):
         super().__init__()
 
@@ -47,6 +82,32 @@ class LXDInstance(Executor):
         else:
             self.lxc = lxc
 
+        self.state_cache_ttl = state_cache_ttl
+        self._state_cache: Optional[Tuple[float, Optional[Dict[str, Any]]]] = None
+        self.capabilities = capabilities
+
+        self.use_exec_agent = use_exec_agent
+        self._exec_agent: Optional[LXDExecAgent] = None
+        self._exec_agent_failed = False
+
+        self.manifest_cache = manifest_cache
+
+    def config_transaction(self) -> InstanceConfigTransaction:
+        """Start collecting config keys and devices to apply together.
+
+        Commit to apply to the existing instance in a single request, or pass
+        to launch() to create the instance with them.
+
+        :returns: Configuration transaction for instance.
+        """
+        return InstanceConfigTransaction(
+            lxc=self.lxc,
+            instance=self.name,
+            project=self.project,
+            remote=self.remote,
+            on_commit=self.invalidate_state_cache,
+        )
+
     def create_file(
         self,
         *,
@@ -86,6 +147,9 @@ class LXDInstance(Executor):
 
         :param force: Delete even if running.
         """
+        self.invalidate_state_cache()
+        self._discard_manifest_cache()
+        self.stop_exec_agent()
         return self.lxc.delete(
             instance=self.name,
             project=self.project,
@@ -93,6 +157,23 @@ class LXDInstance(Executor):
             force=force,
         )
 
+    def begin_delete(self, force: bool = True) -> LXDOperation:
+        """Start deleting instance, as delete() does.
+
+        :param force: Delete even if running.
+
+        :returns: Operation handle.
+        """
+        self.invalidate_state_cache()
+        self._discard_manifest_cache()
+        self.stop_exec_agent()
+        return self.lxc.begin_delete(
+            instance=self.name,
+            project=self.project,
+            remote=self.remote,
+            force=force,
+        )
+
     def execute_popen(self, command: List[str], **kwargs) -> subprocess.Popen:
         """Execute process in instance using subprocess.Popen().
 
@@ -124,6 +205,14 @@ class LXDInstance(Executor):
         :raises subprocess.CalledProcessError: if command fails and check is
             True.
         """
+        if self.use_exec_agent and LXDExecAgent.supports(**kwargs):
+            agent = self._get_exec_agent()
+            if agent is not None:
+                try:
+                    return agent.run(command, check=check, **kwargs)
+                except LXDExecAgentError as error:
+                    logger.debug("Exec agent unavailable: %s", error)
+
         return self.lxc.exec(
             instance=self.name,
             command=command,
@@ -134,30 +223,124 @@ class LXDInstance(Executor):
             **kwargs,
         )
 
-    def exists(self) -> bool:
+    def _get_exec_agent(self) -> Optional[LXDExecAgent]:
+        """Get exec agent, starting it if not running.
+
+        :returns: Exec agent, or None if it cannot run in the instance.
+        """
+        if self._exec_agent_failed:
+            return None
+
+        if self._exec_agent is None:
+            self._exec_agent = LXDExecAgent(
+                lxc=self.lxc,
+                instance=self.name,
+                project=self.project,
+                remote=self.remote,
+            )
+
+        try:
+            self._exec_agent.start()
+        except LXDExecAgentError as error:
+            # Not retried until the instance is (re)started.
+            logger.warning("Falling back to lxc exec: %s", error)
+            self._exec_agent_failed = True
+            return None
+
+        return self._exec_agent
+
+    def stop_exec_agent(self) -> None:
+        """Stop exec agent, if running."""
+        if self._exec_agent is not None:
+            self._exec_agent.stop()
+
+    def exists(self, *, use_cache: bool = True) -> bool:
         """Check if instance exists.
 
+        :param use_cache: Allow use of recently queried state.
+
         :returns: True if instance exists.
         """
-        return self.get_state() is not None
+        return self.get_state(use_cache=use_cache) is not None
 
-    def get_state(self) -> Optional[Dict[str, Any]]:
+    def get_state(self, *, use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """Get state configuration for instance.
 
-        :returns: State information parsed from lxc if instance exists, else
-            None.
+        :param use_cache: Allow use of recently queried state.
+
+        :returns: Instance configuration and status if instance exists,
+            else None.
         """
-        instances = self.lxc.list(
+        now = time.monotonic()
+        if use_cache and self._state_cache is not None:
+            timestamp, cached_state = self._state_cache
+            if now - timestamp < self.state_cache_ttl:
+                return cached_state
+
+        state = self.lxc.instance_get(
             instance=self.name, project=self.project, remote=self.remote
         )
 
-        # lxc returns a filter instances starting with instance name rather
-        # than the exact instance.  Find the exact match...
-        for instance in instances:
-            if instance["name"] == self.name:
-                return instance
+        self._state_cache = (now, state)
+        return state
+
+    def invalidate_state_cache(self) -> None:
+        """Drop cached instance state, forcing the next query to LXD."""
+        self._state_cache = None
+
+    @property
+    def _manifest_cache_prefix(self) -> str:
+        return f"lxd:{self.remote}:{self.project}:{self.name}:"
+
+    def _get_manifest_cache_key(self) -> Optional[str]:
+        """Get identifier of instance in manifest cache.
+
+        :returns: Identifier, including the instance's UUID (or creation time,
+            where LXD does not set one), or None if the instance is missing.
+        """
+        state = self.get_state()
+        if state is None:
+            return None
+
+        identity = state.get("config", {}).get("volatile.uuid") or state.get(
+            "created_at"
+        )
+        if not identity:
+            return None
+
+        return self._manifest_cache_prefix + identity
 
-        return None
+    def invalidate_manifest_cache(
+        self, *, destination: Optional[pathlib.Path] = None
+    ) -> None:
+        """Drop cached manifests of syncs to instance.
+
+        Required if synced directories are changed other than by sync_to(),
+        for the next incremental sync to scan them.
+
+        :param destination: Destination to drop manifest of, else all.
+
+        :raises OSError: if cache cannot be opened.
+        :raises sqlite3.Error: if cache cannot be updated.
+        """
+        if self.manifest_cache is not None:
+            self.manifest_cache.invalidate(
+                key=self._manifest_cache_prefix, destination=destination, prefix=True
+            )
+
+    def _discard_manifest_cache(self) -> None:
+        """Drop cached manifests of syncs to instance, on lifecycle changes.
+
+        The cache must not prevent instances being deleted or launched, so
+        errors are logged, and the cache is no longer used by this object.
+        """
+        try:
+            self.invalidate_manifest_cache()
+        except (OSError, sqlite3.Error) as error:
+            logger.warning(
+                "Failed to invalidate sync manifest cache, disabling it: %s", error
+            )
+            self.manifest_cache = None
 
     def is_mounted(self, *, source: pathlib.Path, destination: pathlib.Path) -> bool:
         """Check if path is mounted at target.
@@ -167,23 +350,22 @@ class LXDInstance(Executor):
 
         :returns: True if source is mounted at destination.
         """
-        devices = self.lxc.config_device_show(
+        disks = self.lxc.config_device_disks(
             instance=self.name, project=self.project, remote=self.remote
         )
-        disks = [d for d in devices.values() if d.get("type") == "disk"]
 
         return any(
-            disk.get("path") == destination.as_posix()
-            and disk.get("source") == source.as_posix()
-            for disk in disks
+            disk.is_mount_of(source=source, destination=destination) for disk in disks
         )
 
-    def is_running(self) -> bool:
+    def is_running(self, *, use_cache: bool = True) -> bool:
         """Check if instance is running.
 
+        :param use_cache: Allow use of recently queried state.
+
         :returns: True if instance is running.
         """
-        state = self.get_state()
+        state = self.get_state(use_cache=use_cache)
         if state is None:
             return False
 
@@ -196,6 +378,8 @@ class LXDInstance(Executor):
         image_remote: str,
         uid: str = str(os.getuid()),
         ephemeral: bool = True,
+        config: Optional[InstanceConfigTransaction] = None,
+        profile_manager: Optional[LXDProfileManager] = None,
     ) -> None:
         """Launch instance.
 
@@ -203,13 +387,36 @@ class LXDInstance(Executor):
         :param image_remote: Image remote name.
         :param uid: Host user ID to map to instance root.
         :param ephemeral: Flag to enable ephemeral instance.
+        :param config: Pending configuration (see config_transaction()) to
+            launch the instance with, rather than applying afterwards.
+        :param profile_manager: Manager of profile holding the ID mapping
+            and host-dependent settings, used in place of per-instance
+            configuration (uid is then taken from the manager).
         """
         config_keys = dict()
-        config_keys["raw.idmap"] = f"both {uid!s} 0"
+        profiles = None
+
+        if profile_manager is not None:
+            profile_manager.ensure()
+            profiles = profile_manager.profiles
+        else:
+            config_keys["raw.idmap"] = f"both {uid!s} 0"
+
+            if host_supports_mknod(
+                self.lxc,
+                project=self.project,
+                remote=self.remote,
+                capabilities=self.capabilities,
+            ):
+                config_keys["security.syscalls.intercept.mknod"] = "true"
 
-        if self._host_supports_mknod():
-            config_keys["security.syscalls.intercept.mknod"] = "true"
+        devices = None
+        if config is not None:
+            config_keys.update(config.config)
+            devices = config.devices
 
+        self.invalidate_state_cache()
+        self._discard_manifest_cache()
         self.lxc.launch(
             config_keys=config_keys,
             ephemeral=ephemeral,
@@ -218,8 +425,13 @@ class LXDInstance(Executor):
             image_remote=image_remote,
             project=self.project,
             remote=self.remote,
+            devices=devices,
+            profiles=profiles,
         )
 
+        if config is not None:
+            config.clear()
+
     def mount(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
         """Mount host source directory to target mount point.
 
@@ -231,6 +443,7 @@ class LXDInstance(Executor):
         if self.is_mounted(source=source, destination=destination):
             return
 
+        self.invalidate_state_cache()
         self.lxc.config_device_add_disk(
             instance=self.name,
             source=source,
@@ -239,27 +452,87 @@ class LXDInstance(Executor):
             remote=self.remote,
         )
 
-    def _host_supports_mknod(self) -> bool:
-        """Check if host supports mknod in container.
+    def start(self) -> None:
+        """Start instance."""
+        self.invalidate_state_cache()
+        self._exec_agent_failed = False
+        self.lxc.start(instance=self.name, project=self.project, remote=self.remote)
+
+    def stop(self, *, delete_timeout: float = 30.0) -> None:
+        """Stop instance.
 
-        See: https://linuxcontainers.org/lxd/docs/master/syscall-interception
+        LXD deletes an ephemeral instance once stopped, but only after lxc
+        stop returns.  The deletion is awaited (see LXDEventMonitor), so the
+        instance no longer exists when this returns, and may be launched
+        again.
 
-        :returns: True if mknod is supported.
+        :param delete_timeout: Seconds to wait for an ephemeral instance to
+            be deleted, after which it is left to LXD.
         """
-        cfg = self.lxc.info(project=self.project, remote=self.remote)
-        env = cfg.get("environment", dict())
-        kernel_features = env.get("kernel_features", dict())
-        seccomp_listener = kernel_features.get("seccomp_listener", "false")
+        state = self.get_state()
+        self.invalidate_state_cache()
+        self.stop_exec_agent()
 
-        return seccomp_listener == "true"
+        if state is None or not state.get("ephemeral"):
+            self.lxc.stop(instance=self.name, project=self.project, remote=self.remote)
+            return
 
-    def start(self) -> None:
-        """Start instance."""
-        self.lxc.start(instance=self.name, project=self.project, remote=self.remote)
+        self._discard_manifest_cache()
+        with LXDEventMonitor(
+            lxc=self.lxc, project=self.project, remote=self.remote, types=["lifecycle"]
+        ) as monitor:
+            since = monitor.mark()
+            self.lxc.stop(instance=self.name, project=self.project, remote=self.remote)
+
+            try:
+                self._wait_for_deletion(monitor, since=since, timeout=delete_timeout)
+            finally:
+                self.invalidate_state_cache()
+
+    def _wait_for_deletion(
+        self, monitor: LXDEventMonitor, *, since: int, timeout: float
+    ) -> None:
+        """Wait for instance to be deleted by LXD.
+
+        lxc monitor may not have subscribed to events by the time of the
+        deletion, so whether the instance exists is checked between waits
+        for the event.
 
-    def stop(self) -> None:
-        """Stop instance."""
-        self.lxc.stop(instance=self.name, project=self.project, remote=self.remote)
+        :param monitor: Monitor started before the deletion was triggered.
+        :param since: Position of monitor before the deletion was triggered.
+        :param timeout: Seconds to wait, after which it is left to LXD.
+        """
+        deadline = time.monotonic() + timeout
+        monitoring = True
+
+        while self.exists(use_cache=False):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(
+                    "Ephemeral instance %r not deleted after %.1fs, leaving to LXD.",
+                    self.name,
+                    timeout,
+                )
+                return
+
+            interval = min(remaining, _DELETE_POLL_INTERVAL)
+            if not monitoring:
+                time.sleep(interval)
+                continue
+
+            try:
+                monitor.wait_for_lifecycle(
+                    instance=self.name,
+                    action="instance-deleted",
+                    since=since,
+                    timeout=interval,
+                )
+                return
+            except TimeoutError:
+                pass
+            except RuntimeError as error:
+                logger.debug("Polling for deletion of %r: %s", self.name, error)
+                monitoring = False
 
     def supports_mount(self) -> bool:
         """Check if instance supports mounting from host.
@@ -268,7 +541,16 @@ class LXDInstance(Executor):
         """
         return self.remote == "local"
 
-    def sync_from(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+    def _is_remote(self) -> bool:
+        return self.remote != "local"
+
+    def sync_from(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        compression: str = "auto",
+    ) -> None:
         """Copy source file/directory from environment to host destination.
 
         Standard "cp -r" rules apply:
@@ -282,10 +564,13 @@ class LXDInstance(Executor):
 
         :param source: Target directory to copy from.
         :param destination: Host destination directory to copy to.
+        :param compression: Compression of directory transfers (see
+            naive_directory_sync_from()).
         """
         logger.info("Syncing env:%s -> host:%s...", source, destination)
         # TODO: check if mount makes source == destination, skip if so.
-        if self.is_target_file(source):
+        source_stat = self.stat(source)
+        if source_stat is not None and source_stat.is_file:
             self.lxc.file_pull(
                 instance=self.name,
                 source=source,
@@ -294,7 +579,7 @@ class LXDInstance(Executor):
                 remote=self.remote,
                 create_dirs=True,
             )
-        elif self.is_target_directory(target=source):
+        elif source_stat is not None and source_stat.is_dir:
             self.lxc.file_pull(
                 instance=self.name,
                 source=source,
@@ -305,11 +590,22 @@ class LXDInstance(Executor):
                 recursive=True,
             )
             # TODO: use mount() if available
-            self.naive_directory_sync_from(source=source, destination=destination)
+            self.naive_directory_sync_from(
+                source=source, destination=destination, compression=compression
+            )
         else:
             raise FileNotFoundError(f"Source {source} not found.")
 
-    def sync_to(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+    def sync_to(
+        self,
+        *,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        incremental: bool = False,
+        checksum: bool = False,
+        compression: str = "auto",
+        parallelism: Optional[int] = None,
+    ) -> None:
         """Copy host source file/directory into environment at destination.
 
         Standard "cp -r" rules apply:
@@ -321,6 +617,21 @@ class LXDInstance(Executor):
 
         :param source: Host directory to copy.
         :param destination: Target destination directory to copy to.
+        :param incremental: Only send added or changed paths of a directory,
+            and delete removed ones, rather than replacing destination (see
+            incremental_directory_sync_to()).
+        :param checksum: With incremental, compare content of files whose
+            size matches but mtime does not.
+        :param compression: Compression of non-incremental directory
+            transfers (see naive_directory_sync_to()).
+        :param parallelism: Number of parallel transfers to split
+            non-incremental directory transfers into, defaults to one chosen
+            from the number of CPUs and size of source (see
+            sharded_directory_sync_to()).
+
+        With incremental and a manifest cache, the destination is assumed to
+        be unchanged since the last sync_to() (see
+        invalidate_manifest_cache()).
         """
         # TODO: check if mounted, skip sync if source == destination
         logger.info("Syncing host:%s -> env:%s...", source, destination)
@@ -332,10 +643,29 @@ class LXDInstance(Executor):
                 project=self.project,
                 remote=self.remote,
             )
+        elif source.is_dir() and incremental:
+            manifest_cache_key = None
+            if self.manifest_cache is not None:
+                manifest_cache_key = self._get_manifest_cache_key()
+
+            self.incremental_directory_sync_to(
+                source=source,
+                destination=destination,
+                checksum=checksum,
+                manifest_cache=(
+                    None if manifest_cache_key is None else self.manifest_cache
+                ),
+                manifest_cache_key=manifest_cache_key or "",
+            )
         elif source.is_dir():
+            self.invalidate_manifest_cache(destination=destination)
             # TODO: use mount() if available
-            self.naive_directory_sync_to(
-                source=source, destination=destination, delete=True
+            self.sharded_directory_sync_to(
+                source=source,
+                destination=destination,
+                parallelism=parallelism,
+                delete=True,
+                compression=compression,
             )
         else:
             raise FileNotFoundError(f"Source {source} not found.")
@@ -0,0 +1,140 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Handles for long-running LXD operations."""
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LXDOperation:
+    """Handle for an LXD operation running in the background.
+
+    The operation runs on a worker thread, started with start().  Any error
+    raised by the operation is re-raised by wait().
+
+    :param description: Description of operation, for logging.
+    """
+
+    def __init__(self, *, description: str) -> None:
+        self.description = description
+
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._progress: Optional[str] = None
+        self._cancelled = False
+        self._cancel_hook: Optional[Callable[[], None]] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self) -> str:
+        """Return representation."""
+        return f"LXDOperation(description={self.description!r})"
+
+    def start(self, func: Callable[["LXDOperation"], None]) -> "LXDOperation":
+        """Run func(operation) on a worker thread.
+
+        :param func: Operation to run, receiving this handle to report
+            progress and register cancellation.
+
+        :returns: This operation.
+        """
+
+        def run() -> None:
+            try:
+                func(self)
+            except BaseException as error:  # pylint: disable=broad-except
+                logger.debug("Operation %r failed: %s", self.description, error)
+                self._error = error
+            finally:
+                self._done.set()
+
+        self._thread = threading.Thread(target=run, name=self.description, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def cancelled(self) -> bool:
+        """True if cancellation was requested."""
+        return self._cancelled
+
+    @property
+    def progress(self) -> Optional[str]:
+        """Most recent progress reported by LXD, if any."""
+        return self._progress
+
+    def cancel(self) -> bool:
+        """Request cancellation of operation.
+
+        Whether the underlying LXD operation can be cancelled depends on the
+        operation, the error (if any) is reported by wait().
+
+        :returns: False if operation has already completed, else True.
+        """
+        with self._lock:
+            if self._done.is_set():
+                return False
+
+            self._cancelled = True
+            hook = self._cancel_hook
+
+        if hook is not None:
+            hook()
+
+        return True
+
+    def done(self) -> bool:
+        """Check if operation has completed.
+
+        :returns: True if operation completed, successfully or not.
+        """
+        return self._done.is_set()
+
+    def set_cancel_hook(self, hook: Optional[Callable[[], None]]) -> None:
+        """Set callable to cancel the current step of operation.
+
+        If cancellation was already requested, hook is called immediately.
+
+        :param hook: Callable to cancel current step, or None if the current
+            step cannot be cancelled.
+        """
+        with self._lock:
+            self._cancel_hook = hook
+            call_now = self._cancelled and hook is not None
+
+        if call_now and hook is not None:
+            hook()
+
+    def set_progress(self, progress: Optional[str]) -> None:
+        """Report progress of operation.
+
+        :param progress: Progress description, e.g. "Retrieving image: 45%".
+        """
+        self._progress = progress
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait for operation to complete.
+
+        :param timeout: Timeout in seconds, None to wait forever.
+
+        :raises TimeoutError: If operation did not complete in time.
+        :raises Exception: Any error raised by the operation.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Timed out waiting for {self.description!r}.")
+
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,204 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Versioned LXD profile management."""
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional
+
+from .errors import LXDAPIError
+from .lxc import LXC
+from .lxd_capabilities import LXDCapabilityCache, host_supports_mknod
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate profiles created by prior versions of this module.
+_PROFILE_SCHEMA_VERSION = 2
+
+
+def _already_exists(error: Exception) -> bool:
+    """Check if creating an object failed as it already exists."""
+    if isinstance(error, LXDAPIError):
+        return error.error_code == 409 or "already exists" in error.error
+
+    if isinstance(error, subprocess.CalledProcessError):
+        output = error.output or b""
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        return "already exists" in output
+
+    return False
+
+
+class LXDProfileManager:
+    """Manage a content-hashed profile holding settings shared by instances.
+
+    The profile maps the host user to root in the instance (raw.idmap),
+    enables mknod interception where the host supports it, and holds any
+    shared devices.  It is named after a hash of its content, e.g.
+    "craft-0123456789ab", so launches can reference an existing profile
+    without querying it, and changed settings get a new profile.  Host
+    support for mknod is part of the content, so the host is queried for
+    it once per manager, unless capabilities are given.
+
+    :param lxc: LXC client API.
+    :param project: Name of LXD project.
+    :param remote: Name of LXD remote.
+    :param uid: Host user ID to map to instance root.
+    :param devices: Devices to share with all instances.
+    :param prefix: Prefix for profile names.
+    :param capabilities: Cache of server capabilities to check host support
+        with, rather than querying the server.
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc: Optional[LXC] = None,
+        project: str = "default",
+        remote: str = "local",
+        uid: int = os.getuid(),
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        prefix: str = "craft-",
+        capabilities: Optional[LXDCapabilityCache] = None,
+    ):
+        if lxc is None:
+            self.lxc = LXC()
+        else:
+            self.lxc = lxc
+
+        self.project = project
+        self.remote = remote
+        self.uid = uid
+        self.devices = dict(devices or {})
+        self.prefix = prefix
+        self.capabilities = capabilities
+
+        self._lock = threading.Lock()
+        self._ensured = False
+        self._content: Optional[Dict[str, Any]] = None
+        self._name: Optional[str] = None
+
+    @property
+    def content(self) -> Dict[str, Any]:
+        """Configuration, description and devices of profile."""
+        if self._content is None:
+            config = {"raw.idmap": f"both {self.uid!s} 0"}
+            if host_supports_mknod(
+                self.lxc,
+                project=self.project,
+                remote=self.remote,
+                capabilities=self.capabilities,
+            ):
+                config["security.syscalls.intercept.mknod"] = "true"
+
+            self._content = {
+                "config": config,
+                "description": "Shared settings for craft-providers instances.",
+                "devices": self.devices,
+            }
+
+        return self._content
+
+    @property
+    def name(self) -> str:
+        """Name of profile for the requested settings."""
+        if self._name is None:
+            settings = {"version": _PROFILE_SCHEMA_VERSION, "content": self.content}
+            digest = hashlib.sha256(
+                json.dumps(settings, sort_keys=True).encode()
+            ).hexdigest()
+            self._name = self.prefix + digest[:12]
+
+        return self._name
+
+    @property
+    def profiles(self) -> List[str]:
+        """Profiles to launch instances with."""
+        return ["default", self.name]
+
+    def ensure(self) -> str:
+        """Create profile, if it does not exist, or complete it.
+
+        A profile left without its content, e.g. by a process interrupted
+        between creating and editing it, is completed.  A profile created
+        concurrently by another process is used.  Existence is only checked
+        once per manager.
+
+        :returns: Name of profile.
+        """
+        with self._lock:
+            if self._ensured:
+                return self.name
+
+            profile = self.lxc.profile_get(
+                profile=self.name, project=self.project, remote=self.remote
+            )
+            if profile is None:
+                self._create()
+
+            if profile is None or any(
+                profile.get(key) != self.content[key] for key in ["config", "devices"]
+            ):
+                logger.debug("Setting content of LXD profile %r.", self.name)
+                self.lxc.profile_edit(
+                    profile=self.name,
+                    config=self.content,
+                    project=self.project,
+                    remote=self.remote,
+                )
+
+            self._ensured = True
+            return self.name
+
+    def _create(self) -> None:
+        logger.info("Creating LXD profile %r.", self.name)
+        try:
+            self.lxc.profile_create(
+                profile=self.name, project=self.project, remote=self.remote
+            )
+        except (subprocess.CalledProcessError, LXDAPIError) as error:
+            if not _already_exists(error):
+                raise error
+            logger.debug("LXD profile %r created concurrently.", self.name)
+
+    def collect_garbage(self) -> List[str]:
+        """Delete unused profiles with prefix, other than the current one.
+
+        :returns: Names of deleted profiles.
+        """
+        deleted = []
+        for profile in self.lxc.profile_list(project=self.project, remote=self.remote):
+            name = profile["name"]
+            if not name.startswith(self.prefix) or name == self.name:
+                continue
+
+            # Re-read, profile_list() may be stale by the time we get here.
+            details: Dict[str, Any] = self.lxc.profile_show(
+                profile=name, project=self.project, remote=self.remote
+            )
+            if details.get("used_by"):
+                continue
+
+            logger.info("Deleting stale LXD profile %r.", name)
+            self.lxc.profile_delete(
+                profile=name, project=self.project, remote=self.remote
+            )
+            deleted.append(name)
+
+        return deleted
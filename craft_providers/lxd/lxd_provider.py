@@ -14,13 +14,19 @@
 
 """LXD Provider."""
 import logging
-from typing import Optional
+import subprocess
+from typing import Dict, Optional, Tuple
 
 from .. import images
 from ..provider import Provider
+from ..util.manifest_cache import ManifestCache
+from .errors import LXDAPIError
 from .lxc import LXC
 from .lxd import LXD
+from .lxd_capabilities import LXDCapabilityCache
 from .lxd_instance import LXDInstance
+from .lxd_operation import LXDOperation
+from .lxd_profile import LXDProfileManager
 
 logger = logging.getLogger(__name__)
 
@@ -32,16 +38,26 @@ class LXDProvider(Provider):
     :param instance_name: Name of instance to use/create.
     :param auto_clean: Automatically clean LXD instances if required (e.g.
         incompatible).
+    :param capabilities: Cache of server capabilities, defaults to one shared
+        with other processes on the host.
     :param image_remote_addr: Remote address for LXD image to use.
     :param image_remote_name: Remote name for LXD image to use.
     :param image_remote_protocol: Remote protoocl for LXD image to use.
     :param instance: Specific LXDInstance to use, rather than create.
-    :param lxc: LXC client API.
+    :param lxc: LXC client API, e.g. LXC or LXDRestClient.
     :param lxd: LXD server API.
+    :param manifest_cache: Cache of manifests of incremental syncs to
+        instances, defaults to one shared with other processes on the host.
+    :param profile_manager: Manager of the shared profile instances are
+        launched with, defaults to one for the host user.  Profiles left
+        unused by changed settings are deleted on teardown (see
+        LXDProfileManager.collect_garbage()).
     :param project: Name of LXD project.
     :param remote: Name of LXD remote for instance to run on.
     :param use_ephemeral_instances: Set instances to be ephemeral (clean on
         shutdown).
+    :param use_exec_agent: Run commands in instances through a long-lived
+        agent, rather than an lxc exec each (see LXDInstance).
     :param use_intermediate_instances: Create intermediate instances to speedup
         setup of future instances.
     """
@@ -53,15 +69,19 @@ class LXDProvider(Provider):
         image: images.Image,
         instance_name: str,
         auto_clean: bool = True,
+        capabilities: Optional[LXDCapabilityCache] = None,
         image_remote_addr: str = "https://cloud-images.ubuntu.com/buildd/releases",
         image_remote_name: str = "ubuntu-buildd",
         image_remote_protocol: str = "simplestreams",
         instance: Optional[LXDInstance] = None,
         lxc: Optional[LXC] = None,
         lxd: Optional[LXD] = None,
+        manifest_cache: Optional[ManifestCache] = None,
+        profile_manager: Optional[LXDProfileManager] = None,
         project: str = "default",
         remote: str = "local",
         use_ephemeral_instances: bool = True,
+        use_exec_agent: bool = False,
         use_intermediate_image: bool = True,
     ):
         super().__init__()
@@ -80,16 +100,43 @@ class LXDProvider(Provider):
         else:
             self.lxc = lxc
 
+        self.project = project
+        self.remote = remote
+
+        if capabilities is None:
+            self.capabilities = LXDCapabilityCache(
+                lxc=self.lxc, project=project, remote=remote
+            )
+        else:
+            self.capabilities = capabilities
+
         if lxd is None:
-            self.lxd = LXD()
+            self.lxd = LXD(capabilities=self.capabilities)
         else:
             self.lxd = lxd
 
-        self.project = project
-        self.remote = remote
+        if manifest_cache is None:
+            self.manifest_cache = ManifestCache()
+        else:
+            self.manifest_cache = manifest_cache
+
+        if profile_manager is None:
+            self.profile_manager = LXDProfileManager(
+                lxc=self.lxc,
+                project=project,
+                remote=remote,
+                capabilities=self.capabilities,
+            )
+        else:
+            self.profile_manager = profile_manager
+
         self.use_ephemeral_instances = use_ephemeral_instances
+        self.use_exec_agent = use_exec_agent
         self.use_intermediate_image = use_intermediate_image
 
+        # Cleared if image aliases cannot be resolved directly on the remote.
+        self._image_alias_get_supported = True
+
     def setup(self) -> LXDInstance:
         """Create, start, and configure instance as necessary.
 
@@ -103,13 +150,17 @@ class LXDProvider(Provider):
         self._setup_image_remote()
 
         if self.use_intermediate_image:
-            intermediate_image = self._setup_intermediate_image()
-            self.instance = self._setup_instance(
-                instance=self.instance_name,
-                image=intermediate_image,
-                image_remote=self.remote,
-                ephemeral=self.use_ephemeral_instances,
-            )
+            intermediate_image, cleanup = self._setup_intermediate_image()
+            try:
+                self.instance = self._setup_instance(
+                    instance=self.instance_name,
+                    image=intermediate_image,
+                    image_remote=self.remote,
+                    ephemeral=self.use_ephemeral_instances,
+                )
+            finally:
+                if cleanup is not None:
+                    self._wait_cleanup(cleanup)
         else:
             self.instance = self._setup_instance(
                 instance=self.instance_name,
@@ -169,6 +220,9 @@ class LXDProvider(Provider):
             project=self.project,
             remote=self.remote,
             lxc=self.lxc,
+            capabilities=self.capabilities,
+            manifest_cache=self.manifest_cache,
+            use_exec_agent=self.use_exec_agent,
         )
 
         # If instance already exists, special case it
@@ -181,11 +235,54 @@ class LXDProvider(Provider):
                 image=image,
                 image_remote=image_remote,
                 ephemeral=ephemeral,
+                profile_manager=self.profile_manager,
             )
 
         return lxd_instance
 
-    def _setup_intermediate_image(self) -> str:
+    def _find_image(self, alias: str) -> Optional[str]:
+        """Find image with alias on the instance's remote.
+
+        Each alias is resolved directly, on every call, so an image deleted
+        since the last call is not found.  Only if that is unsupported are
+        all images listed, to index their aliases.
+
+        :param alias: Image alias.
+
+        :returns: Image fingerprint, if found, else None.
+        """
+        if self._image_alias_get_supported:
+            try:
+                record = self.lxc.image_alias_get(
+                    alias=alias, project=self.project, remote=self.remote
+                )
+            except (subprocess.CalledProcessError, LXDAPIError) as error:
+                logger.debug("Failed to get image alias %r: %s", alias, error)
+                self._image_alias_get_supported = False
+            else:
+                return None if record is None else record["target"]
+
+        image_aliases = self._index_image_aliases()
+        return image_aliases.get(alias)
+
+    def _index_image_aliases(self) -> Dict[str, str]:
+        """Index aliases of all images on the instance's remote.
+
+        :returns: Dictionary of alias to image fingerprint.
+        """
+        images = self.lxc.image_records(project=self.project, remote=self.remote)
+        return {
+            image_alias: image.fingerprint
+            for image in images
+            for image_alias in image.aliases
+        }
+
+    def _setup_intermediate_image(self) -> Tuple[str, Optional[LXDOperation]]:
+        """Ensure intermediate image exists.
+
+        :returns: Tuple of intermediate image name and the operation deleting
+            the intermediate instance, if any, which runs in the background.
+        """
         intermediate_name = "-".join(
             [
                 self.image_remote_name,
@@ -193,12 +290,9 @@ class LXDProvider(Provider):
             ]
         )
 
-        image_list = self.lxc.image_list(project=self.project, remote=self.remote)
-        for image in image_list:
-            for alias in image["aliases"]:
-                if intermediate_name == alias["name"]:
-                    logger.info("Using intermediate image.")
-                    return intermediate_name
+        if self._find_image(intermediate_name) is not None:
+            logger.info("Using intermediate image.")
+            return intermediate_name, None
 
         # Intermediate instances cannot be ephemeral. Publishing may fail.
         intermediate_instance = self._setup_instance(
@@ -217,9 +311,21 @@ class LXDProvider(Provider):
             force=True,
         )
 
-        # Nuke it.
-        intermediate_instance.delete(force=True)
-        return intermediate_name
+        # Nuke it, while the caller gets on with launching from the image.
+        cleanup = intermediate_instance.begin_delete(force=True)
+        return intermediate_name, cleanup
+
+    @staticmethod
+    def _wait_cleanup(cleanup: LXDOperation) -> None:
+        """Wait for intermediate instance to be deleted.
+
+        Failure is logged rather than raised, as the image it was published
+        to is usable, and to not replace any error raised during setup.
+        """
+        try:
+            cleanup.wait()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning("Failed to delete intermediate instance: %s", error)
 
     def _setup_project(self) -> None:
         projects = self.lxc.project_list(remote=self.remote)
@@ -231,14 +337,16 @@ class LXDProvider(Provider):
 
         :param clean: Purge environment if True.
         """
-        if self.instance is None:
-            return
-
-        if not self.instance.exists():
-            return
+        if self.instance is not None and self.instance.exists():
+            if self.instance.is_running():
+                self.instance.stop()
 
-        if self.instance.is_running():
-            self.instance.stop()
+            # Ephemeral instances are deleted once stopped.
+            if clean and self.instance.exists():
+                self.instance.delete(force=True)
 
-        if clean:
-            self.instance.delete(force=True)
+        # Each change of settings leaves the previous profile behind.
+        try:
+            self.profile_manager.collect_garbage()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning("Failed to delete stale LXD profiles: %s", error)
@@ -0,0 +1,1129 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""LXD REST API client."""
+import json
+import logging
+import pathlib
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .errors import LXDAPIError
+from .lxc import LXC
+from .lxc_metrics import LXCMetrics
+from .lxd_connection_pool import LXDConnectionPool, get_connection_pool
+from .lxd_operation import LXDOperation
+
+logger = logging.getLogger(__name__)
+
+# Operation status codes for completed operations (success, failure, cancelled).
+_OPERATION_DONE_STATUS_CODES = (200, 400, 401)
+
+
+class LXDRestClient(LXC):  # pylint: disable=too-many-public-methods
+    """Drop-in replacement for LXC, talking to the LXD API over its unix socket.
+
+    Calls against the "local" remote are made directly against the LXD API,
+    avoiding the cost of spawning lxc for each query.  Calls which require
+    an interactive stream (exec, recursive file transfers), client-side
+    configuration (remotes), or a remote other than "local" are delegated to
+    the lxc wrapper.
+
+    :param lxc_path: Path to lxc, used for delegated calls.
+    :param socket_path: Path to LXD's unix socket.
+    :param timeout: Socket timeout in seconds, None to block.
+    :param pool: Connection pool to use, defaults to the pool shared by all
+        clients of the socket in this process.
+    :param metrics: Metrics to record subcommand and API request latency to,
+        defaults to the metrics shared by all clients in this process.
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc_path: pathlib.Path = pathlib.Path("/snap/bin/lxc"),
+        socket_path: pathlib.Path = pathlib.Path(
+            "/var/snap/lxd/common/lxd/unix.socket"
+        ),
+        timeout: Optional[float] = None,
+        pool: Optional[LXDConnectionPool] = None,
+        metrics: Optional[LXCMetrics] = None,
+    ):
+        super().__init__(lxc_path=lxc_path, metrics=metrics)
+
+        self.socket_path = socket_path
+        self.timeout = timeout
+        if pool is None:
+            self.pool = get_connection_pool(socket_path)
+        else:
+            self.pool = pool
+
+    def _request_raw(  # pylint: disable=too-many-arguments
+        self,
+        method: str,
+        endpoint: str,
+        *,
+        project: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Make request to LXD API.
+
+        :returns: Tuple of status, headers and response body.
+        """
+        query = dict(params or {})
+        if project is not None:
+            query["project"] = project
+
+        url = endpoint
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+
+        logger.debug("LXD API request: %s %s", method, url)
+
+        # Record requests by collection, e.g. "api GET instances".
+        collection = endpoint.split("/")[2] if endpoint.count("/") > 1 else ""
+        start = time.monotonic()
+        status, response_headers, data = self.pool.request(
+            method, url, body=body, headers=headers, timeout=self.timeout
+        )
+        self.metrics.record(
+            f"api {method} {collection}".rstrip(),
+            duration=time.monotonic() - start,
+            returncode=0 if status < 400 else status,
+            output_bytes=len(data),
+        )
+
+        return status, response_headers, data
+
+    def _request(  # pylint: disable=too-many-arguments
+        self,
+        method: str,
+        endpoint: str,
+        *,
+        project: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+        data: Optional[Any] = None,
+        wait: bool = True,
+        operation: Optional[LXDOperation] = None,
+    ) -> Any:
+        """Make JSON request to LXD API, waiting for any resulting operation.
+
+        :param operation: Operation handle to report progress to, and to
+            cancel via.
+
+        :returns: Response metadata.
+
+        :raises LXDAPIError: on error response.
+        """
+        if operation is not None and operation.cancelled:
+            raise LXDAPIError(error="Operation cancelled", error_code=401)
+
+        body = None
+        headers = {}
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json"
+
+        status, _, raw = self._request_raw(
+            method,
+            endpoint,
+            project=project,
+            params=params,
+            body=body,
+            headers=headers,
+        )
+
+        response = json.loads(raw)
+        if response.get("type") == "error":
+            raise LXDAPIError(
+                error=response.get("error", ""),
+                error_code=response.get("error_code", status),
+            )
+
+        if response.get("type") == "async" and wait:
+            return self._wait_operation(response["operation"], operation=operation)
+
+        return response.get("metadata")
+
+    def _wait_operation(
+        self, url: str, *, operation: Optional[LXDOperation] = None
+    ) -> Any:
+        """Wait for operation to complete.
+
+        :param url: Operation URL.
+        :param operation: Operation handle to report progress to, and to
+            cancel via.
+
+        :returns: Operation metadata.
+
+        :raises LXDAPIError: if operation failed.
+        """
+        # Operation URLs may carry a project query, which the wait endpoint
+        # does not need.
+        endpoint = urllib.parse.urlsplit(url).path
+
+        if operation is None:
+            metadata = self._request("GET", endpoint + "/wait")
+        else:
+            metadata = self._poll_operation(endpoint, operation=operation)
+
+        if metadata.get("status_code") != 200:
+            raise LXDAPIError(
+                error=metadata.get("err", ""),
+                error_code=metadata.get("status_code", 0),
+            )
+
+        return metadata
+
+    def _poll_operation(self, endpoint: str, *, operation: LXDOperation) -> Any:
+        """Wait for operation in short intervals, reporting its progress."""
+        operation.set_cancel_hook(lambda: self._cancel_operation(endpoint))
+        try:
+            while True:
+                try:
+                    metadata = self._request(
+                        "GET", endpoint + "/wait", params={"timeout": "1"}
+                    )
+                except LXDAPIError as error:
+                    # Newer LXD reports a wait which timed out as an error,
+                    # fetch the operation to report its progress.
+                    if error.error_code != 504:
+                        raise
+                    metadata = self._request("GET", endpoint)
+
+                for key, value in (metadata.get("metadata") or {}).items():
+                    if key.endswith("_progress") and isinstance(value, str):
+                        operation.set_progress(value)
+
+                if metadata.get("status_code") in _OPERATION_DONE_STATUS_CODES:
+                    return metadata
+        finally:
+            operation.set_cancel_hook(None)
+
+    def _cancel_operation(self, endpoint: str) -> None:
+        try:
+            self._request("DELETE", endpoint)
+        except LXDAPIError as error:
+            logger.debug("Failed to cancel operation %r: %s", endpoint, error)
+
+    def _start_operation(
+        self, description: str, func: Callable[[LXDOperation], None]
+    ) -> LXDOperation:
+        return LXDOperation(description=description).start(func)
+
+    def _resolve_image_source(self, *, image: str, image_remote: str) -> Dict[str, Any]:
+        """Formulate image source for instance or image creation."""
+        if image_remote == "local":
+            return {"type": "image", "alias": image}
+
+        remote = self.remote_list().get(image_remote)
+        if remote is None:
+            raise LXDAPIError(
+                error=f"Remote {image_remote!r} not found", error_code=404
+            )
+
+        return {
+            "type": "image",
+            "mode": "pull",
+            "server": remote["addr"],
+            "protocol": remote["protocol"],
+            "alias": image,
+        }
+
+    @staticmethod
+    def _instance_endpoint(instance: str) -> str:
+        return "/1.0/instances/" + urllib.parse.quote(instance, safe="")
+
+    def _update_state(
+        self,
+        *,
+        instance: str,
+        action: str,
+        project: str,
+        force: bool = False,
+        timeout: int = -1,
+        operation: Optional[LXDOperation] = None,
+    ) -> None:
+        self._request(
+            "PUT",
+            self._instance_endpoint(instance) + "/state",
+            project=project,
+            data={"action": action, "force": force, "timeout": timeout},
+            operation=operation,
+        )
+
+    def config_device_add_disk(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        device_name: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Mount host source directory to target mount point."""
+        if remote != "local":
+            super().config_device_add_disk(
+                instance=instance,
+                source=source,
+                destination=destination,
+                device_name=device_name,
+                project=project,
+                remote=remote,
+            )
+            return
+
+        if device_name is None:
+            device_name = destination.as_posix().replace("/", "_")
+
+        devices = self.config_device_show(
+            instance=instance, project=project, remote=remote
+        )
+        if device_name in devices:
+            raise LXDAPIError(
+                error=f"The device already exists: {device_name}", error_code=400
+            )
+
+        devices[device_name] = {
+            "type": "disk",
+            "source": source.as_posix(),
+            "path": destination.as_posix(),
+        }
+
+        self._request(
+            "PATCH",
+            self._instance_endpoint(instance),
+            project=project,
+            data={"devices": devices},
+        )
+
+    def config_device_show(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        """Show device config."""
+        if remote != "local":
+            return super().config_device_show(
+                instance=instance, project=project, remote=remote
+            )
+
+        metadata = self._request(
+            "GET", self._instance_endpoint(instance), project=project
+        )
+        return metadata.get("devices", {})
+
+    def config_patch(
+        self,
+        *,
+        instance: str,
+        config: Optional[Dict[str, str]] = None,
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Apply config keys and devices to instance in a single request."""
+        if remote != "local":
+            super().config_patch(
+                instance=instance,
+                config=config,
+                devices=devices,
+                project=project,
+                remote=remote,
+            )
+            return
+
+        data: Dict[str, Any] = {}
+        if config:
+            data["config"] = config
+        if devices:
+            data["devices"] = devices
+        if not data:
+            return
+
+        self._request(
+            "PATCH", self._instance_endpoint(instance), project=project, data=data
+        )
+
+    def config_set(
+        self,
+        *,
+        instance: str,
+        key: str,
+        value: str,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Set instance configuration key."""
+        if remote != "local":
+            super().config_set(
+                instance=instance, key=key, value=value, project=project, remote=remote
+            )
+            return
+
+        self._request(
+            "PATCH",
+            self._instance_endpoint(instance),
+            project=project,
+            data={"config": {key: value}},
+        )
+
+    def delete(
+        self,
+        *,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        force=False,
+    ) -> None:
+        """Delete instance."""
+        if remote != "local":
+            super().delete(
+                instance=instance, project=project, remote=remote, force=force
+            )
+            return
+
+        self._delete(instance=instance, project=project, force=force)
+
+    def begin_delete(
+        self,
+        *,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        force=False,
+    ) -> LXDOperation:
+        """Start deleting instance.
+
+        :returns: Operation handle.
+        """
+        if remote != "local":
+            return super().begin_delete(
+                instance=instance, project=project, remote=remote, force=force
+            )
+
+        return self._start_operation(
+            f"delete {instance}",
+            lambda operation: self._delete(
+                instance=instance, project=project, force=force, operation=operation
+            ),
+        )
+
+    def _delete(
+        self,
+        *,
+        instance: str,
+        project: str,
+        force: bool,
+        operation: Optional[LXDOperation] = None,
+    ) -> None:
+        if force:
+            state = self._request(
+                "GET", self._instance_endpoint(instance), project=project
+            )
+            if state.get("status") != "Stopped":
+                self._update_state(
+                    instance=instance,
+                    action="stop",
+                    project=project,
+                    force=True,
+                    operation=operation,
+                )
+
+                # Ephemeral instances are deleted by LXD when stopped.
+                if state.get("ephemeral"):
+                    return
+
+        self._request(
+            "DELETE",
+            self._instance_endpoint(instance),
+            project=project,
+            operation=operation,
+        )
+
+    def file_pull(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        recursive: bool = False,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Retrieve file from instance."""
+        if remote != "local" or recursive:
+            super().file_pull(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                project=project,
+                remote=remote,
+            )
+            return
+
+        status, headers, data = self._request_raw(
+            "GET",
+            self._instance_endpoint(instance) + "/files",
+            project=project,
+            params={"path": source.as_posix()},
+        )
+
+        if status != 200:
+            response = json.loads(data)
+            raise LXDAPIError(
+                error=response.get("error", ""),
+                error_code=response.get("error_code", status),
+            )
+
+        if headers.get("X-LXD-type", "file") != "file":
+            raise LXDAPIError(
+                error=f"{source.as_posix()!r} is not a file", error_code=400
+            )
+
+        if destination.is_dir():
+            destination = destination / source.name
+        elif create_dirs:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+
+        destination.write_bytes(data)
+
+    def file_push(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = False,
+        recursive: bool = False,
+        gid: str = "-1",
+        uid: str = "-1",
+        mode: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Create file with content and file mode."""
+        if remote != "local" or recursive or create_dirs:
+            super().file_push(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                gid=gid,
+                uid=uid,
+                mode=mode,
+                project=project,
+                remote=remote,
+            )
+            return
+
+        # Match lxc's behavior of using source file ownership and mode
+        # unless otherwise specified.
+        stat = source.stat()
+        if uid == "-1":
+            uid = str(stat.st_uid)
+        if gid == "-1":
+            gid = str(stat.st_gid)
+        if mode is None:
+            mode = f"{stat.st_mode & 0o7777:04o}"
+
+        status, _, data = self._request_raw(
+            "POST",
+            self._instance_endpoint(instance) + "/files",
+            project=project,
+            params={"path": destination.as_posix()},
+            body=source.read_bytes(),
+            headers={
+                "Content-Type": "application/octet-stream",
+                "X-LXD-type": "file",
+                "X-LXD-uid": uid,
+                "X-LXD-gid": gid,
+                "X-LXD-mode": mode,
+                "X-LXD-write": "overwrite",
+            },
+        )
+
+        if status != 200:
+            response = json.loads(data)
+            raise LXDAPIError(
+                error=response.get("error", ""),
+                error_code=response.get("error_code", status),
+            )
+
+    def info(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        """Get server config that instance is running on."""
+        if remote != "local":
+            return super().info(project=project, remote=remote)
+
+        return self._request("GET", "/1.0", project=project)
+
+    def instance_get(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get instance configuration and status.
+
+        :returns: Instance information if instance exists, else None.
+        """
+        if remote != "local":
+            return super().instance_get(
+                instance=instance, project=project, remote=remote
+            )
+
+        try:
+            return self._request(
+                "GET", self._instance_endpoint(instance), project=project
+            )
+        except LXDAPIError as error:
+            if error.error_code == 404:
+                return None
+            raise error
+
+    def launch(
+        self,
+        *,
+        config_keys: Dict[str, str],
+        image: str,
+        image_remote: str,
+        instance: str,
+        ephemeral: bool = False,
+        project: str = "default",
+        remote: str = "local",
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        profiles: Optional[List[str]] = None,
+    ) -> None:
+        """Launch instance."""
+        if remote != "local":
+            super().launch(
+                config_keys=config_keys,
+                image=image,
+                image_remote=image_remote,
+                instance=instance,
+                ephemeral=ephemeral,
+                project=project,
+                remote=remote,
+                devices=devices,
+                profiles=profiles,
+            )
+            return
+
+        self._launch(
+            config_keys=config_keys,
+            image=image,
+            image_remote=image_remote,
+            instance=instance,
+            ephemeral=ephemeral,
+            project=project,
+            devices=devices,
+            profiles=profiles,
+        )
+
+    def begin_launch(
+        self,
+        *,
+        config_keys: Dict[str, str],
+        image: str,
+        image_remote: str,
+        instance: str,
+        ephemeral: bool = False,
+        project: str = "default",
+        remote: str = "local",
+        profiles: Optional[List[str]] = None,
+    ) -> LXDOperation:
+        """Start launching instance.
+
+        :returns: Operation handle.
+        """
+        if remote != "local":
+            return super().begin_launch(
+                config_keys=config_keys,
+                image=image,
+                image_remote=image_remote,
+                instance=instance,
+                ephemeral=ephemeral,
+                project=project,
+                remote=remote,
+                profiles=profiles,
+            )
+
+        return self._start_operation(
+            f"launch {instance}",
+            lambda operation: self._launch(
+                config_keys=config_keys,
+                image=image,
+                image_remote=image_remote,
+                instance=instance,
+                ephemeral=ephemeral,
+                project=project,
+                profiles=profiles,
+                operation=operation,
+            ),
+        )
+
+    def _launch(
+        self,
+        *,
+        config_keys: Dict[str, str],
+        image: str,
+        image_remote: str,
+        instance: str,
+        ephemeral: bool,
+        project: str,
+        devices: Optional[Dict[str, Dict[str, str]]] = None,
+        profiles: Optional[List[str]] = None,
+        operation: Optional[LXDOperation] = None,
+    ) -> None:
+        data: Dict[str, Any] = {
+            "name": instance,
+            "config": dict(config_keys or {}),
+            "devices": dict(devices or {}),
+            "ephemeral": ephemeral,
+            "source": self._resolve_image_source(
+                image=image, image_remote=image_remote
+            ),
+        }
+        if profiles is not None:
+            data["profiles"] = list(profiles)
+
+        self._request(
+            "POST", "/1.0/instances", project=project, data=data, operation=operation
+        )
+
+        self._update_state(
+            instance=instance, action="start", project=project, operation=operation
+        )
+
+    def image_alias_get(
+        self, *, alias: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get image alias.
+
+        :returns: Alias information, including the image fingerprint as
+            "target", if alias exists, else None.
+        """
+        if remote != "local":
+            return super().image_alias_get(alias=alias, project=project, remote=remote)
+
+        try:
+            return self._request(
+                "GET",
+                "/1.0/images/aliases/" + urllib.parse.quote(alias, safe=""),
+                project=project,
+            )
+        except LXDAPIError as error:
+            if error.error_code == 404:
+                return None
+            raise error
+
+    def image_copy(
+        self,
+        *,
+        image: str,
+        image_remote: str,
+        alias: str,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Copy image."""
+        if remote != "local":
+            super().image_copy(
+                image=image,
+                image_remote=image_remote,
+                alias=alias,
+                project=project,
+                remote=remote,
+            )
+            return
+
+        self._image_copy(
+            image=image, image_remote=image_remote, alias=alias, project=project
+        )
+
+    def begin_image_copy(
+        self,
+        *,
+        image: str,
+        image_remote: str,
+        alias: str,
+        project: str = "default",
+        remote: str = "local",
+    ) -> LXDOperation:
+        """Start copying image.
+
+        :returns: Operation handle.
+        """
+        if remote != "local":
+            return super().begin_image_copy(
+                image=image,
+                image_remote=image_remote,
+                alias=alias,
+                project=project,
+                remote=remote,
+            )
+
+        return self._start_operation(
+            f"image copy {image_remote}:{image}",
+            lambda operation: self._image_copy(
+                image=image,
+                image_remote=image_remote,
+                alias=alias,
+                project=project,
+                operation=operation,
+            ),
+        )
+
+    def _image_copy(
+        self,
+        *,
+        image: str,
+        image_remote: str,
+        alias: str,
+        project: str,
+        operation: Optional[LXDOperation] = None,
+    ) -> None:
+        self._request(
+            "POST",
+            "/1.0/images",
+            project=project,
+            data={
+                "source": self._resolve_image_source(
+                    image=image, image_remote=image_remote
+                ),
+                "aliases": [{"name": alias}],
+            },
+            operation=operation,
+        )
+
+    def image_delete(
+        self, *, image: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Delete image."""
+        if remote != "local":
+            super().image_delete(image=image, project=project, remote=remote)
+            return
+
+        # Like lxc, accept either an alias or a fingerprint.
+        alias = self.image_alias_get(alias=image, project=project)
+        if alias is None:
+            fingerprint = image
+        else:
+            fingerprint = alias["target"]
+
+        self._request(
+            "DELETE",
+            "/1.0/images/" + urllib.parse.quote(fingerprint, safe=""),
+            project=project,
+        )
+
+    def image_list(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[Dict[str, Any]]:
+        """List images."""
+        if remote != "local":
+            return super().image_list(project=project, remote=remote)
+
+        return self._request(
+            "GET", "/1.0/images", project=project, params={"recursion": "1"}
+        )
+
+    def list(
+        self,
+        *,
+        instance: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> List[Dict[str, Any]]:
+        """List instances."""
+        if remote != "local":
+            return super().list(instance=instance, project=project, remote=remote)
+
+        instances = self._request(
+            "GET", "/1.0/instances", project=project, params={"recursion": "2"}
+        )
+
+        # Match lxc's name filtering.
+        if instance:
+            instances = [i for i in instances if i["name"].startswith(instance)]
+
+        return instances
+
+    def profile_create(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Create profile."""
+        if remote != "local":
+            super().profile_create(profile=profile, project=project, remote=remote)
+            return
+
+        self._request("POST", "/1.0/profiles", project=project, data={"name": profile})
+
+    def profile_delete(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Delete profile."""
+        if remote != "local":
+            super().profile_delete(profile=profile, project=project, remote=remote)
+            return
+
+        self._request(
+            "DELETE",
+            "/1.0/profiles/" + urllib.parse.quote(profile, safe=""),
+            project=project,
+        )
+
+    def profile_edit(
+        self,
+        *,
+        profile: str,
+        config: Dict[str, Any],
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Edit profile."""
+        if remote != "local":
+            super().profile_edit(
+                profile=profile, config=config, project=project, remote=remote
+            )
+            return
+
+        self._request(
+            "PUT",
+            "/1.0/profiles/" + urllib.parse.quote(profile, safe=""),
+            project=project,
+            data={
+                "config": config.get("config", {}),
+                "description": config.get("description", ""),
+                "devices": config.get("devices", {}),
+            },
+        )
+
+    def profile_get(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> Optional[Dict[str, Any]]:
+        """Get profile.
+
+        :returns: Profile configuration if profile exists, else None.
+        """
+        if remote != "local":
+            return super().profile_get(profile=profile, project=project, remote=remote)
+
+        try:
+            return self._request(
+                "GET",
+                "/1.0/profiles/" + urllib.parse.quote(profile, safe=""),
+                project=project,
+            )
+        except LXDAPIError as error:
+            if error.error_code == 404:
+                return None
+            raise error
+
+    def profile_show(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        """Get profile."""
+        if remote != "local":
+            return super().profile_show(profile=profile, project=project, remote=remote)
+
+        return self._request(
+            "GET",
+            "/1.0/profiles/" + urllib.parse.quote(profile, safe=""),
+            project=project,
+        )
+
+    def profile_list(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[Dict[str, Any]]:
+        """List profiles."""
+        if remote != "local":
+            return super().profile_list(project=project, remote=remote)
+
+        return self._request(
+            "GET", "/1.0/profiles", project=project, params={"recursion": "1"}
+        )
+
+    def project_create(self, *, project: str, remote: str = "local") -> None:
+        """Create project."""
+        if remote != "local":
+            super().project_create(project=project, remote=remote)
+            return
+
+        self._request("POST", "/1.0/projects", data={"name": project})
+
+    def project_list(self, remote: str = "local") -> List[str]:
+        """Get list of projects.
+
+        :returns: Sorted list of project names.
+        """
+        if remote != "local":
+            return super().project_list(remote=remote)
+
+        urls = self._request("GET", "/1.0/projects")
+        return sorted([urllib.parse.unquote(u.rsplit("/", 1)[-1]) for u in urls])
+
+    def project_delete(self, *, project: str, remote: str = "local") -> None:
+        """Delete project, if exists."""
+        if remote != "local":
+            super().project_delete(project=project, remote=remote)
+            return
+
+        self._request("DELETE", "/1.0/projects/" + urllib.parse.quote(project, safe=""))
+
+    def publish(
+        self,
+        *,
+        alias: str,
+        instance: str,
+        project: str,
+        force: bool = True,
+        remote: str = "local",
+    ) -> None:
+        """Publish instance as image."""
+        if remote != "local":
+            super().publish(
+                alias=alias,
+                instance=instance,
+                project=project,
+                force=force,
+                remote=remote,
+            )
+            return
+
+        self._publish(alias=alias, instance=instance, project=project, force=force)
+
+    def begin_publish(
+        self,
+        *,
+        alias: str,
+        instance: str,
+        project: str,
+        force: bool = True,
+        remote: str = "local",
+    ) -> LXDOperation:
+        """Start publishing instance as image.
+
+        :returns: Operation handle.
+        """
+        if remote != "local":
+            return super().begin_publish(
+                alias=alias,
+                instance=instance,
+                project=project,
+                force=force,
+                remote=remote,
+            )
+
+        return self._start_operation(
+            f"publish {instance}",
+            lambda operation: self._publish(
+                alias=alias,
+                instance=instance,
+                project=project,
+                force=force,
+                operation=operation,
+            ),
+        )
+
+    def _publish(
+        self,
+        *,
+        alias: str,
+        instance: str,
+        project: str,
+        force: bool,
+        operation: Optional[LXDOperation] = None,
+    ) -> None:
+        # Like lxc, force stops a running instance and restarts it afterwards.
+        restart = False
+        if force:
+            state = self._request(
+                "GET", self._instance_endpoint(instance), project=project
+            )
+            if state.get("status") == "Running":
+                self._update_state(
+                    instance=instance,
+                    action="stop",
+                    project=project,
+                    force=True,
+                    operation=operation,
+                )
+                restart = True
+
+        self._request(
+            "POST",
+            "/1.0/images",
+            project=project,
+            data={
+                "source": {"type": "instance", "name": instance},
+                "aliases": [{"name": alias}],
+            },
+            operation=operation,
+        )
+
+        if restart:
+            self._update_state(
+                instance=instance, action="start", project=project, operation=operation
+            )
+
+    def setup(self) -> None:
+        """(Re)Setup client."""
+        super().setup()
+
+        if not self.socket_path.exists():
+            raise RuntimeError(f"LXD socket {str(self.socket_path)!r} not found.")
+
+    def start(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        """Start container."""
+        if remote != "local":
+            super().start(instance=instance, project=project, remote=remote)
+            return
+
+        self._update_state(instance=instance, action="start", project=project)
+
+    def stop(
+        self,
+        *,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        force=True,
+        timeout: int = -1,
+    ) -> None:
+        """Stop container."""
+        if remote != "local":
+            super().stop(
+                instance=instance,
+                project=project,
+                remote=remote,
+                force=force,
+                timeout=timeout,
+            )
+            return
+
+        self._update_state(
+            instance=instance,
+            action="stop",
+            project=project,
+            force=force,
+            timeout=timeout,
+        )
@@ -0,0 +1,157 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Typed records for LXD instances, images and devices.
+
+Records wrap the data decoded from LXD without copying it.  Fields are
+read from the underlying data on access, and derived fields are computed
+once, on first access.
+
+Records are views for typed access, they do not reduce memory: the data
+is decoded in full by json.loads(), as the json module cannot decode part
+of a document, and splitting the raw output into per-record documents in
+Python would cost more than decoding it.
+"""
+import pathlib
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+
+class _Record:
+    """Base record wrapping decoded LXD data."""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self._data = data
+
+    def __eq__(self, other: object) -> bool:
+        """Compare records by type and data."""
+        if type(other) is not type(self):  # pylint: disable=unidiomatic-typecheck
+            return NotImplemented
+        return self._data == other._data  # type: ignore
+
+    def __repr__(self) -> str:
+        """Return representation."""
+        return f"{type(self).__name__}({self._data!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the underlying data, as returned by the dict-based APIs."""
+        return self._data
+
+
+class InstanceState(_Record):
+    """Instance configuration and status."""
+
+    __slots__ = ()
+
+    @property
+    def name(self) -> str:
+        """Name of instance."""
+        return self._data["name"]
+
+    @property
+    def status(self) -> str:
+        """Status of instance, e.g. "Running" or "Stopped"."""
+        return self._data.get("status", "")
+
+    @property
+    def is_running(self) -> bool:
+        """True if instance is running."""
+        return self.status == "Running"
+
+    @property
+    def ephemeral(self) -> bool:
+        """True if instance is ephemeral."""
+        return bool(self._data.get("ephemeral", False))
+
+    @property
+    def config(self) -> Mapping[str, str]:
+        """Instance-local configuration keys."""
+        return self._data.get("config") or {}
+
+    @property
+    def profiles(self) -> Tuple[str, ...]:
+        """Profiles applied to instance."""
+        return tuple(self._data.get("profiles") or ())
+
+
+class ImageRecord(_Record):
+    """Image fingerprint and aliases."""
+
+    __slots__ = ("_aliases",)
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        super().__init__(data)
+        self._aliases: Optional[Tuple[str, ...]] = None
+
+    @property
+    def fingerprint(self) -> str:
+        """Image fingerprint."""
+        return self._data["fingerprint"]
+
+    @property
+    def aliases(self) -> Tuple[str, ...]:
+        """Alias names for image."""
+        if self._aliases is None:
+            self._aliases = tuple(a["name"] for a in self._data.get("aliases") or ())
+        return self._aliases
+
+    def has_alias(self, alias: str) -> bool:
+        """Check if image has alias.
+
+        :param alias: Alias name to check for.
+
+        :returns: True if image has alias.
+        """
+        return alias in self.aliases
+
+
+class DiskDevice(_Record):
+    """Disk device configured for an instance."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str, data: Dict[str, Any]) -> None:
+        super().__init__(data)
+        self.name = name
+
+    def __eq__(self, other: object) -> bool:
+        """Compare devices by name and data."""
+        if not isinstance(other, DiskDevice):
+            return NotImplemented
+        return (self.name, self._data) == (other.name, other._data)
+
+    def __repr__(self) -> str:
+        """Return representation."""
+        return f"DiskDevice({self.name!r}, {self._data!r})"
+
+    @property
+    def source(self) -> Optional[str]:
+        """Host source path, if any."""
+        return self._data.get("source")
+
+    @property
+    def path(self) -> Optional[str]:
+        """Instance mount path, if any."""
+        return self._data.get("path")
+
+    def is_mount_of(self, *, source: pathlib.Path, destination: pathlib.Path) -> bool:
+        """Check if device mounts host source at instance destination.
+
+        :param source: Host path to check.
+        :param destination: Instance path to check.
+
+        :returns: True if source is mounted at destination.
+        """
+        return self.source == source.as_posix() and self.path == destination.as_posix()
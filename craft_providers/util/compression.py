@@ -0,0 +1,185 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Stream compression for tar pipelines."""
+import logging
+import os
+import pathlib
+import zlib
+from typing import Callable, Collection, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+COMPRESSORS = ("zstd", "gzip")
+
+# Level used if none is given, favouring speed.
+_DEFAULT_LEVELS = {"gzip": 1, "zstd": 3}
+
+# Compress if a sample shrinks to below this fraction of its size.
+_COMPRESSIBLE_RATIO = 0.7
+
+
+class Compressor(NamedTuple):
+    """Compression program, as used by both tar commands of a pipeline.
+
+    :param name: Name of program, "gzip" or "zstd".
+    :param level: Compression level.
+    """
+
+    name: str
+    level: int
+
+    def command(self, *, decompress: bool = False) -> List[str]:
+        """Get command to compress, or decompress, stdin to stdout."""
+        program = [self.name, f"-{self.level}"]
+        if self.name == "zstd":
+            program.append("-T0")
+        if decompress:
+            program.append("-d")
+
+        return program + ["-c"]
+
+    def tar_options(self) -> List[str]:
+        """Get options for tar to compress or decompress its archive."""
+        program = [self.name, f"-{self.level}"]
+        if self.name == "zstd":
+            program.append("-T0")
+
+        return [f"--use-compress-program={' '.join(program)}"]
+
+
+def parse_compression(compression: str) -> Optional[Compressor]:
+    """Parse compression setting, other than "auto".
+
+    :param compression: "none", or program with optional level, e.g. "gzip"
+        or "zstd:19".
+
+    :returns: Compressor, or None for no compression.
+
+    :raises ValueError: if setting is invalid.
+    """
+    if compression == "none":
+        return None
+
+    name, _, level = compression.partition(":")
+    if name not in COMPRESSORS:
+        raise ValueError(f"Invalid compression {compression!r}.")
+
+    try:
+        return Compressor(name=name, level=int(level or _DEFAULT_LEVELS[name]))
+    except ValueError as error:
+        raise ValueError(f"Invalid compression level {compression!r}.") from error
+
+
+def sample_ratio(
+    root: pathlib.Path, *, max_files: int = 32, sample_size: int = 64 * 1024
+) -> float:
+    """Estimate how well the files in a directory compress.
+
+    The head of up to max_files regular files is compressed with zlib at
+    its fastest level.
+
+    :param root: Directory to sample.
+    :param max_files: Maximum number of files to sample.
+    :param sample_size: Bytes to sample from each file.
+
+    :returns: Ratio of compressed to sampled size, 1.0 if nothing sampled.
+    """
+    compressor = zlib.compressobj(1)
+    sampled = 0
+    compressed = 0
+    files = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if files >= max_files:
+                break
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+
+            try:
+                with open(path, "rb") as stream:
+                    data = stream.read(sample_size)
+            except OSError:
+                continue
+
+            files += 1
+            sampled += len(data)
+            compressed += len(compressor.compress(data))
+        else:
+            continue
+        break
+
+    compressed += len(compressor.flush())
+    if not sampled:
+        return 1.0
+
+    return compressed / sampled
+
+
+def choose_compression(
+    compression: str,
+    *,
+    available: Callable[[], Collection[str]],
+    remote: bool,
+    ratio: Optional[Callable[[], float]] = None,
+) -> Optional[Compressor]:
+    """Choose compressor for a tar pipeline.
+
+    With "auto", local transfers are not compressed, as the pipe is faster
+    than compression.  Remote transfers are compressed with zstd, else gzip,
+    if the data sampled with ratio compresses well.  If it cannot be sampled,
+    they are compressed with zstd only, as it costs little on incompressible
+    data.
+
+    A requested compressor missing from either side is not used.
+
+    :param compression: "auto", "none", or program with optional level, e.g.
+        "gzip" or "zstd:19".
+    :param available: Callable getting names of programs available on both
+        sides, only called if compression may be used.
+    :param remote: True if data crosses the network.
+    :param ratio: Callable estimating compression ratio of the data.
+
+    :returns: Compressor, or None for no compression.
+
+    :raises ValueError: if setting is invalid.
+    """
+    if compression != "auto":
+        compressor = parse_compression(compression)
+        if compressor is not None and compressor.name not in available():
+            logger.warning(
+                "Compressor %r is not available, not compressing.", compressor.name
+            )
+            return None
+        return compressor
+
+    if not remote:
+        return None
+
+    if ratio is None:
+        candidates: Collection[str] = ("zstd",)
+    else:
+        sampled_ratio = ratio()
+        logger.debug("Sampled compression ratio: %.2f", sampled_ratio)
+        if sampled_ratio >= _COMPRESSIBLE_RATIO:
+            return None
+        candidates = COMPRESSORS
+
+    names = available()
+    for name in candidates:
+        if name in names:
+            return Compressor(name=name, level=_DEFAULT_LEVELS[name])
+
+    return None
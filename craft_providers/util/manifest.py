@@ -0,0 +1,249 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Directory manifests, for incremental sync.
+
+A manifest maps each path under a directory, relative to it, to its type,
+size, mtime, permissions, symlink target and, optionally, content digest.
+Comparing the manifest of a source directory with that of its copy gives
+the paths to (re)send and to delete.
+"""
+import hashlib
+import os
+import pathlib
+import stat
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Generates manifest of directory $1, creating it if needed, with digests
+# of files if $2 is 1.  Requires GNU find, and sha256sum for digests.
+# Entries are six NUL-terminated fields, and digests follow an empty field.
+REMOTE_MANIFEST_SCRIPT = """\
+mkdir -p "$1" && cd "$1" || exit 1
+find . -mindepth 1 -printf '%P\\0%y\\0%s\\0%T@\\0%m\\0%l\\0'
+if [ "$2" = 1 ]; then
+    printf '\\0'
+    find . -type f -print0 | xargs -0 -r sha256sum -z
+fi
+"""
+
+_FIELDS = 6
+
+
+class ManifestEntry(NamedTuple):
+    """State of a path in a directory.
+
+    :param type: "f" for regular file, "d" for directory, "l" for symlink,
+        else "o".
+    :param size: Size, in bytes.
+    :param mtime_ns: Modification time, in nanoseconds.
+    :param mode: Permission bits.
+    :param target: Target of symlink, else empty.
+    :param digest: SHA-256 digest of regular file, if computed.
+    :param inode: Inode number, for host paths, else zero.
+    """
+
+    type: str
+    size: int
+    mtime_ns: int
+    mode: int
+    target: str = ""
+    digest: Optional[str] = None
+    inode: int = 0
+
+
+class SyncResult(NamedTuple):
+    """Outcome of an incremental sync.
+
+    :param sent: Paths (re)sent, relative to the directory.
+    :param deleted: Paths deleted, relative to the directory.
+    """
+
+    sent: List[str]
+    deleted: List[str]
+
+
+Manifest = Dict[str, ManifestEntry]
+
+
+def file_digest(path: pathlib.Path) -> str:
+    """Compute SHA-256 digest of file's content.
+
+    :param path: Path to file.
+
+    :returns: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with path.open("rb") as stream:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def entry_from_stat(st: os.stat_result, *, target: str = "") -> ManifestEntry:
+    """Create entry from result of lstat().
+
+    :param st: Result of lstat().
+    :param target: Target of symlink.
+
+    :returns: Manifest entry.
+    """
+    if stat.S_ISREG(st.st_mode):
+        entry_type = "f"
+    elif stat.S_ISDIR(st.st_mode):
+        entry_type = "d"
+    elif stat.S_ISLNK(st.st_mode):
+        entry_type = "l"
+    else:
+        entry_type = "o"
+
+    return ManifestEntry(
+        type=entry_type,
+        size=st.st_size if entry_type == "f" else 0,
+        mtime_ns=st.st_mtime_ns,
+        mode=stat.S_IMODE(st.st_mode),
+        target=target,
+        inode=st.st_ino,
+    )
+
+
+def scan_directory(root: pathlib.Path) -> Manifest:
+    """Generate manifest of host directory, without digests.
+
+    :param root: Directory to scan.
+
+    :returns: Manifest of directory.
+    """
+    manifest: Manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            target = os.readlink(path) if stat.S_ISLNK(st.st_mode) else ""
+            manifest[os.path.relpath(path, root)] = entry_from_stat(st, target=target)
+
+    return manifest
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """Parse decimal seconds, e.g. "1600000000.1234567890", to nanoseconds.
+
+    As printed by find's %T@, or recorded in pax headers.
+    """
+    seconds, _, fraction = timestamp.partition(".")
+    return int(seconds) * 1_000_000_000 + int((fraction + "000000000")[:9])
+
+
+def parse_remote_manifest(output: bytes) -> Manifest:
+    """Parse output of REMOTE_MANIFEST_SCRIPT.
+
+    :param output: Output of script.
+
+    :returns: Manifest of directory, with digests if generated.
+    """
+    fields = [f.decode(errors="surrogateescape") for f in output.split(b"\0")]
+
+    manifest: Manifest = {}
+    offset = 0
+    while offset + _FIELDS <= len(fields) and fields[offset]:
+        path, find_type, size, mtime, mode, target = fields[offset : offset + _FIELDS]
+        entry_type = find_type if find_type in ("f", "d", "l") else "o"
+        manifest[path] = ManifestEntry(
+            type=entry_type,
+            size=int(size) if entry_type == "f" else 0,
+            mtime_ns=parse_timestamp(mtime),
+            mode=int(mode, 8),
+            target=target,
+        )
+        offset += _FIELDS
+
+    # Digests, as "<digest>  ./<path>".
+    for line in fields[offset + 1 :]:
+        if line:
+            digest, path = line.split("  ./", 1)
+            if path in manifest:
+                manifest[path] = manifest[path]._replace(digest=digest)
+
+    return manifest
+
+
+def _is_changed(
+    path: str, source: Manifest, copy: ManifestEntry, root: pathlib.Path
+) -> bool:
+    entry = source[path]
+    if entry.type != copy.type or entry.mode != copy.mode:
+        return True
+
+    if entry.type == "l":
+        return entry.target != copy.target
+
+    if entry.type != "f":
+        return False
+
+    if entry.size != copy.size:
+        return True
+
+    # Inodes are only known for copies recorded from a host scan (see
+    # ManifestCache), where a replaced file may keep its size and mtime.
+    if entry.mtime_ns == copy.mtime_ns and copy.inode in (0, entry.inode):
+        return False
+
+    # Same size, maybe different content: compare, if the copy's is known.
+    if copy.digest is None:
+        return True
+
+    if entry.digest is None:
+        entry = entry._replace(digest=file_digest(root / path))
+        source[path] = entry
+
+    return entry.digest != copy.digest
+
+
+def diff_manifests(
+    source: Manifest, copy: Manifest, *, root: pathlib.Path
+) -> Tuple[List[str], List[str]]:
+    """Compare manifest of source directory with that of its copy.
+
+    Files whose size matches, but mtime does not, are compared by digest
+    if the copy's is known, hashing the source file under root if needed.
+    Digests computed, and those of the copy's unchanged files, are recorded
+    in the source manifest, so it can stand in for the copy's next time.
+
+    :param source: Manifest of source directory.
+    :param copy: Manifest of copy.
+    :param root: Path to source directory.
+
+    :returns: Tuple of paths to send, parents first, and paths to delete
+        from the copy, excluding those under deleted directories.
+    """
+    send = []
+    for path in sorted(source):
+        if path not in copy or _is_changed(path, source, copy[path], root):
+            send.append(path)
+        elif source[path].digest is None and copy[path].digest is not None:
+            source[path] = source[path]._replace(digest=copy[path].digest)
+
+    # Delete paths removed from source, and those which changed type.
+    stale = sorted(
+        path
+        for path, entry in copy.items()
+        if path not in source or source[path].type != entry.type
+    )
+    delete: List[str] = []
+    for path in stale:
+        if delete and path.startswith(delete[-1] + "/"):
+            continue
+        delete.append(path)
+
+    return send, delete
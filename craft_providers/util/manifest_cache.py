@@ -0,0 +1,220 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk cache of synced directory manifests."""
+import contextlib
+import logging
+import pathlib
+import sqlite3
+from typing import Any, Iterator, List, Optional, Tuple
+
+from .manifest import Manifest, ManifestEntry
+from .path import cache_path
+
+logger = logging.getLogger(__name__)
+
+# Bump to discard caches written by prior versions of this module.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS syncs (
+    key TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    PRIMARY KEY (key, destination)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mode INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    digest TEXT,
+    inode INTEGER NOT NULL,
+    PRIMARY KEY (key, destination, path)
+);
+"""
+
+
+class ManifestCache:
+    """Manifests of directories last synced to environments, on disk.
+
+    For each environment (identified by a key, e.g. the instance's remote,
+    project, name and UUID) and destination, the manifest of the source directory
+    as of the last sync is recorded, with inodes and any digests computed.
+    A later sync to the same destination can use it in place of scanning the
+    destination, and reuse digests of host files whose inode, size and mtime
+    are unchanged (see diff_manifests()).
+
+    Changes made to the destination other than by syncing are not seen, so
+    entries must be invalidated when the environment is deleted or reset.
+
+    :param path: Path to cache database, defaults to
+        $XDG_CACHE_HOME/craft-providers/sync-manifests.sqlite3.
+    """
+
+    def __init__(self, *, path: Optional[pathlib.Path] = None):
+        if path is None:
+            self.path = cache_path("sync-manifests.sqlite3")
+        else:
+            self.path = path
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            if connection.execute("PRAGMA user_version").fetchone()[0] != (
+                _SCHEMA_VERSION
+            ):
+                with connection:
+                    connection.execute("DROP TABLE IF EXISTS syncs")
+                    connection.execute("DROP TABLE IF EXISTS entries")
+                    connection.executescript(_SCHEMA)
+                    connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            yield connection
+        finally:
+            connection.close()
+
+    def load(self, *, key: str, destination: pathlib.Path) -> Optional[Manifest]:
+        """Get manifest of last sync to destination.
+
+        :param key: Identifier of environment.
+        :param destination: Destination directory in environment.
+
+        :returns: Manifest of source directory, as synced, or None if not
+            cached.
+        """
+        try:
+            with self._connect() as connection:
+                sync = connection.execute(
+                    "SELECT 1 FROM syncs WHERE key = ? AND destination = ?",
+                    (key, destination.as_posix()),
+                ).fetchone()
+                if sync is None:
+                    return None
+
+                rows = connection.execute(
+                    "SELECT path, type, size, mtime_ns, mode, target, digest, inode"
+                    " FROM entries WHERE key = ? AND destination = ?",
+                    (key, destination.as_posix()),
+                ).fetchall()
+        except (OSError, sqlite3.Error) as error:
+            logger.debug("Failed to read sync manifest cache: %s", error)
+            return None
+
+        return {row[0]: ManifestEntry(*row[1:]) for row in rows}
+
+    def save(
+        self,
+        *,
+        key: str,
+        destination: pathlib.Path,
+        manifest: Manifest,
+    ) -> None:
+        """Record manifest of source, as synced to destination.
+
+        :param key: Identifier of environment.
+        :param destination: Destination directory in environment.
+        :param manifest: Manifest of source, as synced.
+        """
+        try:
+            with self._connect() as connection, connection:
+                self._delete(connection, key=key, destination=destination)
+                connection.execute(
+                    "INSERT INTO syncs VALUES (?, ?)", (key, destination.as_posix())
+                )
+                connection.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (key, destination.as_posix(), path) + tuple(entry)
+                        for path, entry in manifest.items()
+                    ),
+                )
+        except (OSError, sqlite3.Error) as error:
+            logger.debug("Failed to write sync manifest cache: %s", error)
+
+    def invalidate(
+        self,
+        *,
+        key: str,
+        destination: Optional[pathlib.Path] = None,
+        prefix: bool = False,
+    ) -> None:
+        """Drop manifests of syncs to environment.
+
+        Unlike other methods, errors are raised, as a manifest left in place
+        would be used in place of scanning a changed destination.
+
+        :param key: Identifier of environment.
+        :param destination: Destination to drop manifests of, with those of
+            directories in it and containing it, else all.
+        :param prefix: Drop manifests of all environments whose identifiers
+            start with key.
+
+        :raises OSError: if cache cannot be opened.
+        :raises sqlite3.Error: if cache cannot be updated.
+        """
+        if not self.path.exists():
+            return
+
+        with self._connect() as connection, connection:
+            self._delete(
+                connection,
+                key=key,
+                destination=destination,
+                related=True,
+                prefix=prefix,
+            )
+
+    @staticmethod
+    def _delete(
+        connection: sqlite3.Connection,
+        *,
+        key: str,
+        destination: Optional[pathlib.Path],
+        related: bool = False,
+        prefix: bool = False,
+    ) -> None:
+        """Delete manifests of syncs to environment.
+
+        :param related: Also delete manifests of syncs to directories in,
+            and containing, destination.
+        :param prefix: Delete manifests of all keys starting with key.
+        """
+        args: Tuple[Any, ...]
+        if prefix:
+            where, args = "substr(key, 1, ?) = ?", (len(key), key)
+        else:
+            where, args = "key = ?", (key,)
+
+        if destination is None:
+            pass
+        elif not related:
+            where += " AND destination = ?"
+            args += (destination.as_posix(),)
+        else:
+            paths: List[str] = [destination.as_posix()]
+            paths.extend(p.as_posix() for p in destination.parents)
+            subdirectories = destination.as_posix().rstrip("/") + "/"
+            where += (
+                f" AND (destination IN ({', '.join('?' * len(paths))})"
+                " OR substr(destination, 1, ?) = ?)"
+            )
+            args += (*paths, len(subdirectories), subdirectories)
+
+        connection.execute(f"DELETE FROM syncs WHERE {where}", args)
+        connection.execute(f"DELETE FROM entries WHERE {where}", args)
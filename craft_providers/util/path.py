@@ -13,11 +13,24 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """Path-related helpers."""
+import os
 import pathlib
 import shutil
 from typing import Optional
 
 
+def cache_path(name: str) -> pathlib.Path:
+    """Get path of a craft-providers cache file.
+
+    :param name: Name of cache file.
+
+    :returns: Path in $XDG_CACHE_HOME/craft-providers, or
+        ~/.cache/craft-providers if XDG_CACHE_HOME is unset.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return pathlib.Path(cache_home, "craft-providers", name)
+
+
 def which(command: str) -> Optional[pathlib.Path]:
     """Find command on path.
 
@@ -0,0 +1,108 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Splitting of directory transfers into parallel shards."""
+import heapq
+import os
+import pathlib
+import stat
+from typing import List, Optional, Sequence, Tuple
+
+# Parallelism chosen by default: a shard per this many bytes, up to the
+# number of CPUs, and no more than _MAX_SHARDS.
+_BYTES_PER_SHARD = 32 * 1024 * 1024
+_MAX_SHARDS = 8
+
+
+def _usable_cpus() -> int:
+    """Get number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not Linux.
+        return os.cpu_count() or 1
+
+
+def default_parallelism(
+    *, total_size: int, file_count: int, cpu_count: Optional[int] = None
+) -> int:
+    """Choose number of shards for a transfer.
+
+    Small trees are not worth the extra processes.
+
+    :param total_size: Total size of files, in bytes.
+    :param file_count: Number of files.
+    :param cpu_count: Number of CPUs, defaults to those usable.
+
+    :returns: Number of shards, at least one.
+    """
+    if cpu_count is None:
+        cpu_count = _usable_cpus()
+
+    return max(
+        1, min(cpu_count, _MAX_SHARDS, file_count, total_size // _BYTES_PER_SHARD)
+    )
+
+
+def choose_parallelism(root: pathlib.Path, *, cpu_count: Optional[int] = None) -> int:
+    """Choose number of shards for transfer of a directory.
+
+    As for default_parallelism(), but files are only counted until the
+    most shards allowed is reached, so large trees are not walked in full.
+
+    :param root: Directory to transfer.
+    :param cpu_count: Number of CPUs, defaults to those usable.
+
+    :returns: Number of shards, at least one.
+    """
+    if cpu_count is None:
+        cpu_count = _usable_cpus()
+
+    limit = min(cpu_count, _MAX_SHARDS)
+    total_size = 0
+    file_count = 0
+    if limit > 1:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                st = os.lstat(os.path.join(dirpath, name))
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                total_size += st.st_size
+                file_count += 1
+            if file_count >= limit and total_size // _BYTES_PER_SHARD >= limit:
+                break
+
+    return default_parallelism(
+        total_size=total_size, file_count=file_count, cpu_count=cpu_count
+    )
+
+
+def plan_shards(files: Sequence[Tuple[str, int]], count: int) -> List[List[str]]:
+    """Split files into shards of about equal size.
+
+    Each file, largest first, goes to the shard with the fewest bytes.
+
+    :param files: Paths of files, with their sizes.
+    :param count: Number of shards.
+
+    :returns: Paths in each shard, sorted.  Shards may be empty.
+    """
+    loads = [(0, index) for index in range(count)]
+    shards: List[List[str]] = [[] for _ in range(count)]
+    for path, size in sorted(files, key=lambda f: f[1], reverse=True):
+        load, index = heapq.heappop(loads)
+        shards[index].append(path)
+        heapq.heappush(loads, (load + size, index))
+
+    return [sorted(shard) for shard in shards]
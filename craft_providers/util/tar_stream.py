@@ -0,0 +1,399 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""In-process tar streams, for the host side of sync pipelines.
+
+Archives are written in pax format, with nanosecond mtimes (as manifests
+compare), and file content is copied with os.sendfile() where the stream
+is a plain pipe or file, else through a reused buffer.
+"""
+import contextlib
+import errno
+import functools
+import grp
+import gzip
+import io
+import logging
+import os
+import pathlib
+import pwd
+import stat
+import subprocess
+import tarfile
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .compression import Compressor
+from .manifest import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+_BUFSIZE = 1024 * 1024
+
+TarFilter = Callable[[tarfile.TarInfo], Optional[tarfile.TarInfo]]
+
+
+class ArchiveStats(NamedTuple):
+    """Totals of an archive streamed.
+
+    :param entries: Number of entries.
+    :param size: Bytes of file content.
+    """
+
+    entries: int
+    size: int
+
+
+@functools.lru_cache(maxsize=None)
+def _user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return ""
+
+
+@functools.lru_cache(maxsize=None)
+def _group_name(gid: int) -> str:
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return ""
+
+
+def _tarinfo(
+    path: str, arcname: str, links: Dict[Tuple[int, int], str]
+) -> Optional[tarfile.TarInfo]:
+    """Create header for path, or None if it cannot be archived (sockets).
+
+    :param path: Path on host.
+    :param arcname: Name in archive.
+    :param links: Archived names of files with multiple links, by device
+        and inode, for hard links to be archived as such.
+    """
+    st = os.lstat(path)
+    info = tarfile.TarInfo(arcname)
+
+    if stat.S_ISREG(st.st_mode):
+        key = (st.st_dev, st.st_ino)
+        if st.st_nlink > 1 and key in links:
+            info.type = tarfile.LNKTYPE
+            info.linkname = links[key]
+        else:
+            info.type = tarfile.REGTYPE
+            info.size = st.st_size
+            if st.st_nlink > 1:
+                links[key] = arcname
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+    elif stat.S_ISFIFO(st.st_mode):
+        info.type = tarfile.FIFOTYPE
+    elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+        info.type = tarfile.CHRTYPE if stat.S_ISCHR(st.st_mode) else tarfile.BLKTYPE
+        info.devmajor = os.major(st.st_rdev)
+        info.devminor = os.minor(st.st_rdev)
+    else:
+        return None
+
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    info.uname = _user_name(st.st_uid)
+    info.gname = _group_name(st.st_gid)
+
+    seconds, nanoseconds = divmod(st.st_mtime_ns, 1_000_000_000)
+    info.mtime = seconds
+    if nanoseconds:
+        info.pax_headers = {"mtime": f"{seconds}.{nanoseconds:09d}"}
+
+    return info
+
+
+def _walk(root: pathlib.Path) -> Iterator[str]:
+    """Yield "." and paths under root, relative to it, parents first."""
+    yield "."
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def _raw_fd(stream: IO[bytes]) -> Optional[int]:
+    """Get file descriptor to sendfile() to, if stream writes directly to it."""
+    if not isinstance(stream, (io.BufferedWriter, io.FileIO)):
+        return None
+
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _copy_content(
+    source: io.BufferedReader, out: IO[bytes], size: int, buffer: bytearray
+) -> int:
+    """Copy size bytes of source to out, returning bytes copied."""
+    out_fd = _raw_fd(out)
+    copied = 0
+    if out_fd is not None:
+        out.flush()
+        while copied < size:
+            try:
+                sent = os.sendfile(out_fd, source.fileno(), copied, size - copied)
+            except OSError as error:
+                # Not supported between these files, copy the rest below.
+                if copied == 0 and error.errno in (
+                    errno.EINVAL,
+                    errno.ENOSYS,
+                    errno.EOPNOTSUPP,
+                ):
+                    break
+                raise
+            if sent == 0:
+                return copied
+            copied += sent
+
+        source.seek(copied)
+
+    view = memoryview(buffer)
+    while copied < size:
+        read = source.readinto(view[: min(len(buffer), size - copied)])
+        if not read:
+            break
+        out.write(view[:read])
+        copied += read
+
+    return copied
+
+
+def write_archive(
+    out: IO[bytes],
+    root: pathlib.Path,
+    paths: Optional[Iterable[str]] = None,
+    *,
+    tar_filter: Optional[TarFilter] = None,
+) -> ArchiveStats:
+    """Write archive of paths under root to stream.
+
+    :param out: Stream to write to, e.g. stdin of a remote "tar x".
+    :param root: Host directory paths are relative to.
+    :param paths: Paths to archive, non-recursively, parents first.
+        Defaults to root and everything under it.
+    :param tar_filter: Callable to change headers, as for TarFile.add(),
+        returning None to skip the entry.
+
+    :returns: Totals archived.
+    """
+    if paths is None:
+        paths = _walk(root)
+
+    buffer = bytearray(_BUFSIZE)
+    links: Dict[Tuple[int, int], str] = {}
+    entries = 0
+    size = 0
+    for arcname in paths:
+        path = os.path.join(root, arcname)
+        info = _tarinfo(path, arcname, links)
+        if info is not None and tar_filter is not None:
+            info = tar_filter(info)
+        if info is None:
+            continue
+
+        out.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        entries += 1
+        if info.type != tarfile.REGTYPE or not info.size:
+            continue
+
+        with open(path, "rb") as source:
+            copied = _copy_content(source, out, info.size, buffer)
+        if copied < info.size:
+            # Shrank since archived, pad as GNU tar does.
+            logger.warning("%s: file shrank by %d bytes.", path, info.size - copied)
+            out.write(bytes(info.size - copied))
+
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            out.write(bytes(tarfile.BLOCKSIZE - remainder))
+        size += info.size
+
+    out.write(bytes(2 * tarfile.BLOCKSIZE))
+    out.flush()
+    return ArchiveStats(entries=entries, size=size)
+
+
+class _TarFile(tarfile.TarFile):
+    """TarFile restoring mtimes to the nanosecond, as GNU tar does."""
+
+    def utime(
+        self,
+        tarinfo: tarfile.TarInfo,
+        targetpath: Union[str, bytes, "os.PathLike[str]", "os.PathLike[bytes]"],
+    ) -> None:
+        """Set modification time of extracted path."""
+        mtime = tarinfo.pax_headers.get("mtime")
+        if mtime is None:
+            super().utime(tarinfo, targetpath)
+            return
+
+        mtime_ns = parse_timestamp(mtime)
+        try:
+            os.utime(targetpath, ns=(mtime_ns, mtime_ns))
+        except OSError as error:
+            raise tarfile.ExtractError("could not change modification time") from error
+
+
+def _check_member(member: tarfile.TarInfo, destination: str) -> None:
+    """Refuse member which would be extracted, or link, outside destination.
+
+    :param member: Member about to be extracted.
+    :param destination: Real path of destination directory.
+
+    :raises tarfile.TarError: if member is unsafe.
+    """
+
+    def inside(path: str) -> bool:
+        path = os.path.realpath(os.path.join(destination, path))
+        return os.path.commonpath([destination, path]) == destination
+
+    if os.path.isabs(member.name) or not inside(member.name):
+        raise tarfile.TarError(f"{member.name!r} is outside of destination")
+
+    if member.issym():
+        target = os.path.join(os.path.dirname(member.name), member.linkname)
+    elif member.islnk():
+        target = member.linkname
+    else:
+        return
+
+    if os.path.isabs(member.linkname) or not inside(target):
+        raise tarfile.TarError(
+            f"{member.name!r} links to {member.linkname!r}, outside of destination"
+        )
+
+
+def read_archive(
+    stream: IO[bytes],
+    destination: pathlib.Path,
+    *,
+    tar_filter: Optional[TarFilter] = None,
+) -> ArchiveStats:
+    """Extract archive from stream, preserving permissions.
+
+    Modes are kept as archived, including setuid and setgid bits, and
+    ownership is restored if running as root.  Members with absolute or
+    escaping paths, and links to targets outside of destination, are refused.
+
+    :param stream: Stream to read from, e.g. stdout of a remote "tar c".
+    :param destination: Host directory to extract into.
+    :param tar_filter: Callable to change headers before extraction,
+        returning None to skip the entry.
+
+    :returns: Totals extracted.
+
+    :raises tarfile.TarError: if archive is invalid or unsafe.
+    """
+    totals = [0, 0]
+    real_destination = os.path.realpath(destination)
+
+    with _TarFile.open(fileobj=stream, mode="r|", bufsize=_BUFSIZE) as archive:
+
+        def members() -> Iterator[tarfile.TarInfo]:
+            for member in archive:
+                selected = member if tar_filter is None else tar_filter(member)
+                if selected is None:
+                    continue
+                # Checked as each is extracted, to see links already created.
+                _check_member(selected, real_destination)
+                totals[0] += 1
+                totals[1] += selected.size if selected.isreg() else 0
+                yield selected
+
+        # Members are checked above, tarfile's own filters would change modes.
+        kwargs: Dict[str, Any] = {}
+        if hasattr(tarfile, "fully_trusted_filter"):
+            kwargs["filter"] = "fully_trusted"
+        archive.extractall(destination, members=members(), numeric_owner=True, **kwargs)
+
+    # Drain padding after end of archive, for the writer to exit cleanly.
+    while stream.read(_BUFSIZE):
+        pass
+
+    return ArchiveStats(entries=totals[0], size=totals[1])
+
+
+@contextlib.contextmanager
+def compressed_writer(
+    out: IO[bytes], compressor: Optional[Compressor]
+) -> Iterator[IO[bytes]]:
+    """Wrap stream to compress what is written to it.
+
+    gzip is applied in-process, other compressors run as a subprocess.
+
+    :param out: Stream to write compressed data to.
+    :param compressor: Compressor, or None to write uncompressed.
+    """
+    if compressor is None:
+        yield out
+    elif compressor.name == "gzip":
+        with gzip.GzipFile(
+            fileobj=out, mode="wb", compresslevel=compressor.level, mtime=0
+        ) as writer:
+            yield writer  # type: ignore
+    else:
+        proc = subprocess.Popen(compressor.command(), stdin=subprocess.PIPE, stdout=out)
+        assert proc.stdin is not None
+        try:
+            yield proc.stdin
+        finally:
+            proc.stdin.close()
+            proc.wait()
+
+
+@contextlib.contextmanager
+def decompressed_reader(
+    stream: IO[bytes], compressor: Optional[Compressor]
+) -> Iterator[IO[bytes]]:
+    """Wrap stream to decompress what is read from it.
+
+    gzip is applied in-process, other compressors run as a subprocess.
+
+    :param stream: Stream to read compressed data from.
+    :param compressor: Compressor, or None to read uncompressed.
+    """
+    if compressor is None:
+        yield stream
+    elif compressor.name == "gzip":
+        with gzip.GzipFile(fileobj=stream, mode="rb") as reader:
+            yield reader  # type: ignore
+    else:
+        proc = subprocess.Popen(
+            compressor.command(decompress=True), stdin=stream, stdout=subprocess.PIPE
+        )
+        assert proc.stdout is not None
+        try:
+            yield proc.stdout
+        finally:
+            proc.stdout.close()
+            proc.wait()
@@ -0,0 +1,125 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from craft_providers import ShardedSyncError
+from craft_providers.host.host_executor import HostExecutor
+
+
+@pytest.mark.parametrize("stop_on_error", [True, False])
+def test_execute_batch(stop_on_error):
+    results = HostExecutor(sudo_user=None).execute_batch(
+        [
+            ["echo", "it's"],
+            ["sh", "-c", "printf 'no newline'; echo oops >&2; exit 2"],
+            ["echo", "after"],
+        ],
+        stop_on_error=stop_on_error,
+    )
+
+    assert [r.returncode for r in results[:2]] == [0, 2]
+    assert results[0].args == ["echo", "it's"]
+    assert results[0].stdout == b"it's\n"
+    assert results[1].stdout == b"no newline"
+    assert results[1].stderr == b"oops\n"
+    if stop_on_error:
+        assert len(results) == 2
+    else:
+        assert results[2].stdout == b"after\n"
+
+
+def test_execute_batch_check():
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        HostExecutor(sudo_user=None).execute_batch([["true"], ["false"]], check=True)
+
+    assert exc_info.value.cmd == ["false"]
+
+
+def test_execute_batch_sudo(monkeypatch):
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, b"", b"")
+
+    monkeypatch.setattr(subprocess, "run", run)
+
+    (result,) = HostExecutor(sudo_user="user").execute_batch([["true"]])
+
+    assert commands == [["sudo", "-H", "-u", "user", "true"]]
+    assert result.args == ["true"]
+
+
+def tree(root):
+    result = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            relative = os.path.relpath(path, root)
+            if os.path.islink(path):
+                result[relative] = ("l", os.readlink(path))
+            elif os.path.isdir(path):
+                result[relative] = ("d",)
+            else:
+                with open(path, "rb") as stream:
+                    result[relative] = ("f", stream.read())
+    return result
+
+
+@pytest.fixture()
+def source(tmp_path):
+    root = tmp_path / "source"
+    (root / "dir" / "sub").mkdir(parents=True)
+    (root / "dir" / "link").symlink_to("sub")
+    (root / "empty").mkdir()
+    for index in range(10):
+        (root / "dir" / "sub" / f"file{index}").write_bytes(b"x" * index)
+    (root / "big").write_bytes(b"x" * 100)
+
+    yield root
+
+
+@pytest.mark.parametrize("parallelism", [None, 1, 3])
+def test_sync_to_sharded(source, tmp_path, parallelism):
+    destination = tmp_path / "destination"
+    destination.mkdir()
+    (destination / "existing").write_text("existing")
+
+    HostExecutor(sudo_user=None).sync_to(
+        source=source, destination=destination, parallelism=parallelism
+    )
+
+    # As copied by shutil.copytree(), following symlinks.
+    expected = shutil.copytree(source, tmp_path / "expected")
+    assert tree(destination) == dict(tree(expected), existing=("f", b"existing"))
+
+
+def test_sync_to_sharded_failure(source, tmp_path):
+    destination = tmp_path / "destination"
+    destination.mkdir()
+    (destination / "big").symlink_to(tmp_path / "missing" / "big")
+
+    with pytest.raises(ShardedSyncError) as exc_info:
+        HostExecutor(sudo_user=None).sync_to(
+            source=source, destination=destination, parallelism=2
+        )
+
+    (index,) = exc_info.value.failures
+    assert exc_info.value.shards[index] == ["big"]
+    assert (destination / "dir" / "sub" / "file9").exists()
@@ -0,0 +1,74 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fixtures for LXD unit tests."""
+import pathlib
+import tempfile
+import textwrap
+
+import pytest
+
+from craft_providers.lxd import LXDConnectionPool, LXDRestClient
+
+from .fake_lxd import FakeLXDServer
+
+
+@pytest.fixture()
+def fake_lxd_server():
+    # Unix socket paths are length-limited, avoid pytest's long tmp_path.
+    with tempfile.TemporaryDirectory(prefix="lxd-") as tmp_dir:
+        server = FakeLXDServer(pathlib.Path(tmp_dir, "unix.socket"))
+        server.start()
+
+        yield server
+
+        server.stop()
+
+
+@pytest.fixture()
+def fake_lxd(fake_lxd_server):
+    yield fake_lxd_server.lxd
+
+
+@pytest.fixture()
+def rest_client(fake_lxd_server):
+    pool = LXDConnectionPool(socket_path=fake_lxd_server.socket_path)
+
+    yield LXDRestClient(socket_path=fake_lxd_server.socket_path, timeout=5, pool=pool)
+
+    pool.close()
+
+
+@pytest.fixture()
+def fake_lxc_path(tmp_path):
+    """Path to an lxc stand-in which runs exec'd commands on the host."""
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            """\
+            #!/bin/sh
+            # Drop "--project <project>".
+            shift 2
+            if [ "$1" = "exec" ]; then
+                shift 2
+                [ "$1" = "--" ] && shift
+                exec "$@"
+            fi
+            echo "$@"
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+
+    yield lxc_path
@@ -0,0 +1,453 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""In-memory stand-in for the LXD API, served over a unix socket."""
+import hashlib
+import http.server
+import json
+import pathlib
+import re
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+import uuid
+from typing import Set
+
+
+class FakeLXDError(Exception):
+    def __init__(self, error, error_code):
+        super().__init__(error)
+        self.error = error
+        self.error_code = error_code
+
+
+class FakeLXD:
+    """LXD API state and request handling."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.server_info = {
+            "api_extensions": ["instances", "projects"],
+            "environment": {
+                "kernel_features": {"seccomp_listener": "true"},
+                "server_version": "4.0.4",
+                "storage": "dir",
+            },
+        }
+        self.projects = {"default": {"name": "default", "config": {}}}
+        self.instances = {}
+        self.files = {}
+        self.images = {}
+        self.profiles = {
+            ("default", "default"): {
+                "name": "default",
+                "config": {},
+                "description": "Default LXD profile",
+                "devices": {},
+                "used_by": [],
+            }
+        }
+        self.operations = {}
+        # Leave operations running until cancelled.
+        self.hold_operations = False
+
+    # Responses.
+
+    @staticmethod
+    def sync(metadata):
+        return 200, {}, {"type": "sync", "status_code": 200, "metadata": metadata}
+
+    def operation(self, *, error=None):
+        op_id = str(uuid.uuid4())
+        op = {
+            "id": op_id,
+            "status": "Failure" if error else "Success",
+            "status_code": 400 if error else 200,
+            "err": error or "",
+            "metadata": {},
+        }
+        if self.hold_operations:
+            op.update(
+                status="Running",
+                status_code=103,
+                metadata={"download_progress": "rootfs: 42%"},
+            )
+        self.operations[op_id] = op
+        return (
+            202,
+            {},
+            {
+                "type": "async",
+                "status_code": 100,
+                "operation": f"/1.0/operations/{op_id}",
+                "metadata": op,
+            },
+        )
+
+    # Helpers.
+
+    def get_instance(self, project, name):
+        try:
+            return self.instances[(project, name)]
+        except KeyError:
+            raise FakeLXDError("not found", 404)
+
+    def add_instance(self, *, name, project="default", status="Running", **kwargs):
+        instance = {
+            "name": name,
+            "status": status,
+            "status_code": 103 if status == "Running" else 102,
+            "ephemeral": False,
+            "config": {},
+            "devices": {},
+            "profiles": ["default"],
+            "state": {"status": status},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+            + f".{time.time_ns() % 1_000_000_000:09d}Z",
+        }
+        instance.update(kwargs)
+        self.instances[(project, name)] = instance
+        return instance
+
+    def add_image(self, *, aliases, project="default", fingerprint=None):
+        if fingerprint is None:
+            fingerprint = hashlib.sha256(uuid.uuid4().bytes).hexdigest()
+        image = {
+            "fingerprint": fingerprint,
+            "aliases": [{"name": a, "description": ""} for a in aliases],
+            "properties": {},
+        }
+        self.images[(project, fingerprint)] = image
+        return image
+
+    def set_status(self, instance, status):
+        instance["status"] = status
+        instance["status_code"] = 103 if status == "Running" else 102
+        instance["state"] = {"status": status}
+
+    def find_alias(self, project, alias):
+        for (image_project, _), image in self.images.items():
+            if image_project != project:
+                continue
+            if any(a["name"] == alias for a in image["aliases"]):
+                return image
+        raise FakeLXDError("not found", 404)
+
+    # Request handling.
+
+    def handle(self, method, url, headers, body):
+        with self.lock:
+            self.requests.append((method, url))
+            parsed = urllib.parse.urlsplit(url)
+            query = dict(urllib.parse.parse_qsl(parsed.query))
+            project = query.get("project", "default")
+            path = urllib.parse.unquote(parsed.path)
+
+            try:
+                return self._route(method, path, query, project, headers, body)
+            except FakeLXDError as error:
+                if error.error_code == 504:
+                    time.sleep(0.01)
+                return (
+                    error.error_code,
+                    {},
+                    {
+                        "type": "error",
+                        "error": error.error,
+                        "error_code": error.error_code,
+                    },
+                )
+
+    def _route(  # noqa: C901
+        self, method, path, query, project, headers, body
+    ):  # pylint: disable=too-many-arguments,too-many-return-statements,too-many-branches
+        data = json.loads(body) if body and not path.endswith("/files") else {}
+
+        if path == "/1.0" and method == "GET":
+            return self.sync(self.server_info)
+
+        match = re.fullmatch(r"/1.0/operations/([^/]+)(/wait)?", path)
+        if match:
+            try:
+                op = self.operations[match.group(1)]
+            except KeyError:
+                raise FakeLXDError("not found", 404)
+            if method == "GET":
+                if match.group(2) and op["status_code"] == 103 and "timeout" in query:
+                    raise FakeLXDError("Operation wait timed out", 504)
+                return self.sync(op)
+            if method == "DELETE":
+                op.update(status="Cancelled", status_code=401, err="cancelled")
+                return self.sync({})
+
+        if path == "/1.0/instances":
+            if method == "GET":
+                return self.sync(
+                    [i for (p, _), i in sorted(self.instances.items()) if p == project]
+                )
+            if method == "POST":
+                return self._create_instance(project, data)
+
+        match = re.fullmatch(r"/1.0/instances/([^/]+)(/state|/files)?", path)
+        if match:
+            name, sub = match.groups()
+            instance = self.get_instance(project, name)
+            if sub is None:
+                return self._instance(method, project, instance, data)
+            if sub == "/state":
+                return self._instance_state(method, project, instance, data)
+            return self._instance_files(method, project, instance, query, headers, body)
+
+        if path == "/1.0/images":
+            if method == "GET":
+                return self.sync(
+                    [i for (p, _), i in sorted(self.images.items()) if p == project]
+                )
+            if method == "POST":
+                return self._create_image(project, data)
+
+        match = re.fullmatch(r"/1.0/images/aliases/([^/]+)", path)
+        if match and method == "GET":
+            image = self.find_alias(project, match.group(1))
+            return self.sync({"name": match.group(1), "target": image["fingerprint"]})
+
+        match = re.fullmatch(r"/1.0/images/([^/]+)", path)
+        if match and method == "DELETE":
+            if self.images.pop((project, match.group(1)), None) is None:
+                raise FakeLXDError("not found", 404)
+            return self.operation()
+
+        if path == "/1.0/profiles":
+            if method == "GET":
+                return self.sync(
+                    [
+                        p
+                        for (p_project, _), p in self.profiles.items()
+                        if p_project == project
+                    ]
+                )
+            if method == "POST":
+                if (project, data["name"]) in self.profiles:
+                    raise FakeLXDError("profile already exists", 409)
+                self.profiles[(project, data["name"])] = {
+                    "name": data["name"],
+                    "config": data.get("config", {}),
+                    "description": data.get("description", ""),
+                    "devices": data.get("devices", {}),
+                    "used_by": [],
+                }
+                return self.sync({})
+
+        match = re.fullmatch(r"/1.0/profiles/([^/]+)", path)
+        if match:
+            key = (project, match.group(1))
+            if key not in self.profiles:
+                raise FakeLXDError("not found", 404)
+            if method == "GET":
+                return self.sync(self.profiles[key])
+            if method == "PUT":
+                self.profiles[key].update(data)
+                return self.sync({})
+            if method == "DELETE":
+                if self.profiles[key]["used_by"]:
+                    raise FakeLXDError("profile is in use", 400)
+                del self.profiles[key]
+                return self.sync({})
+
+        if path == "/1.0/projects":
+            if method == "GET":
+                return self.sync([f"/1.0/projects/{p}" for p in sorted(self.projects)])
+            if method == "POST":
+                if data["name"] in self.projects:
+                    raise FakeLXDError("project already exists", 409)
+                self.projects[data["name"]] = {"name": data["name"], "config": {}}
+                self.profiles[(data["name"], "default")] = {
+                    "name": "default",
+                    "config": {},
+                    "description": "",
+                    "devices": {},
+                    "used_by": [],
+                }
+                return self.sync({})
+
+        match = re.fullmatch(r"/1.0/projects/([^/]+)", path)
+        if match and method == "DELETE":
+            if self.projects.pop(match.group(1), None) is None:
+                raise FakeLXDError("not found", 404)
+            return self.sync({})
+
+        raise FakeLXDError(f"unsupported request {method} {path}", 404)
+
+    def _create_instance(self, project, data):
+        if (project, data["name"]) in self.instances:
+            raise FakeLXDError("instance already exists", 409)
+
+        source = data.get("source", {})
+        if "server" not in source:
+            try:
+                self.find_alias(project, source.get("alias"))
+            except FakeLXDError:
+                return self.operation(error="image not found")
+
+        profiles = list(data.get("profiles", ["default"]))
+        for profile in profiles:
+            if (project, profile) not in self.profiles:
+                raise FakeLXDError(f"profile {profile!r} not found", 404)
+
+        self.add_instance(
+            name=data["name"],
+            project=project,
+            status="Stopped",
+            ephemeral=data.get("ephemeral", False),
+            config=dict(data.get("config", {})),
+            devices=dict(data.get("devices", {})),
+            profiles=profiles,
+        )
+        for profile in profiles:
+            self.profiles[(project, profile)]["used_by"].append(
+                f"/1.0/instances/{data['name']}"
+            )
+        return self.operation()
+
+    def _instance(self, method, project, instance, data):
+        if method == "GET":
+            return self.sync(instance)
+        if method == "PATCH":
+            instance["config"].update(data.get("config", {}))
+            instance["devices"].update(data.get("devices", {}))
+            return self.sync({})
+        if method == "DELETE":
+            if instance["status"] == "Running":
+                raise FakeLXDError("Instance is running", 400)
+            del self.instances[(project, instance["name"])]
+            url = f"/1.0/instances/{instance['name']}"
+            for profile in instance["profiles"]:
+                used_by = self.profiles.get((project, profile), {}).get("used_by", [])
+                if url in used_by:
+                    used_by.remove(url)
+            return self.operation()
+        raise FakeLXDError("method not allowed", 405)
+
+    def _instance_state(self, method, project, instance, data):
+        if method == "GET":
+            return self.sync(instance["state"])
+
+        action = data["action"]
+        if action == "start":
+            self.set_status(instance, "Running")
+        elif action == "stop":
+            self.set_status(instance, "Stopped")
+            if instance["ephemeral"]:
+                del self.instances[(project, instance["name"])]
+        return self.operation()
+
+    def _instance_files(
+        self, method, project, instance, query, headers, body
+    ):  # pylint: disable=too-many-arguments
+        key = (project, instance["name"], query["path"])
+        if method == "GET":
+            if key not in self.files:
+                raise FakeLXDError("not found", 404)
+            content, _ = self.files[key]
+            return 200, {"X-LXD-type": "file"}, content
+        if method == "POST":
+            self.files[key] = (
+                body,
+                {
+                    "uid": headers.get("X-LXD-uid"),
+                    "gid": headers.get("X-LXD-gid"),
+                    "mode": headers.get("X-LXD-mode"),
+                },
+            )
+            return self.sync({})
+        raise FakeLXDError("method not allowed", 405)
+
+    def _create_image(self, project, data):
+        aliases = [a["name"] for a in data.get("aliases", [])]
+        source = data["source"]
+        if source["type"] == "instance":
+            instance = self.get_instance(project, source["name"])
+            if instance["status"] == "Running":
+                return self.operation(error="instance is running")
+        self.add_image(aliases=aliases, project=project)
+        return self.operation()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections.add(self.connection)
+
+    def finish(self):
+        super().finish()
+        self.server.connections.discard(self.connection)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+
+        status, headers, payload = self.server.lxd.handle(
+            self.command, self.path, self.headers, body
+        )
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode()
+            headers = {"Content-Type": "application/json", **headers}
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def address_string(self):
+        return "fake-lxd"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class FakeLXDServer(socketserver.ThreadingUnixStreamServer):
+    """Serve a FakeLXD over a unix socket in a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: pathlib.Path, lxd=None):
+        self.lxd = lxd or FakeLXD()
+        self.socket_path = socket_path
+        self.connections: Set[socket.socket] = set()
+        super().__init__(str(socket_path), _Handler)
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving, dropping kept-alive connections like a daemon restart."""
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+        for connection in list(self.connections):
+            connection.shutdown(socket.SHUT_RDWR)
+
+        if self.socket_path.exists():
+            self.socket_path.unlink()
@@ -0,0 +1,135 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from craft_providers.lxd import AsyncLXC, AsyncLXDInstance
+
+
+@pytest.fixture()
+def instance(fake_lxc_path):
+    yield AsyncLXDInstance(name="test", lxc=AsyncLXC(lxc_path=fake_lxc_path))
+
+
+def test_lxc_run(fake_lxc_path):
+    lxc = AsyncLXC(lxc_path=fake_lxc_path)
+
+    proc = asyncio.run(lxc._run(command=["start", "local:test"]))
+
+    assert proc.stdout == b"start local:test\n"
+
+
+def test_execute_run(instance):
+    proc = asyncio.run(
+        instance.execute_run(["cat"], input=b"hello", stdout=subprocess.PIPE)
+    )
+
+    assert proc.stdout == b"hello"
+
+
+def test_execute_run_check(instance):
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(instance.execute_run(["false"]))
+
+
+def test_concurrent_execute_run(instance):
+    async def run_all():
+        return await asyncio.gather(
+            *[
+                instance.execute_run(["echo", str(i)], stdout=subprocess.PIPE)
+                for i in range(16)
+            ]
+        )
+
+    procs = asyncio.run(run_all())
+
+    assert [p.stdout for p in procs] == [f"{i}\n".encode() for i in range(16)]
+
+
+def test_sync_to_from(instance, tmp_path):
+    source = tmp_path / "source"
+    (source / "sub").mkdir(parents=True)
+    (source / "sub" / "file.txt").write_text("content")
+    target = tmp_path / "target"
+    result = tmp_path / "result"
+
+    asyncio.run(instance.sync_to(source=source, destination=target))
+    asyncio.run(instance.sync_from(source=target, destination=result))
+
+    assert (target / "sub" / "file.txt").read_text() == "content"
+    assert (result / "sub" / "file.txt").read_text() == "content"
+
+
+def test_stat(instance, tmp_path):
+    (tmp_path / "file").write_bytes(b"12345")
+
+    file_stat = asyncio.run(instance.stat(tmp_path / "file"))
+
+    assert file_stat.is_file
+    assert file_stat.size == 5
+    assert asyncio.run(instance.stat(tmp_path / "missing")) is None
+
+
+@pytest.mark.parametrize("to_instance", [True, False])
+def test_pipe_archive_error(instance, to_instance):
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        asyncio.run(
+            instance._pipe(
+                archive_command=["sh", "-c", "exit 2"],
+                target_command=["cat"],
+                to_instance=to_instance,
+            )
+        )
+
+    assert raised.value.returncode == 2
+    assert raised.value.cmd == ["sh", "-c", "exit 2"]
+
+
+def test_pipe_target_spawn_error(instance, tmp_path):
+    pid_path = tmp_path / "archive.pid"
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(
+            instance._pipe(
+                archive_command=["sh", "-c", f'echo $$ > "{pid_path}"; exec yes'],
+                target_command=[str(tmp_path / "missing")],
+                to_instance=False,
+            )
+        )
+
+    # Archive was killed and reaped, not left blocked on the pipe.
+    pid = int(pid_path.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_create_file(instance, tmp_path, monkeypatch):
+    pushed = []
+
+    async def file_push(*, source, destination, **kwargs):
+        pushed.append((source.read_bytes(), destination, kwargs["mode"]))
+
+    monkeypatch.setattr(instance.lxc, "file_push", file_push)
+
+    asyncio.run(
+        instance.create_file(
+            destination=tmp_path / "file", content=b"content", file_mode="0644"
+        )
+    )
+
+    assert pushed == [(b"content", tmp_path / "file", "0644")]
@@ -0,0 +1,218 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import subprocess
+import textwrap
+
+import pytest
+
+from craft_providers.lxd import LXC, LXCMetrics, LXCTraceRecorder, purge_project
+
+
+@pytest.fixture()
+def query_lxc(tmp_path):
+    """LXC using a stand-in lxc which answers queries for an instance and image."""
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            """\
+            #!/bin/sh
+            echo "$@" >> "$0.log"
+            case "$4" in
+                "local:/1.0/instances/test?project=default")
+                    echo '{"name": "test", "status": "Running"}';;
+                "local:/1.0/images/aliases/image?project=default")
+                    echo '{"name": "image", "target": "abc123"}';;
+                "local:/1.0/projects/default?project=default")
+                    echo '{"name": "default"}';;
+                *"/1.0/instances/broken"*)
+                    echo "Error: permission denied" >&2; exit 1;;
+                *"/1.0/instances/gone"*)
+                    echo "Error: Instance not found" >&2; exit 1;;
+                *"/1.0/profiles/gone"*)
+                    echo "Error: Profile not found" >&2; exit 1;;
+                *"project=gone"*)
+                    echo "Error: Project not found" >&2; exit 1;;
+                *)
+                    echo "Error: not found" >&2; exit 1;;
+            esac
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+
+    yield LXC(lxc_path=lxc_path)
+
+
+def test_instance_get(query_lxc):
+    instance = query_lxc.instance_get(instance="test")
+
+    assert instance == {"name": "test", "status": "Running"}
+    assert query_lxc.lxc_path.with_suffix(".log").read_text() == (
+        "--project default query local:/1.0/instances/test?project=default\n"
+    )
+
+
+def test_instance_get_missing(query_lxc):
+    assert query_lxc.instance_get(instance="gone") is None
+    assert query_lxc.lxc_path.with_suffix(".log").read_text() == (
+        "--project default query local:/1.0/instances/gone?project=default\n"
+    )
+
+
+def test_profile_get_missing(query_lxc):
+    assert query_lxc.profile_get(profile="gone") is None
+
+
+def test_instance_get_missing_checks_project(query_lxc):
+    # Older LXD does not say what is not found, the project may be missing.
+    assert query_lxc.instance_get(instance="test-1") is None
+    assert query_lxc.lxc_path.with_suffix(".log").read_text().splitlines()[1] == (
+        "--project default query local:/1.0/projects/default?project=default"
+    )
+
+    with pytest.raises(subprocess.CalledProcessError):
+        query_lxc.instance_get(instance="test-1", project="missing")
+
+
+def test_instance_get_missing_project(query_lxc):
+    with pytest.raises(subprocess.CalledProcessError):
+        query_lxc.instance_get(instance="test", project="gone")
+
+
+def test_instance_get_error(query_lxc):
+    with pytest.raises(subprocess.CalledProcessError):
+        query_lxc.instance_get(instance="broken")
+
+
+def test_image_alias_get(query_lxc):
+    alias = query_lxc.image_alias_get(alias="image")
+
+    assert alias == {"name": "image", "target": "abc123"}
+    assert query_lxc.image_alias_get(alias="missing") is None
+
+
+@pytest.fixture()
+def launch_lxc(tmp_path):
+    """LXC using a stand-in lxc which reports progress, failing on request."""
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            """\
+            #!/bin/sh
+            printf 'Retrieving image: 10%%\\rRetrieving image: 100%%\\n'
+            [ "$5" = "local:fail" ] && exit 1
+            [ "$5" = "local:hang" ] && exec sleep 60
+            echo "Starting $5"
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+
+    yield LXC(lxc_path=lxc_path)
+
+
+def test_begin_launch(launch_lxc):
+    operation = launch_lxc.begin_launch(
+        config_keys={}, image="20.04", image_remote="ubuntu", instance="test"
+    )
+    operation.wait(timeout=5)
+
+    assert operation.done() is True
+    assert operation.progress == "Starting local:test"
+
+
+def test_begin_launch_failure(launch_lxc):
+    operation = launch_lxc.begin_launch(
+        config_keys={}, image="20.04", image_remote="ubuntu", instance="fail"
+    )
+
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        operation.wait(timeout=5)
+
+    assert operation.progress == "Retrieving image: 100%"
+    assert b"Retrieving image: 10%" in exc_info.value.output
+
+
+def test_begin_launch_cancel(launch_lxc):
+    operation = launch_lxc.begin_launch(
+        config_keys={}, image="20.04", image_remote="ubuntu", instance="hang"
+    )
+
+    with pytest.raises(TimeoutError):
+        operation.wait(timeout=0.1)
+
+    assert operation.cancel() is True
+    with pytest.raises(subprocess.CalledProcessError):
+        operation.wait(timeout=5)
+
+
+def test_config_patch(tmp_path, fake_lxc_path):
+    trace_path = tmp_path / "lxc.trace"
+    lxc = LXC(
+        lxc_path=fake_lxc_path,
+        metrics=LXCMetrics(),
+        trace=LXCTraceRecorder(trace_path),
+    )
+
+    lxc.config_patch(instance="test", devices={"d": {"type": "disk"}}, remote="r")
+    lxc.config_patch(instance="test")
+
+    [entry] = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert entry["args"] == [
+        "--project",
+        "default",
+        "query",
+        "--request=PATCH",
+        '--data={"devices": {"d": {"type": "disk"}}}',
+        "r:/1.0/instances/test?project=default",
+    ]
+
+
+def test_delete_many_reports_failures(tmp_path):
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            """\
+            #!/bin/sh
+            [ "$4" = "local:broken" ] && { echo "Error: busy" >&2; exit 1; }
+            exit 0
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+    lxc = LXC(lxc_path=lxc_path)
+
+    report = lxc.delete_many(
+        instances=["test-1", "broken", "test-2"], force=True, retries=0
+    )
+
+    assert report.deleted == ["test-1", "test-2"]
+    assert list(report.failed) == ["broken"]
+    assert report.elapsed > 0
+
+
+def test_purge_project(fake_lxd, rest_client):
+    fake_lxd.projects["ci"] = {"name": "ci", "config": {}}
+    for i in range(20):
+        fake_lxd.add_instance(name=f"test-{i}", project="ci")
+    fake_lxd.add_image(aliases=["image"], project="ci")
+
+    report = purge_project(lxc=rest_client, project="ci", workers=4)
+
+    assert len(report.deleted) == 21
+    assert report.failed == {}
+    assert "ci" not in fake_lxd.projects
+    assert not [key for key in fake_lxd.instances if key[0] == "ci"]
@@ -0,0 +1,94 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+
+import pytest
+
+from craft_providers.lxd import LXC, LXCMetrics
+from craft_providers.lxd.lxc_metrics import subcommand_name
+
+
+@pytest.mark.parametrize(
+    "command,name",
+    [
+        (["list", "local:", "--format=json"], "list"),
+        (["config", "device", "show", "local:test"], "config device show"),
+        (["config", "set", "local:test", "key", "value"], "config set"),
+        (["image", "copy", "ubuntu:20.04", "local:"], "image copy"),
+        (["remote", "add", "ubuntu", "https://example.com"], "remote add"),
+        ([], ""),
+    ],
+)
+def test_subcommand_name(command, name):
+    assert subcommand_name(command) == name
+
+
+def test_summary():
+    metrics = LXCMetrics()
+    for i in range(1, 21):
+        metrics.record("exec", duration=i / 10, returncode=0, output_bytes=10)
+    metrics.record("list", duration=0.5, returncode=1, output_bytes=0)
+
+    summary = metrics.summary()
+
+    assert summary["exec"].calls == 20
+    assert summary["exec"].failures == 0
+    assert summary["exec"].p50 == 1.0
+    assert summary["exec"].p95 == 1.9
+    assert summary["exec"].max == 2.0
+    assert summary["exec"].output_bytes == 200
+    assert summary["list"].failures == 1
+
+    report = metrics.report().splitlines()
+    assert report[1].startswith("exec")
+    assert report[2].startswith("list")
+
+    metrics.reset()
+    assert metrics.summary() == {}
+
+
+def test_summary_bounded():
+    metrics = LXCMetrics()
+    for i in range(1, 10001):
+        metrics.record("exec", duration=i / 1000, returncode=0, output_bytes=0)
+
+    summary = metrics.summary()
+
+    assert len(metrics._durations["exec"].samples) == 1024
+    assert summary["exec"].calls == 10000
+    assert summary["exec"].total == pytest.approx(50005.0)
+    assert summary["exec"].max == 10.0
+    assert summary["exec"].p50 == pytest.approx(5.0, abs=0.5)
+    assert summary["exec"].p95 == pytest.approx(9.5, abs=0.3)
+
+
+def test_lxc_records_subcommands(fake_lxc_path):
+    metrics = LXCMetrics()
+    lxc = LXC(lxc_path=fake_lxc_path, metrics=metrics)
+
+    lxc.config_set(instance="test", key="key", value="value")
+    lxc.exec(instance="test", command=["true"])
+    lxc.exec(instance="test", command=["sh", "-c", "echo foo"], stdout=subprocess.PIPE)
+    lxc.exec(instance="test", command=["true"], runner=subprocess.Popen).wait()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        lxc.exec(instance="test", command=["false"], check=True)
+
+    summary = metrics.summary()
+    assert sorted(summary) == ["config set", "exec"]
+    assert summary["config set"].calls == 1
+    assert summary["exec"].calls == 3
+    assert summary["exec"].failures == 1
+    assert summary["exec"].output_bytes == 4
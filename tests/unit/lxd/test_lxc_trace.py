@@ -0,0 +1,82 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pathlib
+import subprocess
+import tempfile
+
+import pytest
+
+from craft_providers.lxd import LXC, LXCMetrics, LXCTraceRecorder, write_replay_stub
+from craft_providers.lxd.lxc_trace import load_trace, trace_key
+
+
+@pytest.fixture()
+def recorded_trace(tmp_path, fake_lxc_path):
+    trace_path = tmp_path / "lxc.trace"
+    lxc = LXC(
+        lxc_path=fake_lxc_path,
+        metrics=LXCMetrics(),
+        trace=LXCTraceRecorder(trace_path),
+    )
+
+    lxc.config_set(instance="test", key="key", value="one")
+    lxc.exec(instance="test", command=["echo", "first"], stdout=subprocess.PIPE)
+    lxc.exec(instance="test", command=["echo", "first"], stdout=subprocess.PIPE)
+    lxc.exec(instance="test", command=["false"])
+
+    yield trace_path
+
+
+def test_record(recorded_trace):
+    trace = load_trace(recorded_trace)
+
+    assert len(trace) == 3
+    key = trace_key(
+        ["--project", "default", "exec", "local:test", "--", "echo", "first"]
+    )
+    assert [e["returncode"] for e in trace[key]] == [0, 0]
+    assert [e["stdout"] for e in trace[key]] == ["Zmlyc3QK", "Zmlyc3QK"]
+
+
+def test_trace_key_normalizes_temporary_files():
+    temp_file = pathlib.Path(tempfile.gettempdir(), "tmpabcdef").as_posix()
+
+    assert trace_key(["file", "push", temp_file]) == trace_key(
+        ["file", "push", pathlib.Path(tempfile.gettempdir(), "tmp123456").as_posix()]
+    )
+
+
+def test_replay(recorded_trace, tmp_path):
+    lxc_path = write_replay_stub(
+        trace_path=recorded_trace, stub_path=tmp_path / "replay", scale=0
+    )
+    lxc = LXC(lxc_path=lxc_path, metrics=LXCMetrics())
+
+    proc = lxc._run(command=["config", "set", "local:test", "key", "one"])
+    assert proc.stdout == b"config set local:test key one\n"
+
+    for _ in range(3):
+        proc = lxc.exec(
+            instance="test", command=["echo", "first"], stdout=subprocess.PIPE
+        )
+        assert proc.stdout == b"first\n"
+
+    assert lxc.exec(instance="test", command=["false"]).returncode == 1
+
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        lxc.config_set(instance="test", key="key", value="two")
+
+    assert exc_info.value.returncode == 127
+    assert b"not recorded" in exc_info.value.output
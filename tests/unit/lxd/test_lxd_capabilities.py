@@ -0,0 +1,125 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pathlib
+
+import pytest
+
+from craft_providers.lxd import LXD, LXDCapabilityCache, LXDInstance
+
+
+def count_info_requests(fake_lxd):
+    return len(
+        [r for r in fake_lxd.requests if r[0] == "GET" and r[1].startswith("/1.0?")]
+    )
+
+
+@pytest.fixture()
+def cache_path(tmp_path):
+    yield tmp_path / "cache" / "lxd-capabilities.json"
+
+
+def test_capabilities(fake_lxd, rest_client, cache_path):
+    capabilities = LXDCapabilityCache(lxc=rest_client, cache_path=cache_path).get()
+
+    assert capabilities.server_version == "4.0.4"
+    assert capabilities.storage_driver == "dir"
+    assert capabilities.api_extensions == ["instances", "projects"]
+    assert capabilities.supports_mknod is True
+
+
+def test_shared_across_caches(fake_lxd, rest_client, cache_path):
+    LXDCapabilityCache(lxc=rest_client, cache_path=cache_path).get()
+    capabilities = LXDCapabilityCache(lxc=rest_client, cache_path=cache_path).get()
+
+    assert capabilities.server_version == "4.0.4"
+    assert count_info_requests(fake_lxd) == 1
+    assert cache_path.exists()
+
+
+def test_daemon_restart_invalidates(fake_lxd, fake_lxd_server, rest_client, cache_path):
+    cache = LXDCapabilityCache(lxc=rest_client, cache_path=cache_path)
+    cache.get()
+
+    # A restarted daemon recreates its socket.
+    stat = fake_lxd_server.socket_path.stat()
+    os.utime(
+        fake_lxd_server.socket_path,
+        ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000),
+    )
+    fake_lxd.server_info["environment"]["server_version"] = "4.0.5"
+
+    assert cache.get().server_version == "4.0.5"
+    assert (
+        LXDCapabilityCache(lxc=rest_client, cache_path=cache_path).get().server_version
+        == "4.0.5"
+    )
+    assert count_info_requests(fake_lxd) == 2
+
+
+def test_corrupt_cache_is_ignored(fake_lxd, rest_client, cache_path):
+    cache_path.parent.mkdir()
+    cache_path.write_text("{")
+
+    capabilities = LXDCapabilityCache(lxc=rest_client, cache_path=cache_path).get()
+
+    assert capabilities.server_version == "4.0.4"
+
+
+def test_missing_socket_is_not_cached_on_disk(fake_lxd, rest_client, cache_path):
+    cache = LXDCapabilityCache(
+        lxc=rest_client,
+        cache_path=cache_path,
+        socket_path=pathlib.Path("/does/not/exist"),
+    )
+
+    assert cache.identity() is None
+    cache.get()
+    assert not cache_path.exists()
+
+
+def test_lxd_version(fake_lxd, rest_client, cache_path, tmp_path):
+    lxd_path = tmp_path / "lxd"
+    lxd_path.write_text("#!/bin/sh\nexit 1\n")
+    lxd_path.chmod(0o755)
+    lxd = LXD(
+        lxd_path=lxd_path,
+        capabilities=LXDCapabilityCache(lxc=rest_client, cache_path=cache_path),
+    )
+
+    lxd.ensure_supported_version()
+
+    fake_lxd.server_info["environment"]["server_version"] = "3.0.0"
+    lxd.capabilities.invalidate()
+    with pytest.raises(RuntimeError):
+        lxd.ensure_supported_version()
+
+
+def test_instance_launch(fake_lxd, rest_client, cache_path):
+    fake_lxd.add_image(aliases=["image"])
+    cache = LXDCapabilityCache(lxc=rest_client, cache_path=cache_path)
+
+    for name in ["test1", "test2"]:
+        LXDInstance(name=name, lxc=rest_client, capabilities=cache).launch(
+            image="image", image_remote="local"
+        )
+
+    assert count_info_requests(fake_lxd) == 1
+    assert (
+        fake_lxd.instances[("default", "test2")]["config"][
+            "security.syscalls.intercept.mknod"
+        ]
+        == "true"
+    )
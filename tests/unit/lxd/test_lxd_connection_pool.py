@@ -0,0 +1,76 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import concurrent.futures
+
+from craft_providers.lxd import (
+    LXDConnectionPool,
+    LXDInstance,
+    LXDRestClient,
+    get_connection_pool,
+)
+
+from .fake_lxd import FakeLXDServer
+
+
+def test_reuse(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+
+    for _ in range(5):
+        LXDInstance(name="test", lxc=rest_client).is_running()
+
+    stats = rest_client.pool.stats()
+    assert (stats.hits, stats.misses, stats.idle, stats.in_use) == (4, 1, 1, 0)
+
+
+def test_bounded_concurrency(fake_lxd, fake_lxd_server):
+    fake_lxd.add_instance(name="test")
+    pool = LXDConnectionPool(socket_path=fake_lxd_server.socket_path, max_connections=2)
+    client = LXDRestClient(socket_path=fake_lxd_server.socket_path, pool=pool)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: client.list(), range(32)))
+
+    stats = pool.stats()
+    assert all(len(r) == 1 for r in results)
+    assert stats.hits + stats.misses == 32
+    assert stats.misses <= 2
+    assert stats.in_use == 0
+    pool.close()
+
+
+def test_reconnect_after_restart(fake_lxd, fake_lxd_server, rest_client):
+    fake_lxd.add_instance(name="test")
+    assert len(rest_client.list()) == 1
+
+    fake_lxd_server.stop()
+    restarted = FakeLXDServer(fake_lxd_server.socket_path, lxd=fake_lxd)
+    restarted.start()
+    try:
+        assert len(rest_client.list()) == 1
+    finally:
+        restarted.stop()
+
+    stats = rest_client.pool.stats()
+    assert (stats.hits, stats.misses, stats.reconnects) == (1, 1, 1)
+
+
+def test_shared_pool(tmp_path):
+    socket_path = tmp_path / "unix.socket"
+
+    client_1 = LXDRestClient(socket_path=socket_path)
+    client_2 = LXDRestClient(socket_path=socket_path)
+
+    assert client_1.pool is client_2.pool
+    assert client_1.pool is get_connection_pool(socket_path)
@@ -0,0 +1,118 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import textwrap
+
+import pytest
+
+from craft_providers.lxd import LXC, LXDAPIError, LXDEventMonitor
+
+EVENTS = [
+    {
+        "type": "lifecycle",
+        "metadata": {"action": "instance-created", "source": "/1.0/instances/test"},
+    },
+    {"type": "logging", "metadata": {"message": "ignored"}},
+    {
+        "type": "operation",
+        "metadata": {
+            "id": "op-1",
+            "status": "Success",
+            "status_code": 200,
+            "resources": {"instances": ["/1.0/instances/test"]},
+        },
+    },
+    {
+        "type": "operation",
+        "metadata": {
+            "id": "op-2",
+            "status": "Failure",
+            "status_code": 400,
+            "err": "boom",
+            "resources": {"instances": ["/1.0/instances/other?project=default"]},
+        },
+    },
+    {
+        "type": "lifecycle",
+        "metadata": {
+            "action": "instance-started",
+            "source": "/1.0/instances/test?project=default",
+        },
+    },
+]
+
+
+@pytest.fixture()
+def monitor_lxc(tmp_path):
+    """LXC using a stand-in lxc which emits events, then waits."""
+    events_path = tmp_path / "events"
+    events_path.write_text("not-json\n" + "".join(json.dumps(e) + "\n" for e in EVENTS))
+
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            f"""\
+            #!/bin/sh
+            echo "$@" > "$0.args"
+            cat {events_path}
+            [ -e "$0.exit" ] || exec sleep 60
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+
+    yield LXC(lxc_path=lxc_path)
+
+
+def test_wait_for_lifecycle(monitor_lxc):
+    with LXDEventMonitor(lxc=monitor_lxc, project="p", remote="r") as monitor:
+        event = monitor.wait_for_lifecycle(
+            instance="test", action="instance-started", timeout=5
+        )
+
+    assert event == EVENTS[4]
+    assert (monitor_lxc.lxc_path.parent / "lxc.args").read_text() == (
+        "--project p monitor r: --type=lifecycle --type=operation --format=json\n"
+    )
+
+
+def test_wait_for_operation(monitor_lxc):
+    with LXDEventMonitor(lxc=monitor_lxc) as monitor:
+        assert monitor.wait_for_operation(instance="test", timeout=5)["id"] == "op-1"
+
+        with pytest.raises(LXDAPIError) as exc_info:
+            monitor.wait_for_operation(operation_id="op-2", timeout=5)
+
+    assert exc_info.value.error == "boom"
+    assert exc_info.value.error_code == 400
+
+
+def test_wait_since_mark_times_out(monitor_lxc):
+    with LXDEventMonitor(lxc=monitor_lxc) as monitor:
+        monitor.wait_for_lifecycle(instance="test", action="instance-started")
+        mark = monitor.mark()
+
+        with pytest.raises(TimeoutError):
+            monitor.wait_for_lifecycle(
+                instance="test", action="instance-started", since=mark, timeout=0.1
+            )
+
+
+def test_wait_after_monitor_exits(monitor_lxc):
+    (monitor_lxc.lxc_path.parent / "lxc.exit").touch()
+
+    with LXDEventMonitor(lxc=monitor_lxc) as monitor:
+        with pytest.raises(RuntimeError):
+            monitor.wait_for_lifecycle(instance="test", action="instance-stopped")
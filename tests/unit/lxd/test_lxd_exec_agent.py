@@ -0,0 +1,180 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import concurrent.futures
+import subprocess
+
+import pytest
+
+from craft_providers.lxd import (
+    LXC,
+    LXCMetrics,
+    LXDExecAgent,
+    LXDExecAgentError,
+    LXDInstance,
+    lxd_exec_agent,
+)
+
+
+@pytest.fixture()
+def agent(fake_lxc_path):
+    agent = LXDExecAgent(lxc=LXC(lxc_path=fake_lxc_path), instance="test")
+    agent.start()
+
+    yield agent
+
+    agent.stop()
+
+
+def test_run(agent):
+    proc = agent.run(
+        ["sh", "-c", "echo out; echo err >&2; exit 3"], capture_output=True
+    )
+
+    assert proc.returncode == 3
+    assert proc.stdout == b"out\n"
+    assert proc.stderr == b"err\n"
+
+
+def test_run_check(agent):
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        agent.run(["false"], check=True, stdout=subprocess.PIPE)
+
+    assert exc_info.value.returncode == 1
+
+
+def test_run_input_env_text(agent):
+    proc = agent.run(
+        ["sh", "-c", 'cat; echo "$CRAFT_TEST" >&2'],
+        input="in\n",
+        env={"CRAFT_TEST": "value"},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+    assert proc.stdout == "in\nvalue\n"
+    assert proc.stderr is None
+
+
+def test_run_cwd(agent):
+    proc = agent.run(["pwd"], cwd="/", stdout=subprocess.PIPE)
+
+    assert proc.stdout == b"/\n"
+
+
+def test_run_missing_command(agent):
+    proc = agent.run(["/does/not/exist"], capture_output=True)
+
+    assert proc.returncode == 127
+    assert b"/does/not/exist" in proc.stderr
+
+
+def test_run_timeout(agent):
+    with pytest.raises(subprocess.TimeoutExpired):
+        agent.run(["sleep", "60"], timeout=0.1)
+
+    assert agent.run(["true"]).returncode == 0
+
+
+def test_run_timeout_kill_lost(agent, monkeypatch):
+    send = agent._send
+
+    def no_kill(kind, request_id, payload=b""):
+        if kind != b"K":
+            send(kind, request_id, payload)
+
+    monkeypatch.setattr(agent, "_send", no_kill)
+    monkeypatch.setattr(lxd_exec_agent, "_KILL_TIMEOUT", 0.1)
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        agent.run(["sleep", "1"], timeout=0.1)
+
+    assert agent._requests == {}
+
+
+def test_run_inherited_output(agent, capfd):
+    proc = agent.run(["sh", "-c", "echo out; echo err >&2"])
+
+    assert proc.stdout is None
+    captured = capfd.readouterr()
+    assert captured.out == "out\n"
+    assert "err\n" in captured.err
+
+
+def test_run_agent_lost_after_request(agent, monkeypatch):
+    send = agent._send
+
+    def lose_agent(kind, request_id, payload=b""):
+        if kind == b"I":
+            agent._proc.kill()
+            raise LXDExecAgentError("Exec agent was lost.")
+        send(kind, request_id, payload)
+
+    monkeypatch.setattr(agent, "_send", lose_agent)
+
+    proc = agent.run(["cat"], input=b"data", capture_output=True)
+
+    assert proc.returncode == 255
+    assert proc.stderr == b"Exec agent was lost.\n"
+
+
+def test_run_concurrently(agent):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        procs = list(
+            pool.map(
+                lambda i: agent.run(["echo", str(i)], stdout=subprocess.PIPE),
+                range(32),
+            )
+        )
+
+    assert [p.stdout for p in procs] == [f"{i}\n".encode() for i in range(32)]
+
+
+def test_start_failure(fake_lxc_path):
+    agent = LXDExecAgent(
+        lxc=LXC(lxc_path=fake_lxc_path), instance="test", python="/does/not/exist"
+    )
+
+    with pytest.raises(LXDExecAgentError):
+        agent.start()
+
+    with pytest.raises(LXDExecAgentError):
+        agent.run(["true"])
+
+
+def test_supports():
+    assert LXDExecAgent.supports(capture_output=True, text=True, timeout=5)
+    assert LXDExecAgent.supports(stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    assert not LXDExecAgent.supports(stdout=open)
+    assert not LXDExecAgent.supports(stdin=subprocess.DEVNULL)
+
+
+def test_lxd_instance_routes_through_agent(fake_lxc_path):
+    metrics = LXCMetrics()
+    instance = LXDInstance(
+        name="test",
+        lxc=LXC(lxc_path=fake_lxc_path, metrics=metrics),
+        use_exec_agent=True,
+    )
+
+    for _ in range(3):
+        proc = instance.execute_run(["echo", "hi"], capture_output=True)
+        assert proc.stdout == b"hi\n"
+
+    # Unsupported arguments fall back to lxc exec.
+    instance.execute_run(["true"], stdin=subprocess.DEVNULL)
+    instance.stop_exec_agent()
+
+    assert metrics.summary()["exec"].calls == 1
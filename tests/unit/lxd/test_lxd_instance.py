@@ -0,0 +1,265 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pathlib
+import textwrap
+import time
+
+import pytest
+
+from craft_providers.lxd import LXC, LXCMetrics, LXDInstance
+from craft_providers.util.manifest_cache import ManifestCache
+
+
+def count_state_queries(fake_lxd):
+    return len([r for r in fake_lxd.requests if r[0] == "GET" and "/instances" in r[1]])
+
+
+def test_state_cache(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client)
+
+    assert instance.exists() is True
+    assert instance.is_running() is True
+    assert instance.get_state()["name"] == "test"
+
+    assert count_state_queries(fake_lxd) == 1
+
+
+@pytest.mark.parametrize("method", ["start", "stop", "delete"])
+def test_state_cache_invalidation(fake_lxd, rest_client, method):
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client)
+    instance.is_running()
+
+    getattr(instance, method)()
+    instance.is_running()
+
+    # Query before mutation, any queries made by the mutation, and one after.
+    assert fake_lxd.requests[-1][0] == "GET"
+    assert count_state_queries(fake_lxd) >= 2
+    assert instance.is_running() is (method == "start")
+
+
+def test_state_cache_opt_out(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client, state_cache_ttl=0)
+
+    instance.exists()
+    instance.is_running()
+
+    assert count_state_queries(fake_lxd) == 2
+
+
+def test_state_cache_bypass(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client)
+    instance.exists()
+
+    del fake_lxd.instances[("default", "test")]
+
+    assert instance.exists() is True
+    assert instance.exists(use_cache=False) is False
+
+
+@pytest.fixture()
+def ephemeral_lxc(tmp_path):
+    """LXC using a stand-in lxc for an ephemeral instance, deleted on stop."""
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            """\
+            #!/bin/sh
+            shift 2
+            echo "$1" >> "$0.log"
+            case "$1" in
+                query)
+                    [ -e "$0.deleted" ] && { echo "Error: Instance not found" >&2; exit 1; }
+                    echo '{"name": "test", "status": "Running", "ephemeral": true}';;
+                stop)
+                    touch "$0.stopped";;
+                monitor)
+                    while [ ! -e "$0.stopped" ]; do sleep 0.01; done
+                    touch "$0.deleted"
+                    echo '{"type": "lifecycle", "metadata": {"action": "instance-deleted", "source": "/1.0/instances/test"}}'
+                    exec sleep 60;;
+            esac
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+
+    yield LXC(lxc_path=lxc_path)
+
+
+def test_stop_ephemeral_waits_for_deletion(ephemeral_lxc):
+    instance = LXDInstance(name="test", lxc=ephemeral_lxc)
+
+    instance.stop(delete_timeout=5)
+
+    assert instance.exists() is False
+    log = ephemeral_lxc.lxc_path.with_suffix(".log").read_text().split()
+    assert sorted(log[:3]) == ["monitor", "query", "stop"]
+
+
+def test_stop_ephemeral_missed_deletion_event(tmp_path, monkeypatch):
+    """Deletion before lxc monitor subscribes is seen by polling."""
+    monkeypatch.setattr("craft_providers.lxd.lxd_instance._DELETE_POLL_INTERVAL", 0.1)
+    lxc_path = tmp_path / "lxc"
+    lxc_path.write_text(
+        textwrap.dedent(
+            """\
+            #!/bin/sh
+            shift 2
+            echo "$1" >> "$0.log"
+            case "$1" in
+                query)
+                    [ "$(grep -c query "$0.log")" -gt 2 ] && { echo "Error: Instance not found" >&2; exit 1; }
+                    echo '{"name": "test", "status": "Running", "ephemeral": true}';;
+                monitor)
+                    exec sleep 60;;
+            esac
+            """
+        )
+    )
+    lxc_path.chmod(0o755)
+    instance = LXDInstance(name="test", lxc=LXC(lxc_path=lxc_path))
+
+    start = time.monotonic()
+    instance.stop(delete_timeout=30)
+
+    assert time.monotonic() - start < 10
+    assert instance.exists() is False
+
+
+def test_get_state_exact_match(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test-1")
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client)
+
+    assert instance.get_state()["name"] == "test"
+    assert fake_lxd.requests == [("GET", "/1.0/instances/test?project=default")]
+
+
+def test_get_state_missing(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test-1")
+    instance = LXDInstance(name="test", lxc=rest_client)
+
+    assert instance.get_state() is None
+
+
+def test_config_transaction(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client)
+    instance.get_state()
+
+    with instance.config_transaction() as txn:
+        txn.set_config("user.key", "value")
+        txn.add_disk(source=pathlib.Path("/src/a"), destination=pathlib.Path("/a"))
+        txn.add_disk(source=pathlib.Path("/src/b"), destination=pathlib.Path("/b"))
+
+    assert [r for r in fake_lxd.requests if r[0] == "PATCH"] == [
+        ("PATCH", "/1.0/instances/test?project=default")
+    ]
+    state = instance.get_state()
+    assert state["config"] == {"user.key": "value"}
+    assert state["devices"] == {
+        "_a": {"type": "disk", "source": "/src/a", "path": "/a"},
+        "_b": {"type": "disk", "source": "/src/b", "path": "/b"},
+    }
+    assert instance.is_mounted(
+        source=pathlib.Path("/src/b"), destination=pathlib.Path("/b")
+    )
+
+
+def test_config_transaction_folded_into_launch(fake_lxd, rest_client):
+    fake_lxd.add_image(aliases=["image"])
+    instance = LXDInstance(name="test", lxc=rest_client)
+
+    txn = instance.config_transaction()
+    txn.add_disk(source=pathlib.Path("/src"), destination=pathlib.Path("/dst"))
+    instance.launch(image="image", image_remote="local", uid="1000", config=txn)
+    txn.commit()
+
+    assert not any(r[0] == "PATCH" for r in fake_lxd.requests)
+    state = instance.get_state()
+    assert state["status"] == "Running"
+    assert state["config"]["raw.idmap"] == "both 1000 0"
+    assert state["devices"] == {
+        "_dst": {"type": "disk", "source": "/src", "path": "/dst"}
+    }
+
+
+def test_execute_batch_single_exec(fake_lxc_path, tmp_path):
+    metrics = LXCMetrics()
+    instance = LXDInstance(
+        name="test", lxc=LXC(lxc_path=fake_lxc_path, metrics=metrics)
+    )
+
+    results = instance.execute_batch([["echo", "one"], ["echo", "two"]])
+    instance.stat_many([tmp_path, tmp_path / "missing"])
+
+    assert [r.stdout for r in results] == [b"one\n", b"two\n"]
+    assert metrics.summary()["exec"].calls == 2
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_manifest_cache_invalidated_on_delete(
+    fake_lxd, rest_client, tmp_path, background
+):
+    fake_lxd.add_instance(name="test")
+    cache = ManifestCache(path=tmp_path / "cache.sqlite3")
+    instance = LXDInstance(name="test", lxc=rest_client, manifest_cache=cache)
+    key = instance._get_manifest_cache_key()
+    cache.save(key=key, destination=pathlib.Path("/root/a"), manifest={})
+    cache.save(key="other", destination=pathlib.Path("/root/a"), manifest={})
+    assert instance.exists() is True
+
+    if background:
+        instance.begin_delete().wait(timeout=5)
+    else:
+        instance.delete()
+
+    assert instance.exists() is False
+
+    assert cache.load(key=key, destination=pathlib.Path("/root/a")) is None
+    assert cache.load(key="other", destination=pathlib.Path("/root/a")) == {}
+
+
+def test_manifest_cache_key_identifies_instance(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+    instance = LXDInstance(name="test", lxc=rest_client)
+    key = instance._get_manifest_cache_key()
+
+    # Recreated other than through this object.
+    del fake_lxd.instances[("default", "test")]
+    fake_lxd.add_instance(name="test")
+    instance.invalidate_state_cache()
+
+    assert instance._get_manifest_cache_key() not in (key, None)
+    fake_lxd.add_instance(name="test", config={"volatile.uuid": "abc"})
+    instance.invalidate_state_cache()
+    assert instance._get_manifest_cache_key() == "lxd:local:default:test:abc"
+
+
+def test_manifest_cache_error_does_not_prevent_delete(fake_lxd, rest_client, tmp_path):
+    fake_lxd.add_instance(name="test")
+    (tmp_path / "cache.sqlite3").mkdir()
+    cache = ManifestCache(path=tmp_path / "cache.sqlite3")
+    instance = LXDInstance(name="test", lxc=rest_client, manifest_cache=cache)
+
+    instance.delete()
+
+    assert instance.exists() is False
+    assert instance.manifest_cache is None
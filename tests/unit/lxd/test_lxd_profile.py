@@ -0,0 +1,156 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+
+import pytest
+
+from craft_providers.lxd import (
+    LXC,
+    LXDAPIError,
+    LXDCapabilityCache,
+    LXDInstance,
+    LXDProfileManager,
+)
+
+
+def count_requests(fake_lxd, method, endpoint):
+    return len(
+        [r for r in fake_lxd.requests if r[0] == method and r[1].startswith(endpoint)]
+    )
+
+
+def test_name_is_content_hashed(rest_client):
+    manager = LXDProfileManager(lxc=rest_client, uid=1000)
+
+    assert manager.name.startswith("craft-")
+    assert manager.name == LXDProfileManager(lxc=rest_client, uid=1000).name
+    assert manager.name != LXDProfileManager(lxc=rest_client, uid=1001).name
+    assert (
+        manager.name
+        != LXDProfileManager(
+            lxc=rest_client, uid=1000, devices={"d": {"type": "disk"}}
+        ).name
+    )
+
+
+def test_name_includes_mknod_support(fake_lxd, rest_client):
+    supported = LXDProfileManager(lxc=rest_client, uid=1000).name
+    fake_lxd.server_info["environment"]["kernel_features"] = {}
+
+    assert LXDProfileManager(lxc=rest_client, uid=1000).name != supported
+
+
+def test_ensure_creates_profile_once(fake_lxd, rest_client, tmp_path):
+    capabilities = LXDCapabilityCache(
+        lxc=rest_client, cache_path=tmp_path / "capabilities.json"
+    )
+    manager = LXDProfileManager(lxc=rest_client, uid=1000, capabilities=capabilities)
+
+    assert manager.ensure() == manager.name
+    assert manager.ensure() == manager.name
+
+    profile = fake_lxd.profiles[("default", manager.name)]
+    assert profile["config"] == {
+        "raw.idmap": "both 1000 0",
+        "security.syscalls.intercept.mknod": "true",
+    }
+    assert count_requests(fake_lxd, "POST", "/1.0/profiles") == 1
+
+    # An existing profile is reused without probing the host again.
+    LXDProfileManager(lxc=rest_client, uid=1000, capabilities=capabilities).ensure()
+    assert count_requests(fake_lxd, "POST", "/1.0/profiles") == 1
+    assert count_requests(fake_lxd, "PUT", "/1.0/profiles") == 1
+    assert count_requests(fake_lxd, "GET", "/1.0?") == 1
+
+
+def test_ensure_completes_profile(fake_lxd, rest_client):
+    manager = LXDProfileManager(lxc=rest_client, uid=1000)
+    rest_client.profile_create(profile=manager.name)
+
+    manager.ensure()
+
+    profile = fake_lxd.profiles[("default", manager.name)]
+    assert profile["config"]["raw.idmap"] == "both 1000 0"
+
+
+def test_ensure_profile_created_concurrently(fake_lxd, rest_client, monkeypatch):
+    manager = LXDProfileManager(lxc=rest_client, uid=1000)
+    rest_client.profile_create(profile=manager.name)
+    monkeypatch.setattr(rest_client, "profile_get", lambda **kwargs: None)
+
+    assert manager.ensure() == manager.name
+
+    profile = fake_lxd.profiles[("default", manager.name)]
+    assert profile["config"]["raw.idmap"] == "both 1000 0"
+
+
+def test_ensure_error(rest_client, monkeypatch):
+    def profile_get(**kwargs):
+        raise LXDAPIError(error="Internal error", error_code=500)
+
+    manager = LXDProfileManager(lxc=rest_client, uid=1000)
+    manager.name
+    monkeypatch.setattr(rest_client, "profile_get", profile_get)
+
+    with pytest.raises(LXDAPIError):
+        manager.ensure()
+
+
+def test_lxc_profile_create_exists(fake_lxc_path, monkeypatch):
+    def profile_create(**kwargs):
+        raise subprocess.CalledProcessError(
+            1, ["lxc"], output=b"Error: The profile already exists\n"
+        )
+
+    lxc = LXC(lxc_path=fake_lxc_path)
+    manager = LXDProfileManager(lxc=lxc, uid=1000, devices={})
+    manager._content = {"config": {}, "description": "", "devices": {}}
+    monkeypatch.setattr(lxc, "profile_get", lambda **kwargs: None)
+    monkeypatch.setattr(lxc, "profile_create", profile_create)
+
+    assert manager.ensure() == manager.name
+
+
+def test_launch_with_profile(fake_lxd, rest_client):
+    fake_lxd.add_image(aliases=["image"])
+    manager = LXDProfileManager(lxc=rest_client, uid=1000)
+    manager.ensure()
+    info_queries = count_requests(fake_lxd, "GET", "/1.0?")
+
+    instance = LXDInstance(name="test", lxc=rest_client)
+    instance.launch(image="image", image_remote="local", profile_manager=manager)
+
+    state = instance.get_state()
+    assert state["profiles"] == ["default", manager.name]
+    assert state["config"] == {}
+    assert count_requests(fake_lxd, "GET", "/1.0?") == info_queries
+
+
+def test_collect_garbage(fake_lxd, rest_client):
+    fake_lxd.add_image(aliases=["image"])
+    stale = LXDProfileManager(lxc=rest_client, uid=1001)
+    in_use = LXDProfileManager(lxc=rest_client, uid=1002)
+    current = LXDProfileManager(lxc=rest_client, uid=1000)
+    for manager in [stale, in_use, current]:
+        manager.ensure()
+
+    LXDInstance(name="test", lxc=rest_client).launch(
+        image="image", image_remote="local", profile_manager=in_use
+    )
+
+    assert current.collect_garbage() == [stale.name]
+    assert sorted(name for _, name in fake_lxd.profiles) == sorted(
+        ["default", in_use.name, current.name]
+    )
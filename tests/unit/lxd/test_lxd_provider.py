@@ -0,0 +1,75 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from craft_providers.images import BuilddImage, BuilddImageAlias
+from craft_providers.lxd import LXDAPIError, LXDProfileManager, LXDProvider
+
+
+@pytest.fixture()
+def provider(rest_client):
+    yield LXDProvider(
+        image=BuilddImage(alias=BuilddImageAlias.FOCAL),
+        instance_name="test",
+        lxc=rest_client,
+    )
+
+
+def test_find_image(fake_lxd, provider):
+    image = fake_lxd.add_image(aliases=["image"])
+
+    assert provider._find_image("image") == image["fingerprint"]
+    assert provider._find_image("missing") is None
+
+
+def test_find_image_deleted(fake_lxd, provider):
+    image = fake_lxd.add_image(aliases=["image"])
+    provider._find_image("image")
+
+    del fake_lxd.images[("default", image["fingerprint"])]
+
+    assert provider._find_image("image") is None
+
+
+def test_find_image_lists_images(fake_lxd, provider, monkeypatch):
+    def image_alias_get(**kwargs):
+        raise LXDAPIError(error="not implemented", error_code=501)
+
+    image = fake_lxd.add_image(aliases=["image"])
+    monkeypatch.setattr(provider.lxc, "image_alias_get", image_alias_get)
+
+    assert provider._find_image("image") == image["fingerprint"]
+    assert provider._find_image("missing") is None
+
+    del fake_lxd.images[("default", image["fingerprint"])]
+    assert provider._find_image("image") is None
+
+
+def test_teardown_collects_stale_profiles(fake_lxd, rest_client, provider):
+    stale = LXDProfileManager(lxc=rest_client, uid=1001)
+    stale.ensure()
+
+    provider.teardown()
+
+    assert ("default", stale.name) not in fake_lxd.profiles
+
+
+def test_teardown_profile_collection_error(provider, monkeypatch):
+    def profile_list(**kwargs):
+        raise LXDAPIError(error="forbidden", error_code=403)
+
+    monkeypatch.setattr(provider.lxc, "profile_list", profile_list)
+
+    provider.teardown()
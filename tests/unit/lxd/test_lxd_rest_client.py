@@ -0,0 +1,229 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pathlib
+
+import pytest
+
+from craft_providers.lxd import LXDAPIError, LXDInstance
+
+
+def test_list(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test-1")
+    fake_lxd.add_instance(name="test-10")
+    fake_lxd.add_instance(name="other")
+    fake_lxd.add_instance(name="test-1", project="other")
+
+    instances = rest_client.list(instance="test-1")
+
+    assert [i["name"] for i in instances] == ["test-1", "test-10"]
+    assert len(rest_client.list()) == 3
+
+
+def test_launch_local_image(fake_lxd, rest_client):
+    fake_lxd.add_image(aliases=["intermediate"])
+
+    rest_client.launch(
+        config_keys={"raw.idmap": "both 1000 0"},
+        image="intermediate",
+        image_remote="local",
+        instance="test",
+        ephemeral=True,
+    )
+
+    instance = fake_lxd.instances[("default", "test")]
+    assert instance["status"] == "Running"
+    assert instance["ephemeral"] is True
+    assert instance["config"] == {"raw.idmap": "both 1000 0"}
+
+
+def test_launch_failure(rest_client):
+    with pytest.raises(LXDAPIError) as exc_info:
+        rest_client.launch(
+            config_keys={},
+            image="missing",
+            image_remote="local",
+            instance="test",
+        )
+
+    assert exc_info.value.error == "image not found"
+
+
+def test_begin_launch(fake_lxd, rest_client):
+    fake_lxd.add_image(aliases=["intermediate"])
+
+    operation = rest_client.begin_launch(
+        config_keys={}, image="intermediate", image_remote="local", instance="test"
+    )
+    operation.wait(timeout=5)
+
+    assert operation.done() is True
+    assert operation.cancel() is False
+    assert fake_lxd.instances[("default", "test")]["status"] == "Running"
+
+
+def test_begin_image_copy_progress_and_cancel(fake_lxd, rest_client):
+    fake_lxd.hold_operations = True
+
+    operation = rest_client.begin_image_copy(
+        image="missing", image_remote="local", alias="test"
+    )
+    with pytest.raises(TimeoutError):
+        operation.wait(timeout=0.2)
+
+    assert operation.done() is False
+    assert operation.progress == "rootfs: 42%"
+    assert operation.cancel() is True
+
+    with pytest.raises(LXDAPIError) as exc_info:
+        operation.wait(timeout=5)
+
+    assert exc_info.value.error_code == 401
+    assert any(method == "DELETE" for method, _ in fake_lxd.requests)
+
+
+def test_start_stop(fake_lxd, rest_client):
+    instance = fake_lxd.add_instance(name="test", status="Stopped")
+
+    rest_client.start(instance="test")
+    assert instance["status"] == "Running"
+
+    rest_client.stop(instance="test")
+    assert instance["status"] == "Stopped"
+
+
+def test_delete(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+
+    with pytest.raises(LXDAPIError) as exc_info:
+        rest_client.delete(instance="test")
+
+    assert exc_info.value.error_code == 400
+
+    rest_client.delete(instance="test", force=True)
+
+    assert fake_lxd.instances == {}
+
+
+def test_delete_ephemeral(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test", ephemeral=True)
+
+    rest_client.delete(instance="test", force=True)
+
+    assert fake_lxd.instances == {}
+
+
+def test_config_device_add_disk(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+
+    rest_client.config_device_add_disk(
+        instance="test",
+        source=pathlib.Path("/home/user/project"),
+        destination=pathlib.Path("/root/project"),
+    )
+
+    assert rest_client.config_device_show(instance="test") == {
+        "_root_project": {
+            "type": "disk",
+            "source": "/home/user/project",
+            "path": "/root/project",
+        }
+    }
+
+
+def test_file_push_pull(fake_lxd, rest_client, tmp_path):
+    fake_lxd.add_instance(name="test")
+    source = tmp_path / "source.txt"
+    source.write_text("this is a test")
+
+    rest_client.file_push(
+        instance="test",
+        source=source,
+        destination=pathlib.Path("/tmp/foo"),
+        mode="0600",
+        uid="0",
+        gid="0",
+    )
+    rest_client.file_pull(
+        instance="test",
+        source=pathlib.Path("/tmp/foo"),
+        destination=tmp_path / "out" / "out.txt",
+    )
+
+    assert fake_lxd.files[("default", "test", "/tmp/foo")] == (
+        b"this is a test",
+        {"uid": "0", "gid": "0", "mode": "0600"},
+    )
+    assert (tmp_path / "out" / "out.txt").read_text() == "this is a test"
+
+
+def test_images(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test")
+
+    rest_client.publish(alias="published", instance="test", project="default")
+
+    images = rest_client.image_list()
+    assert [a["name"] for a in images[0]["aliases"]] == ["published"]
+    assert fake_lxd.instances[("default", "test")]["status"] == "Running"
+    assert rest_client.image_alias_get(alias="published") == {
+        "name": "published",
+        "target": images[0]["fingerprint"],
+    }
+
+    rest_client.image_delete(image="published")
+
+    assert rest_client.image_list() == []
+    assert rest_client.image_alias_get(alias="published") is None
+
+
+def test_info(rest_client):
+    info = rest_client.info()
+
+    assert info["environment"]["kernel_features"]["seccomp_listener"] == "true"
+
+
+def test_profiles(rest_client):
+    config = rest_client.profile_show(profile="default")
+    config["config"] = {"security.nesting": "true"}
+
+    rest_client.profile_edit(profile="default", config=config)
+
+    assert rest_client.profile_show(profile="default")["config"] == {
+        "security.nesting": "true"
+    }
+
+
+def test_projects(rest_client):
+    rest_client.project_create(project="test-project")
+    assert rest_client.project_list() == ["default", "test-project"]
+
+    rest_client.project_delete(project="test-project")
+    assert rest_client.project_list() == ["default"]
+
+
+def test_lxd_instance(fake_lxd, rest_client):
+    fake_lxd.add_instance(name="test-1")
+    fake_lxd.add_instance(name="test", status="Stopped")
+    instance = LXDInstance(name="test", lxc=rest_client)
+
+    assert instance.exists() is True
+    assert instance.is_running() is False
+
+    instance.start()
+    instance.mount(source=pathlib.Path("/src"), destination=pathlib.Path("/dst"))
+
+    assert instance.is_running() is True
+    assert instance.is_mounted(
+        source=pathlib.Path("/src"), destination=pathlib.Path("/dst")
+    )
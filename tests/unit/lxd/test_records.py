@@ -0,0 +1,81 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pathlib
+
+import pytest
+
+from craft_providers.lxd import DiskDevice, ImageRecord, InstanceState
+
+
+def test_instance_state():
+    data = {
+        "name": "test",
+        "status": "Running",
+        "ephemeral": True,
+        "config": {"raw.idmap": "both 1000 0"},
+        "profiles": ["default"],
+    }
+    state = InstanceState(data)
+
+    assert state.name == "test"
+    assert state.is_running is True
+    assert state.ephemeral is True
+    assert state.config == {"raw.idmap": "both 1000 0"}
+    assert state.profiles == ("default",)
+    assert state.to_dict() is data
+    assert state == InstanceState(dict(data))
+
+
+def test_instance_state_defaults():
+    state = InstanceState({"name": "test"})
+
+    assert state.is_running is False
+    assert state.ephemeral is False
+    assert state.config == {}
+    assert state.profiles == ()
+
+
+def test_records_are_slotted():
+    state = InstanceState({"name": "test"})
+
+    with pytest.raises(AttributeError):
+        state.extra = True  # type: ignore # pylint: disable=assigning-non-slot
+
+
+def test_image_record_aliases():
+    image = ImageRecord(
+        {"fingerprint": "abc", "aliases": [{"name": "foo"}, {"name": "bar"}]}
+    )
+
+    assert image.fingerprint == "abc"
+    assert image.aliases == ("foo", "bar")
+    assert image.has_alias("bar") is True
+    assert image.has_alias("baz") is False
+
+
+def test_image_record_without_aliases():
+    assert ImageRecord({"fingerprint": "abc", "aliases": None}).aliases == ()
+
+
+def test_disk_device_is_mount_of():
+    disk = DiskDevice("disk-/root/project", {"source": "/home/u/p", "path": "/root/p"})
+
+    assert disk.is_mount_of(
+        source=pathlib.Path("/home/u/p"), destination=pathlib.Path("/root/p")
+    )
+    assert not disk.is_mount_of(
+        source=pathlib.Path("/home/u/p"), destination=pathlib.Path("/root/q")
+    )
+    assert disk != DiskDevice("other", disk.to_dict())
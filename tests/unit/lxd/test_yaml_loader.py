@@ -0,0 +1,42 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import yaml
+
+from craft_providers.lxd.yaml_loader import _load_yaml, _YamlLoader
+
+
+def test_timestamps_are_not_resolved():
+    data = b"created_at: 2020-12-08T11:23:02.123456789-05:00\nephemeral: false\n"
+
+    assert _load_yaml(data) == {
+        "created_at": "2020-12-08T11:23:02.123456789-05:00",
+        "ephemeral": False,
+    }
+
+
+def test_timestamp_resolver_dropped_once():
+    resolvers = _YamlLoader.yaml_implicit_resolvers
+
+    _load_yaml(b"a: 1")
+
+    assert _YamlLoader.yaml_implicit_resolvers is resolvers
+    assert yaml.SafeLoader.yaml_implicit_resolvers != resolvers
+
+
+def test_libyaml_preferred():
+    if hasattr(yaml, "CSafeLoader"):
+        assert issubclass(_YamlLoader, yaml.CSafeLoader)
+    else:
+        assert issubclass(_YamlLoader, yaml.SafeLoader)
@@ -0,0 +1,376 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+from typing import List
+
+import pytest
+
+from craft_providers import Executor, ShardedSyncError
+from craft_providers.util.manifest import scan_directory
+from craft_providers.util.manifest_cache import ManifestCache
+
+
+class LocalExecutor(Executor):
+    """Executor running commands on the host, to test base implementations."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.commands: List[List[str]] = []
+
+    def create_file(self, **kwargs):
+        raise NotImplementedError
+
+    def execute_popen(self, command, **kwargs):
+        self.commands.append(command)
+        return subprocess.Popen(command, **kwargs)
+
+    def execute_run(self, command, check=True, **kwargs):
+        self.commands.append(command)
+        return subprocess.run(command, check=check, **kwargs)
+
+    def sync_from(self, *, source, destination):
+        raise NotImplementedError
+
+    def sync_to(self, *, source, destination):
+        raise NotImplementedError
+
+
+@pytest.fixture()
+def executor():
+    yield LocalExecutor()
+
+
+@pytest.mark.parametrize("stop_on_error", [True, False])
+def test_execute_batch(executor, stop_on_error):
+    results = executor.execute_batch(
+        [
+            ["echo", "it's"],
+            ["sh", "-c", "printf 'no newline'; echo oops >&2; exit 2"],
+            ["echo", "after"],
+        ],
+        stop_on_error=stop_on_error,
+    )
+
+    assert [r.returncode for r in results[:2]] == [0, 2]
+    assert results[0].args == ["echo", "it's"]
+    assert results[0].stdout == b"it's\n"
+    assert results[1].stdout == b"no newline"
+    assert results[1].stderr == b"oops\n"
+    if stop_on_error:
+        assert len(results) == 2
+    else:
+        assert results[2].stdout == b"after\n"
+    assert len(executor.commands) == 1
+
+
+def test_execute_batch_check(executor):
+
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        executor.execute_batch([["true"], ["false"]], check=True)
+
+    assert exc_info.value.cmd == ["false"]
+
+
+def test_stat_many(executor, tmp_path):
+    (tmp_path / "file").write_bytes(b"12345")
+    (tmp_path / "file").chmod(0o640)
+    (tmp_path / "link").symlink_to(tmp_path / "file")
+    (tmp_path / "-dir").mkdir()
+
+    file_stat, link_stat, dir_stat, missing = executor.stat_many(
+        [tmp_path / "file", tmp_path / "link", tmp_path / "-dir", tmp_path / "missing"]
+    )
+
+    assert file_stat.is_file and not file_stat.is_dir
+    assert file_stat.size == 5
+    assert file_stat.permissions == 0o640
+    assert file_stat.mtime == int((tmp_path / "file").stat().st_mtime)
+    assert file_stat.uid == (tmp_path / "file").stat().st_uid
+    assert link_stat.path == tmp_path / "link"
+    assert link_stat.is_file
+    assert dir_stat.is_dir
+    assert missing is None
+    assert len(executor.commands) == 1
+
+    assert executor.is_target_file(tmp_path / "file")
+    assert not executor.is_target_file(tmp_path / "missing")
+    assert executor.is_target_directory(tmp_path / "-dir")
+
+
+def test_execute_stream(executor):
+    # Enough output on both streams to fill their pipes.
+    script = "seq 20000; seq 20000 >&2; printf 'no newline'"
+
+    with executor.execute_stream(
+        ["sh", "-c", script], max_buffered_lines=10
+    ) as streamed:
+        events = list(streamed)
+
+    stdout = [line for name, line in events if name == "stdout"]
+    stderr = [line for name, line in events if name == "stderr"]
+    assert len(stdout) == 20001
+    assert stdout[-1] == b"no newline"
+    assert stderr == [f"{i}\n".encode() for i in range(1, 20001)]
+    assert streamed.returncode == 0
+
+
+def test_execute_stream_check(executor):
+
+    with pytest.raises(subprocess.CalledProcessError):
+        list(executor.execute_stream(["sh", "-c", "echo out; exit 3"]))
+
+    streamed = executor.execute_stream(["sh", "-c", "exit 3"], check=False)
+    assert list(streamed) == []
+    assert streamed.returncode == 3
+
+
+def test_execute_stream_long_line(executor):
+
+    with executor.execute_stream(
+        ["sh", "-c", "head -c 250000 /dev/zero; echo"], max_line_length=100000
+    ) as streamed:
+        lines = [line for _, line in streamed]
+
+    assert [len(line) for line in lines] == [100000, 100000, 50001]
+
+
+def test_execute_stream_close(executor):
+
+    with executor.execute_stream(["yes"], max_buffered_lines=10) as streamed:
+        for _, line in streamed:
+            assert line == b"y\n"
+            break
+
+    assert streamed.returncode is not None
+
+
+def tree(root):
+    return {
+        path: (entry.type, entry.mode, entry.target)
+        + (((root / path).read_bytes(),) if entry.type == "f" else ())
+        for path, entry in scan_directory(root).items()
+    }
+
+
+def test_incremental_directory_sync_to(executor, tmp_path):
+    source = tmp_path / "source"
+    destination = tmp_path / "destination"
+    (source / "dir" / "sub").mkdir(parents=True)
+    (source / "dir" / "sub" / "file").write_text("file")
+    (source / "dir" / "gone").write_text("gone")
+    (source / "changes").write_text("before")
+    (source / "becomes-dir").write_text("file")
+    (source / "link").symlink_to("changes")
+    (source / "-dashed").write_text("dashed")
+
+    result = executor.incremental_directory_sync_to(
+        source=source, destination=destination
+    )
+
+    assert len(result.sent) == 8
+    assert result.deleted == []
+    assert tree(destination) == tree(source)
+
+    result = executor.incremental_directory_sync_to(
+        source=source, destination=destination
+    )
+
+    assert result.sent == []
+
+    (source / "dir" / "gone").unlink()
+    (source / "changes").write_text("after!")
+    (source / "becomes-dir").unlink()
+    (source / "becomes-dir").mkdir()
+    (source / "becomes-dir" / "new").write_text("new")
+    (source / "link").unlink()
+    (source / "link").symlink_to("dir")
+    (destination / "extra").mkdir()
+    (destination / "extra" / "file").write_text("extra")
+
+    result = executor.incremental_directory_sync_to(
+        source=source, destination=destination
+    )
+
+    assert result.sent == ["becomes-dir", "becomes-dir/new", "changes", "link"]
+    assert result.deleted == ["becomes-dir", "dir/gone", "extra"]
+    assert tree(destination) == tree(source)
+
+
+def test_incremental_directory_sync_to_checksum(executor, tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "same").write_text("same")
+    (source / "differs").write_text("before")
+    executor.incremental_directory_sync_to(source=source, destination=tmp_path / "d")
+
+    os.utime(source / "same", (0, 0))
+    (source / "differs").write_text("after!")
+    os.utime(source / "differs", (0, 0))
+
+    result = executor.incremental_directory_sync_to(
+        source=source, destination=tmp_path / "d", checksum=True
+    )
+
+    assert result.sent == ["differs"]
+    assert (tmp_path / "d" / "differs").read_text() == "after!"
+
+
+def test_incremental_directory_sync_to_manifest_cache(executor, tmp_path):
+    cache = ManifestCache(path=tmp_path / "cache.sqlite3")
+    source = tmp_path / "source"
+    destination = tmp_path / "destination"
+    source.mkdir()
+    (source / "same").write_text("same")
+    (source / "touched").write_text("touched")
+    kwargs = dict(
+        source=source,
+        destination=destination,
+        checksum=True,
+        manifest_cache=cache,
+        manifest_cache_key="test",
+    )
+    executor.incremental_directory_sync_to(**kwargs)
+    executor.commands.clear()
+
+    # Unseen, the cached manifest is trusted, with its digests.
+    (destination / "same").unlink()
+    os.utime(source / "touched", ns=(0, 0))
+
+    result = executor.incremental_directory_sync_to(**kwargs)
+
+    assert result.sent == []
+    assert executor.commands == []
+
+    cache.invalidate(key="test", destination=destination)
+    result = executor.incremental_directory_sync_to(**kwargs)
+
+    assert result.sent == ["same"]
+    assert tree(destination) == tree(source)
+
+
+def test_incremental_directory_sync_to_unchanged(executor, tmp_path, monkeypatch):
+    cache = ManifestCache(path=tmp_path / "cache.sqlite3")
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "file").write_text("file")
+    kwargs = dict(
+        source=source,
+        destination=tmp_path / "destination",
+        manifest_cache=cache,
+        manifest_cache_key="test",
+    )
+    executor.incremental_directory_sync_to(**kwargs)
+    saves = []
+    monkeypatch.setattr(cache, "save", lambda **kwargs: saves.append(kwargs))
+
+    executor.incremental_directory_sync_to(**kwargs)
+
+    assert saves == []
+
+
+@pytest.mark.parametrize("compression", ["none", "auto", "gzip", "zstd:5"])
+def test_naive_directory_sync_compression(executor, tmp_path, compression):
+    source = tmp_path / "source"
+    (source / "dir").mkdir(parents=True)
+    (source / "dir" / "file").write_text("text " * 1000)
+
+    executor.naive_directory_sync_to(
+        source=source, destination=tmp_path / "target", compression=compression
+    )
+    executor.naive_directory_sync_from(
+        source=tmp_path / "target",
+        destination=tmp_path / "back",
+        compression=compression,
+    )
+
+    assert tree(tmp_path / "back") == tree(source)
+
+
+def sharded_tree(root):
+    (root / "dir" / "sub").mkdir(parents=True)
+    (root / "dir" / "link").symlink_to("sub")
+    (root / "empty").mkdir()
+    for index in range(10):
+        (root / "dir" / "sub" / f"file{index}").write_bytes(b"x" * index)
+    (root / "big").write_bytes(b"x" * 100)
+
+
+def test_sharded_directory_sync_to(executor, tmp_path):
+    source = tmp_path / "source"
+    sharded_tree(source)
+    (tmp_path / "destination").mkdir()
+    (tmp_path / "destination" / "stale").write_text("stale")
+
+    executor.sharded_directory_sync_to(
+        source=source,
+        destination=tmp_path / "destination",
+        parallelism=3,
+        compression="gzip",
+    )
+
+    assert tree(tmp_path / "destination") == tree(source)
+
+
+def test_sharded_directory_sync_to_failure(executor, tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    sharded_tree(source)
+    send_paths = executor._send_paths
+
+    def fail_big(*, paths, **kwargs):
+        if "big" in paths:
+            raise subprocess.CalledProcessError(2, ["tar"])
+        send_paths(paths=paths, **kwargs)
+
+    monkeypatch.setattr(executor, "_send_paths", fail_big)
+
+    with pytest.raises(ShardedSyncError) as exc_info:
+        executor.sharded_directory_sync_to(
+            source=source, destination=tmp_path / "destination", parallelism=2
+        )
+
+    (index,) = exc_info.value.failures
+    assert exc_info.value.shards[index] == ["big"]
+    assert str(exc_info.value) == f"1 of 2 shards failed: shard {index} (exit code 2)"
+    assert (tmp_path / "destination" / "dir" / "sub" / "file9").exists()
+
+
+def test_naive_directory_sync_to_failure(executor, tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "file").write_text("file")
+    # A non-empty directory which tar cannot replace with the file.
+    (tmp_path / "destination" / "file" / "sub").mkdir(parents=True)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        executor.naive_directory_sync_to(
+            source=source, destination=tmp_path / "destination", delete=False
+        )
+
+
+def test_naive_directory_sync_from_missing(executor, tmp_path):
+
+    with pytest.raises(subprocess.CalledProcessError):
+        executor.naive_directory_sync_from(
+            source=tmp_path / "missing", destination=tmp_path / "destination"
+        )
+
+
+def test_tar_path_is_lazy(monkeypatch):
+    monkeypatch.setenv("PATH", "")
+    executor = LocalExecutor()
+
+    with pytest.raises(RuntimeError):
+        executor.tar_path
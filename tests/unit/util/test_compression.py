@@ -0,0 +1,48 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from craft_providers.util.compression import Compressor, choose_compression
+
+
+@pytest.mark.parametrize(
+    "compression,remote,ratio,available,expected",
+    [
+        ("none", True, 0.1, ["zstd"], None),
+        ("gzip:9", False, 1.0, ["gzip"], Compressor("gzip", 9)),
+        ("zstd", False, 1.0, ["gzip"], None),
+        ("auto", False, 0.1, ["zstd"], None),
+        ("auto", True, 0.1, ["zstd", "gzip"], Compressor("zstd", 3)),
+        ("auto", True, 0.1, ["gzip"], Compressor("gzip", 1)),
+        ("auto", True, 0.9, ["zstd", "gzip"], None),
+        ("auto", True, None, ["zstd", "gzip"], Compressor("zstd", 3)),
+        ("auto", True, None, ["gzip"], None),
+    ],
+)
+def test_choose_compression(compression, remote, ratio, available, expected):
+    assert (
+        choose_compression(
+            compression,
+            available=lambda: available,
+            remote=remote,
+            ratio=None if ratio is None else lambda: ratio,
+        )
+        == expected
+    )
+
+
+def test_choose_compression_invalid():
+    with pytest.raises(ValueError):
+        choose_compression("lz4", available=list, remote=True)
@@ -0,0 +1,99 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pathlib
+import sqlite3
+
+import pytest
+
+from craft_providers.util.manifest import ManifestEntry
+from craft_providers.util.manifest_cache import ManifestCache
+
+ENTRY = ManifestEntry("f", 1, 0, 0o644, "", None, 1)
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    yield ManifestCache(path=tmp_path / "cache.sqlite3")
+
+
+def test_save_load(cache):
+    cache.save(key="k", destination=pathlib.Path("/a"), manifest={"f": ENTRY})
+
+    assert cache.load(key="k", destination=pathlib.Path("/a")) == {"f": ENTRY}
+    assert cache.load(key="k", destination=pathlib.Path("/b")) is None
+    assert cache.load(key="other", destination=pathlib.Path("/a")) is None
+
+
+def test_default_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    assert ManifestCache().path == tmp_path / "craft-providers/sync-manifests.sqlite3"
+
+
+def test_invalidate_related(cache):
+    destinations = ["/", "/a", "/a/b", "/a/b/c", "/ab", "/x"]
+    for destination in destinations:
+        cache.save(key="k", destination=pathlib.Path(destination), manifest={})
+    cache.save(key="other", destination=pathlib.Path("/a/b"), manifest={})
+
+    cache.invalidate(key="k", destination=pathlib.Path("/a/b"))
+
+    assert [
+        d
+        for d in destinations
+        if cache.load(key="k", destination=pathlib.Path(d)) is not None
+    ] == ["/ab", "/x"]
+    assert cache.load(key="other", destination=pathlib.Path("/a/b")) == {}
+
+
+def test_invalidate_all(cache):
+    cache.save(key="k", destination=pathlib.Path("/a"), manifest={})
+    cache.save(key="k", destination=pathlib.Path("/b"), manifest={})
+
+    cache.invalidate(key="k")
+
+    assert cache.load(key="k", destination=pathlib.Path("/a")) is None
+    assert cache.load(key="k", destination=pathlib.Path("/b")) is None
+
+
+def test_invalidate_prefix(cache):
+    for key in ["k:1", "k:2", "kk", "other"]:
+        cache.save(key=key, destination=pathlib.Path("/a"), manifest={})
+        cache.save(key=key, destination=pathlib.Path("/b"), manifest={})
+
+    cache.invalidate(key="k:", destination=pathlib.Path("/a"), prefix=True)
+
+    assert [
+        (key, d)
+        for key in ["k:1", "k:2", "kk", "other"]
+        for d in ["/a", "/b"]
+        if cache.load(key=key, destination=pathlib.Path(d)) is not None
+    ] == [
+        ("k:1", "/b"),
+        ("k:2", "/b"),
+        ("kk", "/a"),
+        ("kk", "/b"),
+        ("other", "/a"),
+        ("other", "/b"),
+    ]
+
+
+def test_invalidate_error(tmp_path):
+    (tmp_path / "cache.sqlite3").mkdir()
+    cache = ManifestCache(path=tmp_path / "cache.sqlite3")
+
+    assert cache.load(key="k", destination=pathlib.Path("/a")) is None
+    with pytest.raises(sqlite3.Error):
+        cache.invalidate(key="k", destination=pathlib.Path("/a"))
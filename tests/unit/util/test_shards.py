@@ -0,0 +1,97 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import pytest
+
+from craft_providers.util import shards
+from craft_providers.util.shards import (
+    choose_parallelism,
+    default_parallelism,
+    plan_shards,
+)
+
+
+@pytest.fixture()
+def big_tree(tmp_path):
+    """Tree of sparse 64 MiB files, a directory each."""
+    for index in range(16):
+        directory = tmp_path / f"dir{index:02d}"
+        directory.mkdir()
+        with open(directory / "file", "wb") as stream:
+            stream.truncate(64 * 1024**2)
+
+    yield tmp_path
+
+
+def test_choose_parallelism(big_tree, monkeypatch):
+    lstat = os.lstat
+    calls = []
+
+    def counting_lstat(path):
+        calls.append(path)
+        return lstat(path)
+
+    monkeypatch.setattr(os, "lstat", counting_lstat)
+
+    assert choose_parallelism(big_tree, cpu_count=4) == 4
+    # Stopped once four shards' worth was seen.
+    assert len([c for c in calls if c.endswith("file")]) == 4
+
+
+@pytest.mark.parametrize("cpu_count,expected", [(1, 1), (64, 8)])
+def test_choose_parallelism_limits(big_tree, cpu_count, expected):
+    assert choose_parallelism(big_tree, cpu_count=cpu_count) == expected
+
+
+def test_choose_parallelism_small(tmp_path):
+    (tmp_path / "file").write_bytes(b"x" * 1024)
+
+    assert choose_parallelism(tmp_path, cpu_count=8) == 1
+
+
+def test_usable_cpus_without_affinity(monkeypatch):
+    monkeypatch.delattr(os, "sched_getaffinity")
+    monkeypatch.setattr(os, "cpu_count", lambda: 3)
+
+    assert shards._usable_cpus() == 3
+
+
+def test_plan_shards():
+    files = [("a", 100), ("b", 60), ("c", 50), ("d", 40), ("e", 0)]
+
+    shards = plan_shards(files, 2)
+
+    assert sorted(shards) == [["a", "d"], ["b", "c", "e"]]
+    assert plan_shards(files[:1], 3) == [["a"], [], []]
+
+
+@pytest.mark.parametrize(
+    "total_size,file_count,cpu_count,expected",
+    [
+        (1024, 1000, 8, 1),
+        (1024**3, 1000, 4, 4),
+        (1024**3, 1000, 64, 8),
+        (1024**3, 2, 8, 2),
+        (64 * 1024**2, 1000, 8, 2),
+    ],
+)
+def test_default_parallelism(total_size, file_count, cpu_count, expected):
+    assert (
+        default_parallelism(
+            total_size=total_size, file_count=file_count, cpu_count=cpu_count
+        )
+        == expected
+    )
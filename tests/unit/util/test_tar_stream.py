@@ -0,0 +1,145 @@
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import subprocess
+import tarfile
+
+import pytest
+
+from craft_providers.util.manifest import scan_directory
+from craft_providers.util.tar_stream import read_archive, write_archive
+
+
+def tree(root):
+    return {
+        path: (entry.type, entry.mode, entry.target)
+        + (((root / path).read_bytes(),) if entry.type == "f" else ())
+        for path, entry in scan_directory(root).items()
+    }
+
+
+def test_tar_stream(tmp_path):
+    source = tmp_path / "source"
+    long_dir = source / ("d" * 120)
+    long_dir.mkdir(parents=True)
+    (long_dir / "ünïcode").write_bytes(b"x" * 1000)
+    (source / "hard").write_text("hard")
+    os.link(source / "hard", source / "hard2")
+    (source / "link").symlink_to("hard")
+    (source / "skipped").write_text("skipped")
+    (source / "hard").chmod(0o751)
+    os.utime(source / "hard", ns=(0, 1_600_000_000_123_456_789))
+
+    with open(tmp_path / "archive.tar", "wb") as stream:
+        stats = write_archive(
+            stream,
+            source,
+            tar_filter=lambda info: None if info.name == "skipped" else info,
+        )
+
+    assert stats == (6, 1004)
+
+    with open(tmp_path / "archive.tar", "rb") as stream:
+        stats = read_archive(stream, tmp_path / "destination")
+
+    assert stats == (6, 1004)
+    (source / "skipped").unlink()
+    assert tree(tmp_path / "destination") == tree(source)
+    assert os.stat(tmp_path / "destination" / "hard").st_mtime_ns == (
+        1_600_000_000_123_456_789
+    )
+    assert (tmp_path / "destination" / "hard").stat().st_mode & 0o777 == 0o751
+    assert os.path.samefile(
+        tmp_path / "destination" / "hard", tmp_path / "destination" / "hard2"
+    )
+
+    # Read by GNU tar too.
+    destination = tmp_path / "gnu"
+    destination.mkdir()
+    subprocess.run(
+        ["tar", "xpf", str(tmp_path / "archive.tar"), "-C", str(destination)],
+        check=True,
+    )
+    assert tree(destination) == tree(source)
+    assert os.stat(destination / "hard").st_mtime_ns == 1_600_000_000_123_456_789
+
+
+def archive(*members):
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w") as tar:
+        for name, kind, linkname in members:
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            info.linkname = linkname
+            info.mode = 0o777 if kind in (tarfile.DIRTYPE, tarfile.SYMTYPE) else 0o4775
+            tar.addfile(info, io.BytesIO())
+    stream.seek(0)
+    return stream
+
+
+@pytest.mark.parametrize(
+    "members",
+    [
+        [("/tmp/file", tarfile.REGTYPE, "")],
+        [("../file", tarfile.REGTYPE, "")],
+        [("dir/../../file", tarfile.REGTYPE, "")],
+        [("link", tarfile.SYMTYPE, "/etc")],
+        [("dir/link", tarfile.SYMTYPE, "../..")],
+        [("hard", tarfile.LNKTYPE, "../file")],
+        # Written through a link, which points outside once the parent is
+        # replaced by another link.
+        [
+            ("dir", tarfile.SYMTYPE, "."),
+            ("dir/link", tarfile.SYMTYPE, ".."),
+        ],
+    ],
+)
+@pytest.mark.parametrize("has_filters", [True, False])
+def test_read_archive_unsafe(tmp_path, monkeypatch, members, has_filters):
+    if not has_filters:
+        # As older Pythons, which extract members as they are.
+        monkeypatch.delattr(tarfile, "fully_trusted_filter", raising=False)
+        monkeypatch.setattr(
+            tarfile.TarFile,
+            "extraction_filter",
+            staticmethod(lambda member, path: member),
+            raising=False,
+        )
+    destination = tmp_path / "destination"
+
+    with pytest.raises(tarfile.TarError):
+        read_archive(archive(*members), destination)
+
+    assert set(os.listdir(tmp_path)) <= {"destination"}
+
+
+def test_read_archive_keeps_modes(tmp_path):
+    destination = tmp_path / "destination"
+
+    read_archive(
+        archive(
+            ("file", tarfile.REGTYPE, ""),
+            ("dir", tarfile.DIRTYPE, ""),
+            ("dir/link", tarfile.SYMTYPE, "../file"),
+            ("dir/hard", tarfile.LNKTYPE, "file"),
+        ),
+        destination,
+    )
+
+    assert (destination / "file").stat().st_mode & 0o7777 == 0o4775
+    assert (destination / "dir").stat().st_mode & 0o7777 == 0o777
+    assert (destination / "dir" / "link").resolve() == destination / "file"
+    assert os.path.samefile(destination / "file", destination / "dir" / "hard")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare parse paths for lxc output.
+
+Parses `lxc list` output using:
+
+- the previous loader (pure-Python SafeLoader, resolvers rebuilt per call)
+- the current yaml loader (libyaml if available, resolvers built once)
+- json (as requested by LXC with --format=json)
+
+Recorded outputs can be provided, e.g.:
+
+    lxc list --format=yaml > list.yaml
+    lxc list --format=json > list.json
+    tools/benchmark-lxc-parse.py --yaml list.yaml --json list.json
+
+Otherwise output for a synthetic set of instances is generated.
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+
+from craft_providers.lxd.yaml_loader import _load_yaml  # noqa: E402
+
+
+class _PreviousYamlLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
+    pass
+
+
+def previous_load_yaml(data):
+    _PreviousYamlLoader.yaml_implicit_resolvers = {
+        k: [r for r in v if r[0] != "tag:yaml.org,2002:timestamp"]
+        for k, v in yaml.SafeLoader.yaml_implicit_resolvers.items()
+    }
+    return yaml.load(data, Loader=_PreviousYamlLoader)
+
+
+def synthesize_instances(count):
+    instances = []
+    for i in range(count):
+        name = f"snapcraft-project-{i:05d}"
+        config = {
+            f"volatile.eth0.{k}": f"value-{i}-{k}"
+            for k in ["hwaddr", "host_name", "last_state.created"]
+        }
+        config.update(
+            {
+                "image.architecture": "amd64",
+                "image.description": "ubuntu 20.04 LTS amd64 (release) (20201201)",
+                "image.os": "ubuntu",
+                "image.release": "focal",
+                "raw.idmap": "both 1000 0",
+                "security.syscalls.intercept.mknod": "true",
+            }
+        )
+        instances.append(
+            {
+                "architecture": "x86_64",
+                "config": config,
+                "devices": {},
+                "ephemeral": False,
+                "profiles": ["default"],
+                "stateful": False,
+                "description": "",
+                "created_at": "2020-12-08T11:23:02.123456789-05:00",
+                "expanded_config": config,
+                "expanded_devices": {
+                    "eth0": {"name": "eth0", "network": "lxdbr0", "type": "nic"},
+                    "root": {"path": "/", "pool": "default", "type": "disk"},
+                },
+                "name": name,
+                "status": "Running",
+                "status_code": 103,
+                "last_used_at": "2020-12-08T11:23:05.123456789-05:00",
+                "location": "none",
+                "type": "container",
+                "state": {
+                    "status": "Running",
+                    "status_code": 103,
+                    "disk": {},
+                    "memory": {"usage": 123456789, "usage_peak": 0},
+                    "network": {
+                        "eth0": {
+                            "addresses": [
+                                {
+                                    "family": "inet",
+                                    "address": f"10.0.{i // 250}.{i % 250}",
+                                    "netmask": "24",
+                                    "scope": "global",
+                                }
+                            ],
+                            "counters": {"bytes_received": i, "bytes_sent": i},
+                            "hwaddr": "00:16:3e:00:00:00",
+                            "mtu": 1500,
+                            "state": "up",
+                            "type": "broadcast",
+                        }
+                    },
+                    "pid": 1000 + i,
+                    "processes": 42,
+                },
+                "snapshots": None,
+                "backups": None,
+            }
+        )
+
+    return instances
+
+
+def benchmark(label, func, data, repeat):
+    timer = timeit.Timer(lambda: func(data))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    print(f"{label:<24} {best * 1000:10.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--yaml", type=pathlib.Path, help="recorded yaml output")
+    parser.add_argument("--json", type=pathlib.Path, help="recorded json output")
+    parser.add_argument(
+        "--instances", type=int, default=1000, help="synthetic instance count"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.yaml or args.json:
+        yaml_data = args.yaml.read_bytes() if args.yaml else None
+        json_data = args.json.read_bytes() if args.json else None
+    else:
+        instances = synthesize_instances(args.instances)
+        dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+        yaml_data = yaml.dump(instances, Dumper=dumper).encode()
+        json_data = json.dumps(instances).encode()
+
+    if yaml_data is not None:
+        print(f"yaml: {len(yaml_data)} bytes")
+        previous = benchmark("previous yaml loader", previous_load_yaml, yaml_data, 3)
+        current = benchmark("current yaml loader", _load_yaml, yaml_data, args.repeat)
+        print(f"{'speedup':<24} {previous / current:10.1f}x")
+
+    if json_data is not None:
+        print(f"json: {len(json_data)} bytes")
+        current = benchmark("json", json.loads, json_data, args.repeat)
+        if yaml_data is not None:
+            print(f"{'speedup':<24} {previous / current:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
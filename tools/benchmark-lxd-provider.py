@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2020 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark LXDProvider.setup() against a recorded lxc trace.
+
+Record a trace of a provider setup against a real LXD:
+
+    tools/benchmark-lxd-provider.py record --trace setup.trace
+
+Then replay it, on any Linux host, without LXD:
+
+    tools/benchmark-lxd-provider.py replay --trace setup.trace --scale 0
+
+With --scale 0 recorded latencies are not replayed, measuring only the
+library's own overhead (parsing, process spawns, number of calls).  With
+--scale 1 recorded latencies are replayed as-is.
+
+Record with the same options (instance name, project, image) as replayed.
+"""
+
+import argparse
+import logging
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+
+from craft_providers.images import BuilddImage, BuilddImageAlias  # noqa: E402
+from craft_providers.lxd import (  # noqa: E402
+    LXC,
+    LXD,
+    LXCMetrics,
+    LXCTraceRecorder,
+    LXDProvider,
+    write_replay_stub,
+)
+
+
+def run_setup(args, *, lxc, lxd):
+    provider = LXDProvider(
+        image=BuilddImage(alias=BuilddImageAlias.FOCAL),
+        instance_name=args.instance,
+        lxc=lxc,
+        lxd=lxd,
+        project=args.project,
+    )
+
+    start = time.monotonic()
+    provider.setup()
+    provider.teardown(clean=args.clean)
+    return time.monotonic() - start
+
+
+def record(args):
+    if args.trace.exists():
+        args.trace.unlink()
+
+    metrics = LXCMetrics()
+    lxc = LXC(metrics=metrics, trace=LXCTraceRecorder(args.trace))
+
+    elapsed = run_setup(args, lxc=lxc, lxd=LXD())
+    print(f"recorded setup in {elapsed:.2f}s to {args.trace}")
+    print(metrics.report())
+
+
+def replay(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lxd_path = pathlib.Path(tmp_dir, "lxd")
+        lxd_path.write_text("#!/bin/sh\necho 4.0.4\n")
+        lxd_path.chmod(0o755)
+
+        results = []
+        for _ in range(args.repeat):
+            lxc_path = write_replay_stub(
+                trace_path=args.trace,
+                stub_path=pathlib.Path(tmp_dir, "lxc"),
+                scale=args.scale,
+            )
+            metrics = LXCMetrics()
+            lxc = LXC(lxc_path=lxc_path, metrics=metrics)
+
+            results.append(run_setup(args, lxc=lxc, lxd=LXD(lxd_path=lxd_path)))
+
+    print(f"setup: best {min(results):.3f}s, worst {max(results):.3f}s")
+    print(metrics.report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--trace", type=pathlib.Path, required=True)
+    parser.add_argument("--instance", default="craft-providers-benchmark")
+    parser.add_argument("--project", default="default")
+    parser.add_argument("--clean", action="store_true", help="delete instance")
+    parser.add_argument("--scale", type=float, default=0.0, help="latency scale")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.mode == "record":
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()